@@ -7,18 +7,46 @@ pragma solidity >=0.6.12 <0.7.0;
  */
 
 import "./lib/openzeppelin/contracts/access/Ownable.sol";
+import "./lib/openzeppelin/contracts/cryptography/MerkleProof.sol";
+import "./lib/openzeppelin/contracts/math/SafeMath.sol";
 import "./lib/openzeppelin/contracts/token/ERC777/ERC777.sol";
 
 contract ClickToken is Ownable, ERC777 {
+    using SafeMath for uint256;
+
     event SignerApproved(address signer, uint256 allowance);
     event SignerRemoved(address signer);
+    event EpochPublished(uint256 epoch, bytes32 root, uint256 total);
+
+    // Amounts added up by account, for the first length accounts
+    struct Totals {
+        address[] accounts;
+        uint256[] amounts;
+        uint256 length;
+    }
 
     // The accounts that have the right sign claims
     mapping(address => uint256) public signers;
 
-    // Previous claims
+    // Previous claims, by hashClaim() whichever way they were signed
     mapping(bytes32 => bool) public claims;
 
+    // EIP-712 typed claims, see hashClaimPacked()
+    bytes32 public constant DOMAIN_TYPEHASH = keccak256(
+        "EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)"
+    );
+    bytes32 public constant CLAIM_TYPEHASH = keccak256(
+        "Claim(address recipient,bytes32 uid,uint256 amount)"
+    );
+    bytes32 private immutable cachedDomainSeparator;
+    uint256 private immutable cachedChainId;
+
+    // Merkle roots of epochs' claims, see claimEpoch()
+    mapping(uint256 => bytes32) public epochRoots;
+
+    // Claimed leaves of each epoch, a bit for each leaf index, 256 to a word
+    mapping(uint256 => mapping(uint256 => uint256)) private epochClaimed;
+
     constructor(
         address signer,
         uint256 signerAllowance,
@@ -26,6 +54,9 @@ contract ClickToken is Ownable, ERC777 {
     ) ERC777("ClickToken", "CLIK", new address[](0))
         public
     {
+        cachedChainId = getChainId();
+        cachedDomainSeparator = buildDomainSeparator();
+
         // mint for owner because he's cool
         grantSigner(signer, signerAllowance);
 
@@ -65,6 +96,35 @@ contract ClickToken is Ownable, ERC777 {
         return (v, r, s);
     }
 
+    /**
+     * @dev Split one of several concatenated signatures into v, r, s
+     * @param sigs Concatenated 65 byte signatures
+     * @param index of the signature in sigs
+     * @return v of the signature
+     * @return r of the signature
+     * @return s of the signature
+     */
+    function splitSignature(bytes memory sigs, uint256 index)
+        internal
+        pure
+        returns (uint8 v, bytes32 r, bytes32 s)
+    {
+        uint256 offset = index * 65;
+        require(sigs.length >= offset + 65, "invalid-signature");
+
+        assembly {
+            r := mload(add(sigs, add(offset, 32)))
+            s := mload(add(sigs, add(offset, 64)))
+            v := byte(0, mload(add(sigs, add(offset, 96))))
+        }
+
+        if (v == uint8(0) || v == uint8(1)) {
+            v += 27;
+        }
+
+        return (v, r, s);
+    }
+
     /**
      * @dev Recover signing account using message and signature
      * @param message Signed message
@@ -122,6 +182,120 @@ contract ClickToken is Ownable, ERC777 {
         return keccak256(abi.encodePacked(recipient, uid, amount, address(this)));
     }
 
+    /**
+     * @dev The current chain's ID
+     * @return chainId
+     */
+    function getChainId() internal view returns (uint256 chainId) {
+        assembly {
+            chainId := chainid()
+        }
+    }
+
+    /**
+     * @dev Hash the EIP-712 domain of this contract on the current chain
+     * @return Domain separator
+     */
+    function buildDomainSeparator() internal view returns (bytes32) {
+        return keccak256(abi.encode(
+            DOMAIN_TYPEHASH,
+            keccak256("ClickToken"),
+            keccak256("2"),
+            getChainId(),
+            address(this)
+        ));
+    }
+
+    /**
+     * @dev The EIP-712 domain separator, computed at deployment and only
+     *      recomputed if the chain has forked since
+     * @return Domain separator
+     */
+    function domainSeparator() public view returns (bytes32) {
+        if (getChainId() == cachedChainId) {
+            return cachedDomainSeparator;
+        }
+        return buildDomainSeparator();
+    }
+
+    /**
+     * @dev Hash a claim both ways, in scratch memory rather than building
+     *      a new bytes for each hash.  Three keccaks, the claim hash, the
+     *      struct hash and the digest, where a version 1 claim takes two.
+     * @param recipient of claim
+     * @param uid of claim
+     * @param amount of claim
+     * @return claimHash same as hashClaim(), the claim's key in claims
+     * @return digest same as hashClaimPacked(), signed by signers
+     */
+    function hashClaimTyped(address recipient, bytes32 uid, uint256 amount)
+        internal
+        view
+        returns (bytes32 claimHash, bytes32 digest)
+    {
+        bytes32 domain = domainSeparator();
+        bytes32 typeHash = CLAIM_TYPEHASH;
+
+        assembly {
+            let ptr := mload(0x40)
+
+            // recipient ‖ uid ‖ amount ‖ address(this), like hashClaim()
+            mstore(ptr, shl(96, recipient))
+            mstore(add(ptr, 20), uid)
+            mstore(add(ptr, 52), amount)
+            mstore(add(ptr, 84), shl(96, address()))
+            claimHash := keccak256(ptr, 104)
+
+            mstore(ptr, typeHash)
+            mstore(add(ptr, 32), and(recipient, 0xffffffffffffffffffffffffffffffffffffffff))
+            mstore(add(ptr, 64), uid)
+            mstore(add(ptr, 96), amount)
+            let structHash := keccak256(ptr, 128)
+
+            // "\x19\x01" ‖ domain separator ‖ struct hash
+            mstore(ptr, 0x1901000000000000000000000000000000000000000000000000000000000000)
+            mstore(add(ptr, 2), domain)
+            mstore(add(ptr, 34), structHash)
+            digest := keccak256(ptr, 66)
+        }
+    }
+
+    /**
+     * @dev Hash a claim as EIP-712 typed data.  Signed as is, with no
+     *      prefixHash().
+     * @param recipient of claim
+     * @param uid of claim
+     * @param amount of claim
+     * @return Digest of claim
+     */
+    function hashClaimPacked(address recipient, bytes32 uid, uint256 amount)
+        public
+        view
+        returns (bytes32)
+    {
+        (, bytes32 digest) = hashClaimTyped(recipient, uid, amount);
+        return digest;
+    }
+
+    /**
+     * @dev Recover the signer of a hash from an EIP-2098 compact signature
+     * @param hash Signed hash
+     * @param r of signature
+     * @param vs of signature, s with v's parity in the top bit
+     * @return address of signer
+     */
+    function recoverCompact(bytes32 hash, bytes32 r, bytes32 vs)
+        internal
+        pure
+        returns (address)
+    {
+        bytes32 s = vs & bytes32(
+            0x7fffffffffffffffffffffffffffffffffffffffffffffffffffffffffffffff
+        );
+        uint8 v = uint8(27 + (uint256(vs) >> 255));
+        return ecrecover(hash, v, r, s);
+    }
+
     /**
      * @dev Check if an account is an authorized signer
      * @param signer address to check
@@ -223,4 +397,288 @@ contract ClickToken is Ownable, ERC777 {
         bytes memory zero = new bytes(0);
         return claim(recipient, uid, amount, signature, zero, zero);
     }
+
+    /**
+     * @dev Mint tokens for a claim like claim() does, for less gas.  Takes
+     *      an EIP-2098 compact signature, and no ERC777 data.
+     * @param recipient of the minted tokens
+     * @param uid of claim
+     * @param amount of claim
+     * @param r of the claim's signature
+     * @param vs of the claim's signature, s with v's parity in the top bit
+     */
+    function claimCompact(
+        address recipient,
+        bytes32 uid,
+        uint256 amount,
+        bytes32 r,
+        bytes32 vs
+    ) external
+    {
+        bytes32 claimHash = hashClaim(recipient, uid, amount);
+
+        // A claim can only be used once
+        require(!claims[claimHash], "already-claimed");
+        claims[claimHash] = true;
+
+        address recovered = recoverCompact(prefixHash(claimHash), r, vs);
+
+        // Read and write the signer's allowance once each
+        uint256 allowance = signers[recovered];
+        require(allowance >= amount, "invalid-signer");
+        signers[recovered] = allowance - amount;
+
+        bytes memory zero = new bytes(0);
+        _mint(recipient, amount, zero, zero);
+    }
+
+    /**
+     * @dev Mint tokens for a claim signed as EIP-712 typed data, see
+     *      hashClaimPacked(), with an EIP-2098 compact signature.  Claims
+     *      are recorded by hashClaim() like every other claim, so a claim
+     *      signed both ways can only be used once.  That's a third keccak
+     *      per claim next to claimCompact(), see hashClaimTyped().
+     * @param recipient of the minted tokens
+     * @param uid of claim
+     * @param amount of claim
+     * @param r of the claim's signature
+     * @param vs of the claim's signature, s with v's parity in the top bit
+     */
+    function claimTyped(
+        address recipient,
+        bytes32 uid,
+        uint256 amount,
+        bytes32 r,
+        bytes32 vs
+    ) external
+    {
+        (bytes32 claimHash, bytes32 digest) = hashClaimTyped(
+            recipient,
+            uid,
+            amount
+        );
+
+        // A claim can only be used once
+        require(!claims[claimHash], "already-claimed");
+        claims[claimHash] = true;
+
+        address recovered = recoverCompact(digest, r, vs);
+
+        // Read and write the signer's allowance once each
+        uint256 allowance = signers[recovered];
+        require(allowance >= amount, "invalid-signer");
+        signers[recovered] = allowance - amount;
+
+        bytes memory zero = new bytes(0);
+        _mint(recipient, amount, zero, zero);
+    }
+
+    /**
+     * @dev Recover the signer of one claim in a batch.  Kept out of
+     *      claimBatch() so v, r and s don't take up its stack.
+     * @param claimHash of the claim
+     * @param sigs Concatenated 65 byte signatures
+     * @param index of the claim's signature in sigs
+     * @return address of signer
+     */
+    function recoverBatchSigner(
+        bytes32 claimHash,
+        bytes memory sigs,
+        uint256 index
+    ) internal pure returns (address)
+    {
+        (uint8 v, bytes32 r, bytes32 s) = splitSignature(sigs, index);
+        return ecrecover(prefixHash(claimHash), v, r, s);
+    }
+
+    /**
+     * @dev Add amount to an account's total
+     * @param totals to add to
+     * @param account to add amount for
+     * @param amount to add
+     */
+    function addTo(Totals memory totals, address account, uint256 amount)
+        internal
+        pure
+    {
+        uint256 i = 0;
+        while (i < totals.length && totals.accounts[i] != account) {
+            i++;
+        }
+        if (i == totals.length) {
+            totals.accounts[i] = account;
+            totals.length++;
+        }
+        totals.amounts[i] = totals.amounts[i].add(amount);
+    }
+
+    /**
+     * @dev Mint tokens for many claims in one transaction.  Every claim is
+     *      checked like claim() does, but each signer's allowance is
+     *      reduced once and each recipient is minted their total once.
+     * @param recipients of each claim
+     * @param uids of each claim
+     * @param amounts of each claim
+     * @param signatures of each claim, concatenated
+     */
+    function claimBatch(
+        address[] memory recipients,
+        bytes32[] memory uids,
+        uint256[] memory amounts,
+        bytes memory signatures
+    ) public
+    {
+        uint256 count = recipients.length;
+        require(
+            uids.length == count
+            && amounts.length == count
+            && signatures.length == count * 65,
+            "invalid-batch"
+        );
+
+        Totals memory bySigner = Totals(
+            new address[](count),
+            new uint256[](count),
+            0
+        );
+        Totals memory byRecipient = Totals(
+            new address[](count),
+            new uint256[](count),
+            0
+        );
+
+        for (uint256 i = 0; i < count; i++) {
+            bytes32 claimHash = hashClaim(recipients[i], uids[i], amounts[i]);
+
+            // Also catches a claim repeated within the batch
+            require(!claims[claimHash], "already-claimed");
+            claims[claimHash] = true;
+
+            addTo(
+                bySigner,
+                recoverBatchSigner(claimHash, signatures, i),
+                amounts[i]
+            );
+            addTo(byRecipient, recipients[i], amounts[i]);
+        }
+
+        // Make sure every signer is approved for all they signed
+        for (uint256 i = 0; i < bySigner.length; i++) {
+            address signer = bySigner.accounts[i];
+            require(signers[signer] >= bySigner.amounts[i], "invalid-signer");
+            signers[signer] -= bySigner.amounts[i];
+        }
+
+        bytes memory zero = new bytes(0);
+        for (uint256 i = 0; i < byRecipient.length; i++) {
+            _mint(byRecipient.accounts[i], byRecipient.amounts[i], zero, zero);
+        }
+    }
+
+    /**
+     * @dev Publish the Merkle root of an epoch's claims.  The signer's
+     *      allowance is reduced by the epoch's total once, rather than by
+     *      each claim.
+     * @param epoch number, published once
+     * @param root of the epoch's tree of epochLeaf() leaves
+     * @param total amount of the epoch's claims
+     */
+    function publishEpoch(uint256 epoch, bytes32 root, uint256 total) public
+    {
+        require(root != bytes32(0), "invalid-root");
+        require(epochRoots[epoch] == bytes32(0), "epoch-published");
+
+        uint256 allowance = signers[msg.sender];
+        require(allowance >= total, "invalid-signer");
+        signers[msg.sender] = allowance - total;
+
+        epochRoots[epoch] = root;
+        emit EpochPublished(epoch, root, total);
+    }
+
+    /**
+     * @dev Hash a leaf of an epoch's tree
+     * @param index of the leaf
+     * @param recipient of claim
+     * @param uid of claim
+     * @param amount of claim
+     * @return Hash of leaf
+     */
+    function epochLeaf(
+        uint256 index,
+        address recipient,
+        bytes32 uid,
+        uint256 amount
+    ) public pure returns (bytes32)
+    {
+        return keccak256(abi.encodePacked(index, recipient, uid, amount));
+    }
+
+    /**
+     * @dev Check if a leaf of an epoch has been claimed
+     * @param epoch number
+     * @param index of the leaf
+     * @return If the leaf has been claimed
+     */
+    function isEpochClaimed(uint256 epoch, uint256 index)
+        public
+        view
+        returns (bool)
+    {
+        uint256 word = epochClaimed[epoch][index >> 8];
+        return word & (uint256(1) << (index & 0xff)) != 0;
+    }
+
+    /**
+     * @dev Mark a leaf of an epoch claimed, if it isn't already.  A leaf's
+     *      bit shares a storage word with 255 others, so most claims
+     *      update a word that's already in use rather than a new slot.
+     * @param epoch number
+     * @param index of the leaf
+     */
+    function setEpochClaimed(uint256 epoch, uint256 index) internal
+    {
+        uint256 wordIndex = index >> 8;
+        uint256 bit = uint256(1) << (index & 0xff);
+        uint256 word = epochClaimed[epoch][wordIndex];
+        require(word & bit == 0, "already-claimed");
+        epochClaimed[epoch][wordIndex] = word | bit;
+    }
+
+    /**
+     * @dev Mint tokens for a leaf of a published epoch.  Anyone can send
+     *      the claim, since the leaf commits to the recipient.
+     * @param epoch number
+     * @param index of the leaf
+     * @param recipient of the minted tokens
+     * @param uid of claim
+     * @param amount of claim
+     * @param proof of the leaf, from the leaf up
+     */
+    function claimEpoch(
+        uint256 epoch,
+        uint256 index,
+        address recipient,
+        bytes32 uid,
+        uint256 amount,
+        bytes32[] calldata proof
+    ) external
+    {
+        bytes32 root = epochRoots[epoch];
+        require(root != bytes32(0), "unknown-epoch");
+
+        setEpochClaimed(epoch, index);
+
+        require(
+            MerkleProof.verify(
+                proof,
+                root,
+                epochLeaf(index, recipient, uid, amount)
+            ),
+            "invalid-proof"
+        );
+
+        bytes memory zero = new bytes(0);
+        _mint(recipient, amount, zero, zero);
+    }
 }
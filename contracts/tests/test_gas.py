@@ -0,0 +1,317 @@
+""" Gas used by claims, for comparing the ways to claim """
+from eth_account import Account
+from test_token import ONE_ETH, make_claim, make_typed_claim, sig_to_compact
+
+BATCH_SIZES = (1, 5, 20, 50)
+COMPACT_CLAIMS = 10
+TYPED_CLAIMS = 10
+EPOCH_LEAVES = 4096
+EPOCH_CLAIMS = 10
+
+
+def test_claim_batch_gas(web3, contracts, std_tx):
+    """ N claims one at a time against one claimBatch of N """
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    signer = web3.eth.accounts[3]
+    owner = clickToken.functions.owner().call()
+
+    as_txhash = clickToken.functions.grantSigner(
+        signer,
+        ONE_ETH * sum(BATCH_SIZES) * 2
+    ).transact(std_tx({
+        'from': owner
+    }))
+    assert web3.eth.waitForTransactionReceipt(as_txhash).status == 1
+
+    report = []
+
+    for n in BATCH_SIZES:
+        singles_gas = 0
+
+        for i in range(n):
+            claim = make_claim(
+                web3,
+                'gas single claim {} of {}'.format(i, n),
+                signer,
+                alice,
+                clickToken.address
+            )
+            txhash = clickToken.functions.claim(
+                claim['recipient'],
+                claim['uid'],
+                claim['amount'],
+                claim['sig']
+            ).transact(std_tx({
+                'from': alice,
+            }))
+            receipt = web3.eth.waitForTransactionReceipt(txhash)
+            assert receipt.status == 1
+            singles_gas += receipt.gasUsed
+
+        claims = [
+            make_claim(
+                web3,
+                'gas batch claim {} of {}'.format(i, n),
+                signer,
+                alice,
+                clickToken.address
+            )
+            for i in range(n)
+        ]
+        alice_bal = clickToken.functions.balanceOf(alice).call()
+
+        txhash = clickToken.functions.claimBatch(
+            [c['recipient'] for c in claims],
+            [c['uid'] for c in claims],
+            [c['amount'] for c in claims],
+            b''.join(c['sig'] for c in claims)
+        ).transact(std_tx({
+            'from': alice,
+            'gas': 6000000,
+        }))
+        receipt = web3.eth.waitForTransactionReceipt(txhash)
+        assert receipt.status == 1
+        assert alice_bal + ONE_ETH * n == clickToken.functions.balanceOf(
+            alice
+        ).call()
+
+        report.append((n, singles_gas, receipt.gasUsed))
+
+        if n > 1:
+            assert receipt.gasUsed < singles_gas
+
+    print('{:>4} {:>12} {:>12} {:>11} {:>11} {:>11}'.format(
+        'N', 'claim() x N', 'claimBatch', 'claim/claim', 'batch/claim',
+        'saved/claim'
+    ))
+    for n, singles_gas, batch_gas in report:
+        print('{:>4} {:>12} {:>12} {:>11} {:>11} {:>11}'.format(
+            n,
+            singles_gas,
+            batch_gas,
+            singles_gas // n,
+            batch_gas // n,
+            (singles_gas - batch_gas) // n
+        ))
+
+
+def test_claim_compact_gas(web3, contracts, std_tx):
+    """ claim() against claimCompact(), per claim """
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    signer = web3.eth.accounts[3]
+    owner = clickToken.functions.owner().call()
+
+    as_txhash = clickToken.functions.grantSigner(
+        signer,
+        ONE_ETH * COMPACT_CLAIMS * 2
+    ).transact(std_tx({
+        'from': owner
+    }))
+    assert web3.eth.waitForTransactionReceipt(as_txhash).status == 1
+
+    gas = {'claim': 0, 'claimCompact': 0}
+
+    for i in range(COMPACT_CLAIMS):
+        for function in gas:
+            claim = make_claim(
+                web3,
+                'gas {} {}'.format(function, i),
+                signer,
+                alice,
+                clickToken.address
+            )
+            if function == 'claim':
+                args = [claim['sig']]
+            else:
+                args = sig_to_compact(claim['sig'])
+
+            txhash = clickToken.functions[function](
+                claim['recipient'],
+                claim['uid'],
+                claim['amount'],
+                *args
+            ).transact(std_tx({
+                'from': alice,
+            }))
+            receipt = web3.eth.waitForTransactionReceipt(txhash)
+            assert receipt.status == 1
+            gas[function] += receipt.gasUsed
+
+    for function, used in gas.items():
+        print('{:>12} {:>8} gas per claim'.format(
+            function,
+            used // COMPACT_CLAIMS
+        ))
+    print('{:>12} {:>8} gas per claim'.format(
+        'saved',
+        (gas['claim'] - gas['claimCompact']) // COMPACT_CLAIMS
+    ))
+
+    assert gas['claimCompact'] < gas['claim']
+
+
+def test_claim_typed_gas(web3, contracts, std_tx):
+    """ Version 1 claim() and claimCompact() next to version 2 claimTyped(),
+    per claim.  claimTyped() takes the same compact signature as
+    claimCompact(), but hashes three times to its two.
+    """
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    signer = web3.eth.accounts[3]
+    typed_signer = Account.create()
+    owner = clickToken.functions.owner().call()
+
+    for account in (signer, typed_signer.address):
+        as_txhash = clickToken.functions.grantSigner(
+            account,
+            ONE_ETH * TYPED_CLAIMS * 2
+        ).transact(std_tx({
+            'from': owner
+        }))
+        assert web3.eth.waitForTransactionReceipt(as_txhash).status == 1
+
+    # Claim version and keccaks per claim
+    functions = {
+        'claim': (1, 2),
+        'claimCompact': (1, 2),
+        'claimTyped': (2, 3),
+    }
+    gas = dict.fromkeys(functions, 0)
+
+    for i in range(TYPED_CLAIMS):
+        for function in gas:
+            seed = 'gas {} {}'.format(function, i)
+            if function == 'claimTyped':
+                claim = make_typed_claim(
+                    web3,
+                    seed,
+                    typed_signer.key,
+                    alice,
+                    clickToken
+                )
+            else:
+                claim = make_claim(
+                    web3,
+                    seed,
+                    signer,
+                    alice,
+                    clickToken.address
+                )
+
+            if function == 'claim':
+                sig = [claim['sig']]
+            else:
+                sig = sig_to_compact(claim['sig'])
+
+            txhash = clickToken.functions[function](
+                claim['recipient'],
+                claim['uid'],
+                claim['amount'],
+                *sig
+            ).transact(std_tx({
+                'from': alice,
+            }))
+            receipt = web3.eth.waitForTransactionReceipt(txhash)
+            assert receipt.status == 1
+            gas[function] += receipt.gasUsed
+
+    print('{:>12} {:>7} {:>7} {:>9}'.format(
+        'function', 'version', 'keccaks', 'gas/claim'
+    ))
+    for function, used in gas.items():
+        print('{:>12} {:>7} {:>7} {:>9}'.format(
+            function,
+            *functions[function],
+            used // TYPED_CLAIMS
+        ))
+
+
+def test_claim_epoch_gas(web3, contracts, std_tx, tmp_path):
+    """ claimCompact() against claimEpoch() from a tree of EPOCH_LEAVES,
+    per claim, and the one publishEpoch() for the whole epoch
+    """
+    import pytest
+
+    merkle = pytest.importorskip('onclick_signer.merkle')
+
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    signer = web3.eth.accounts[3]
+    owner = clickToken.functions.owner().call()
+
+    as_txhash = clickToken.functions.grantSigner(
+        signer,
+        ONE_ETH * (EPOCH_LEAVES + EPOCH_CLAIMS)
+    ).transact(std_tx({
+        'from': owner
+    }))
+    assert web3.eth.waitForTransactionReceipt(as_txhash).status == 1
+
+    leaves = [
+        (i, alice, web3.sha3(text='gas epoch leaf {}'.format(i)), ONE_ETH)
+        for i in range(EPOCH_LEAVES)
+    ]
+    writer = merkle.MerkleTreeWriter(str(tmp_path))
+    for leaf in leaves:
+        writer.add(merkle.leaf_hash(*leaf))
+    root = writer.finish()
+    tree = merkle.MerkleTree(str(tmp_path))
+
+    txhash = clickToken.functions.publishEpoch(
+        1,
+        root,
+        ONE_ETH * EPOCH_LEAVES
+    ).transact(std_tx({
+        'from': signer
+    }))
+    receipt = web3.eth.waitForTransactionReceipt(txhash)
+    assert receipt.status == 1
+    publish_gas = receipt.gasUsed
+
+    gas = {'claimCompact': 0, 'claimEpoch': 0}
+
+    for i in range(EPOCH_CLAIMS):
+        claim = make_claim(
+            web3,
+            'gas epoch compact {}'.format(i),
+            signer,
+            alice,
+            clickToken.address
+        )
+        txhash = clickToken.functions.claimCompact(
+            claim['recipient'],
+            claim['uid'],
+            claim['amount'],
+            *sig_to_compact(claim['sig'])
+        ).transact(std_tx({
+            'from': alice,
+        }))
+        receipt = web3.eth.waitForTransactionReceipt(txhash)
+        assert receipt.status == 1
+        gas['claimCompact'] += receipt.gasUsed
+
+        # Spread over the tree, so each claim starts a new bitmap word
+        index = i * EPOCH_LEAVES // EPOCH_CLAIMS
+        txhash = clickToken.functions.claimEpoch(
+            1,
+            *leaves[index],
+            tree.proof(index)
+        ).transact(std_tx({
+            'from': alice,
+        }))
+        receipt = web3.eth.waitForTransactionReceipt(txhash)
+        assert receipt.status == 1
+        gas['claimEpoch'] += receipt.gasUsed
+
+    print('{} leaves, publishEpoch {} gas'.format(EPOCH_LEAVES, publish_gas))
+    for function, used in gas.items():
+        print('{:>12} {:>8} gas per claim'.format(
+            function,
+            used // EPOCH_CLAIMS
+        ))
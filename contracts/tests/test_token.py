@@ -1,4 +1,5 @@
 from eth_utils.hexadecimal import remove_0x_prefix, encode_hex
+from eth_account import Account
 from eth_account.messages import defunct_hash_message
 
 ONE_ETH = int(1e18)
@@ -19,6 +20,29 @@ def make_claim(web3, seed, signer_account, recipient, contract_address, amount=O
 
     return claim
 
+def make_typed_claim(web3, seed, signer_key, recipient, clickToken, amount=ONE_ETH):
+    """ Put together a version 2 claim, signed as EIP-712 typed data.  The
+    tester's accounts only eth_sign, so these are signed with a local key.
+    """
+    claim = {}
+
+    claim['uid'] = web3.sha3(text=seed)
+    claim['amount'] = amount
+    claim['recipient'] = recipient
+    claim['hash'] = clickToken.functions.hashClaim(
+        recipient,
+        claim['uid'],
+        amount
+    ).call()
+    claim['digest'] = clickToken.functions.hashClaimPacked(
+        recipient,
+        claim['uid'],
+        amount
+    ).call()
+    claim['sig'] = Account.signHash(claim['digest'], signer_key).signature
+
+    return claim
+
 def sig_to_vrs(sig):
     """ Split a signature into r, s, v components """
     r = sig[:32]
@@ -31,6 +55,17 @@ def sig_to_vrs(sig):
 
     return [r, s, v]
 
+def sig_to_compact(sig):
+    """ Split a signature into EIP-2098 r, vs components """
+    [r, s, v] = sig_to_vrs(sig)
+    vs = bytearray(s)
+
+    # v's parity goes in the top bit of s, which is always clear
+    if v == 28:
+        vs[0] |= 0x80
+
+    return [r, bytes(vs)]
+
 def test_token_basics(web3, contracts, std_tx):
     print("contracts: ", contracts)
 
@@ -348,3 +383,687 @@ def test_token_repeat_claims(web3, contracts, std_tx):
     except ValueError as err:
         assert 'already-claimed' in str(err), \
             "Unexpected error:, {}".format(err)
+
+def test_hash_claim_parity(web3, contracts):
+    """ The signer's packed claim encoder must match hashClaim """
+    import random
+    import pytest
+
+    claims = pytest.importorskip('onclick_signer.claims')
+
+    clickToken = contracts.get('ClickToken')
+    rand = random.Random(1337)
+
+    for i in range(250):
+        recipient = web3.toChecksumAddress(
+            encode_hex(rand.getrandbits(160).to_bytes(20, 'big'))
+        )
+        uid = rand.getrandbits(256).to_bytes(32, 'big')
+        amount = rand.choice([0, 1, rand.getrandbits(128), 2 ** 256 - 1])
+
+        assert claims.create_claim(
+            recipient,
+            uid,
+            amount,
+            clickToken.address
+        ) == clickToken.functions.hashClaim(recipient, uid, amount).call()
+
+def test_token_claim_batch(web3, contracts, std_tx):
+    """ Test claiming several claims in one transaction """
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    alice_original_bal = clickToken.functions.balanceOf(alice).call()
+    bob = web3.eth.accounts[1]
+    bob_original_bal = clickToken.functions.balanceOf(bob).call()
+    signer = web3.eth.accounts[3]
+    owner = clickToken.functions.owner().call()
+
+    as_txhash = clickToken.functions.grantSigner(
+        signer,
+        ONE_ETH * 10
+    ).transact(std_tx({
+        'from': owner
+    }))
+    as_receipt = web3.eth.waitForTransactionReceipt(as_txhash)
+    assert as_receipt.status == 1
+    signer_original_allowance = clickToken.functions.signers(signer).call()
+
+    # Two claims for Alice and one for Bob
+    claims = [
+        make_claim(
+            web3,
+            'unique string for batch claim {}'.format(i),
+            signer,
+            recipient,
+            clickToken.address,
+            amount
+        )
+        for i, (recipient, amount) in enumerate([
+            (alice, ONE_ETH),
+            (bob, TWO_ETH),
+            (alice, ONE_ETH),
+        ])
+    ]
+
+    batch_txhash = clickToken.functions.claimBatch(
+        [c['recipient'] for c in claims],
+        [c['uid'] for c in claims],
+        [c['amount'] for c in claims],
+        b''.join(c['sig'] for c in claims)
+    ).transact(std_tx({
+        'from': bob, # doesn't matter who sends it
+    }))
+    batch_receipt = web3.eth.waitForTransactionReceipt(batch_txhash)
+    assert batch_receipt.status == 1
+
+    assert alice_original_bal + TWO_ETH == clickToken.functions.balanceOf(
+        alice
+    ).call()
+    assert bob_original_bal + TWO_ETH == clickToken.functions.balanceOf(
+        bob
+    ).call()
+    assert signer_original_allowance - (
+        ONE_ETH * 4
+    ) == clickToken.functions.signers(signer).call()
+
+    for c in claims:
+        assert clickToken.functions.claims(c['hash']).call()
+
+def transact_batch(web3, clickToken, claims, std_tx, sender):
+    """ Send claims as one claimBatch, returning the receipt or error """
+    try:
+        txhash = clickToken.functions.claimBatch(
+            [c['recipient'] for c in claims],
+            [c['uid'] for c in claims],
+            [c['amount'] for c in claims],
+            b''.join(c['sig'] for c in claims)
+        ).transact(std_tx({
+            'from': sender,
+            'gas': 1000000,
+        }))
+        return web3.eth.waitForTransactionReceipt(txhash)
+    except ValueError as err:
+        return err
+
+def assert_batch_reverts(web3, clickToken, claims, std_tx, sender, reason):
+    result = transact_batch(web3, clickToken, claims, std_tx, sender)
+    if isinstance(result, ValueError):
+        assert reason in str(result), "Unexpected error:, {}".format(result)
+    else:
+        assert result.status == 0 # Revert
+
+def test_token_claim_batch_signers(web3, contracts, std_tx):
+    """ Test a batch signed by two signers, and batches that must revert """
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    alice_original_bal = clickToken.functions.balanceOf(alice).call()
+    bob = web3.eth.accounts[1]
+    bob_original_bal = clickToken.functions.balanceOf(bob).call()
+    signer1 = web3.eth.accounts[3]
+    signer2 = web3.eth.accounts[4]
+    owner = clickToken.functions.owner().call()
+
+    for signer, allowance in ((signer1, ONE_ETH * 10), (signer2, TWO_ETH)):
+        as_txhash = clickToken.functions.grantSigner(
+            signer,
+            allowance
+        ).transact(std_tx({
+            'from': owner
+        }))
+        assert web3.eth.waitForTransactionReceipt(as_txhash).status == 1
+
+    signer1_allowance = clickToken.functions.signers(signer1).call()
+    signer2_allowance = clickToken.functions.signers(signer2).call()
+
+    # Signers interleaved, so each total is added to more than once
+    claims = [
+        make_claim(
+            web3,
+            'unique string for two signer batch {}'.format(i),
+            signer,
+            recipient,
+            clickToken.address,
+            amount
+        )
+        for i, (signer, recipient, amount) in enumerate([
+            (signer1, alice, ONE_ETH),
+            (signer2, bob, ONE_ETH),
+            (signer1, bob, TWO_ETH),
+            (signer2, alice, ONE_ETH),
+            (signer1, alice, ONE_ETH),
+        ])
+    ]
+
+    receipt = transact_batch(web3, clickToken, claims, std_tx, bob)
+    assert receipt.status == 1
+
+    assert alice_original_bal + ONE_ETH * 3 == clickToken.functions.balanceOf(
+        alice
+    ).call()
+    assert bob_original_bal + ONE_ETH * 3 == clickToken.functions.balanceOf(
+        bob
+    ).call()
+    assert signer1_allowance - (
+        ONE_ETH * 4
+    ) == clickToken.functions.signers(signer1).call()
+    assert signer2_allowance - (
+        TWO_ETH
+    ) == clickToken.functions.signers(signer2).call()
+
+    # signer2 has nothing left, so a batch with any of its claims reverts
+    # as a whole, signer1's claim included
+    over = [
+        make_claim(
+            web3,
+            'unique string for over allowance batch {}'.format(i),
+            signer,
+            alice,
+            clickToken.address
+        )
+        for i, signer in enumerate([signer1, signer2])
+    ]
+    assert_batch_reverts(
+        web3,
+        clickToken,
+        over,
+        std_tx,
+        bob,
+        'invalid-signer'
+    )
+    assert not clickToken.functions.claims(over[0]['hash']).call()
+    assert signer1_allowance - (
+        ONE_ETH * 4
+    ) == clickToken.functions.signers(signer1).call()
+
+    # A claim repeated within one batch
+    repeated = make_claim(
+        web3,
+        'unique string for repeated batch claim',
+        signer1,
+        alice,
+        clickToken.address
+    )
+    assert_batch_reverts(
+        web3,
+        clickToken,
+        [repeated, repeated],
+        std_tx,
+        bob,
+        'already-claimed'
+    )
+    assert not clickToken.functions.claims(repeated['hash']).call()
+
+    # And one claimed by an earlier batch
+    assert_batch_reverts(
+        web3,
+        clickToken,
+        claims[:1],
+        std_tx,
+        bob,
+        'already-claimed'
+    )
+
+def test_token_claim_compact(web3, contracts, std_tx):
+    """ Test claiming with a compact signature """
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    alice_original_bal = clickToken.functions.balanceOf(alice).call()
+    signer = web3.eth.accounts[3]
+    owner = clickToken.functions.owner().call()
+
+    as_txhash = clickToken.functions.grantSigner(
+        signer,
+        ONE_ETH * 10
+    ).transact(std_tx({
+        'from': owner
+    }))
+    as_receipt = web3.eth.waitForTransactionReceipt(as_txhash)
+    assert as_receipt.status == 1
+    signer_original_allowance = clickToken.functions.signers(signer).call()
+
+    # Both parities of v
+    for i in range(4):
+        claim = make_claim(
+            web3,
+            'unique string for compact claim {}'.format(i),
+            signer,
+            alice,
+            clickToken.address,
+            ONE_ETH
+        )
+        [r, vs] = sig_to_compact(claim['sig'])
+
+        claim_txhash = clickToken.functions.claimCompact(
+            claim['recipient'],
+            claim['uid'],
+            claim['amount'],
+            r,
+            vs
+        ).transact(std_tx({
+            'from': alice,
+        }))
+        claim_receipt = web3.eth.waitForTransactionReceipt(claim_txhash)
+        assert claim_receipt.status == 1
+        assert clickToken.functions.claims(claim['hash']).call()
+
+    assert alice_original_bal + (
+        ONE_ETH * 4
+    ) == clickToken.functions.balanceOf(alice).call()
+    assert signer_original_allowance - (
+        ONE_ETH * 4
+    ) == clickToken.functions.signers(signer).call()
+
+def test_hash_claim_packed_parity(web3, contracts):
+    """ The signer's typed claim digest must match hashClaimPacked """
+    import random
+    import pytest
+
+    claims = pytest.importorskip('onclick_signer.claims')
+
+    clickToken = contracts.get('ClickToken')
+    chain_id = web3.eth.chainId
+    rand = random.Random(1337)
+
+    assert claims.domain_separator(
+        clickToken.address,
+        chain_id
+    ) == clickToken.functions.domainSeparator().call()
+
+    for i in range(250):
+        recipient = web3.toChecksumAddress(
+            encode_hex(rand.getrandbits(160).to_bytes(20, 'big'))
+        )
+        uid = rand.getrandbits(256).to_bytes(32, 'big')
+        amount = rand.choice([0, 1, rand.getrandbits(128), 2 ** 256 - 1])
+
+        assert claims.create_typed_claim(
+            recipient,
+            uid,
+            amount,
+            clickToken.address,
+            chain_id
+        ) == clickToken.functions.hashClaimPacked(recipient, uid, amount).call()
+
+def test_token_claim_typed(web3, contracts, std_tx):
+    """ Test claiming with a version 2 typed claim """
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    alice_original_bal = clickToken.functions.balanceOf(alice).call()
+    signer = Account.create()
+    owner = clickToken.functions.owner().call()
+
+    as_txhash = clickToken.functions.grantSigner(
+        signer.address,
+        ONE_ETH * 10
+    ).transact(std_tx({
+        'from': owner
+    }))
+    as_receipt = web3.eth.waitForTransactionReceipt(as_txhash)
+    assert as_receipt.status == 1
+
+    # Both parities of v
+    for i in range(4):
+        claim = make_typed_claim(
+            web3,
+            'unique string for typed claim {}'.format(i),
+            signer.key,
+            alice,
+            clickToken
+        )
+        [r, vs] = sig_to_compact(claim['sig'])
+
+        claim_txhash = clickToken.functions.claimTyped(
+            claim['recipient'],
+            claim['uid'],
+            claim['amount'],
+            r,
+            vs
+        ).transact(std_tx({
+            'from': alice,
+        }))
+        claim_receipt = web3.eth.waitForTransactionReceipt(claim_txhash)
+        assert claim_receipt.status == 1
+
+        # Recorded like every other claim
+        assert clickToken.functions.claims(claim['hash']).call()
+
+    assert alice_original_bal + (
+        ONE_ETH * 4
+    ) == clickToken.functions.balanceOf(alice).call()
+    assert ONE_ETH * 6 == clickToken.functions.signers(signer.address).call()
+
+    # A version 1 signature of the same claim can't be used again
+    v1_signer = web3.eth.accounts[3]
+    as_txhash = clickToken.functions.grantSigner(
+        v1_signer,
+        ONE_ETH * 10
+    ).transact(std_tx({
+        'from': owner
+    }))
+    assert web3.eth.waitForTransactionReceipt(as_txhash).status == 1
+
+    v1_claim = make_claim(
+        web3,
+        'unique string for typed claim 0',
+        v1_signer,
+        alice,
+        clickToken.address
+    )
+    try:
+        clickToken.functions.claim(
+            v1_claim['recipient'],
+            v1_claim['uid'],
+            v1_claim['amount'],
+            v1_claim['sig']
+        ).transact(std_tx({
+            'from': alice,
+        }))
+        assert False, "Claim signed both ways was used twice"
+    except Exception as err:
+        assert 'already-claimed' in str(err), \
+            "Unexpected error:, {}".format(err)
+
+def test_token_claim_signer_typed(web3, contracts, std_tx):
+    """ Test redeeming version 2 claims signed by the signer service """
+    import pytest
+
+    claims = pytest.importorskip('onclick_signer.claims')
+    from onclick_signer.signer import SignerService
+
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    alice_original_bal = clickToken.functions.balanceOf(alice).call()
+    signer = SignerService(private_key=Account.create().key)
+    owner = clickToken.functions.owner().call()
+
+    as_txhash = clickToken.functions.grantSigner(
+        signer.address,
+        ONE_ETH * 10
+    ).transact(std_tx({
+        'from': owner
+    }))
+    assert web3.eth.waitForTransactionReceipt(as_txhash).status == 1
+
+    for clicks in range(1, 4):
+        uid = web3.sha3(
+            text='unique token for signer typed claim {}'.format(clicks)
+        )
+        digest, sig = claims.sign_claim(
+            signer,
+            alice,
+            remove_0x_prefix(encode_hex(uid)),
+            clicks,
+            clickToken.address,
+            version=2,
+            chain_id=web3.eth.chainId
+        )
+        amount = ONE_ETH * clicks
+
+        assert bytes(digest) == clickToken.functions.hashClaimPacked(
+            alice,
+            uid,
+            amount
+        ).call()
+
+        [r, vs] = sig_to_compact(sig)
+        claim_txhash = clickToken.functions.claimTyped(
+            alice,
+            uid,
+            amount,
+            r,
+            vs
+        ).transact(std_tx({
+            'from': alice,
+        }))
+        assert web3.eth.waitForTransactionReceipt(claim_txhash).status == 1
+
+        assert clickToken.functions.claims(
+            clickToken.functions.hashClaim(alice, uid, amount).call()
+        ).call()
+
+    assert alice_original_bal + (
+        ONE_ETH * 6
+    ) == clickToken.functions.balanceOf(alice).call()
+    assert ONE_ETH * 4 == clickToken.functions.signers(signer.address).call()
+
+def test_token_claim_epoch(web3, contracts, std_tx, tmp_path):
+    """ Test publishing an epoch and claiming its leaves """
+    import pytest
+
+    merkle = pytest.importorskip('onclick_signer.merkle')
+
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    alice_original_bal = clickToken.functions.balanceOf(alice).call()
+    bob = web3.eth.accounts[1]
+    bob_original_bal = clickToken.functions.balanceOf(bob).call()
+    signer = web3.eth.accounts[3]
+    owner = clickToken.functions.owner().call()
+
+    as_txhash = clickToken.functions.grantSigner(
+        signer,
+        ONE_ETH * 10
+    ).transact(std_tx({
+        'from': owner
+    }))
+    assert web3.eth.waitForTransactionReceipt(as_txhash).status == 1
+    signer_original_allowance = clickToken.functions.signers(signer).call()
+
+    leaves = [
+        (i, recipient, web3.sha3(text='epoch leaf {}'.format(i)), amount)
+        for i, (recipient, amount) in enumerate([
+            (alice, ONE_ETH),
+            (bob, TWO_ETH),
+            (alice, ONE_ETH),
+        ])
+    ]
+    writer = merkle.MerkleTreeWriter(str(tmp_path))
+    for leaf in leaves:
+        leaf_hash = merkle.leaf_hash(*leaf)
+        assert leaf_hash == clickToken.functions.epochLeaf(*leaf).call()
+        writer.add(leaf_hash)
+    root = writer.finish()
+    tree = merkle.MerkleTree(str(tmp_path))
+
+    publish_txhash = clickToken.functions.publishEpoch(
+        1,
+        root,
+        ONE_ETH * 4
+    ).transact(std_tx({
+        'from': signer
+    }))
+    assert web3.eth.waitForTransactionReceipt(publish_txhash).status == 1
+    assert clickToken.functions.epochRoots(1).call() == root
+
+    # The allowance is reduced once, by the total
+    assert signer_original_allowance - (
+        ONE_ETH * 4
+    ) == clickToken.functions.signers(signer).call()
+
+    for leaf in leaves:
+        index = leaf[0]
+        assert not clickToken.functions.isEpochClaimed(1, index).call()
+
+        claim_txhash = clickToken.functions.claimEpoch(
+            1,
+            *leaf,
+            tree.proof(index)
+        ).transact(std_tx({
+            'from': bob, # doesn't matter who sends it
+        }))
+        assert web3.eth.waitForTransactionReceipt(claim_txhash).status == 1
+        assert clickToken.functions.isEpochClaimed(1, index).call()
+
+    assert alice_original_bal + TWO_ETH == clickToken.functions.balanceOf(
+        alice
+    ).call()
+    assert bob_original_bal + TWO_ETH == clickToken.functions.balanceOf(
+        bob
+    ).call()
+
+    # Leaves can only be claimed once, and only as published
+    for args, error in (
+        ((1, *leaves[0], tree.proof(0)), 'already-claimed'),
+        ((2, *leaves[0], tree.proof(0)), 'unknown-epoch'),
+    ):
+        try:
+            clickToken.functions.claimEpoch(*args).transact(std_tx({
+                'from': alice,
+            }))
+            assert False, "Claim should have failed"
+        except Exception as err:
+            assert error in str(err), "Unexpected error:, {}".format(err)
+
+    # An epoch is only published once
+    try:
+        clickToken.functions.publishEpoch(1, root, 0).transact(std_tx({
+            'from': signer
+        }))
+        assert False, "Epoch published twice"
+    except Exception as err:
+        assert 'epoch-published' in str(err), \
+            "Unexpected error:, {}".format(err)
+
+    # A leaf with another amount doesn't verify
+    writer = merkle.MerkleTreeWriter(str(tmp_path / 'two'))
+    writer.add(merkle.leaf_hash(*leaves[0]))
+    publish_txhash = clickToken.functions.publishEpoch(
+        2,
+        writer.finish(),
+        ONE_ETH
+    ).transact(std_tx({
+        'from': signer
+    }))
+    assert web3.eth.waitForTransactionReceipt(publish_txhash).status == 1
+    try:
+        clickToken.functions.claimEpoch(
+            2,
+            0,
+            alice,
+            leaves[0][2],
+            TWO_ETH,
+            []
+        ).transact(std_tx({
+            'from': alice,
+        }))
+        assert False, "Claim with the wrong amount succeeded"
+    except Exception as err:
+        assert 'invalid-proof' in str(err), \
+            "Unexpected error:, {}".format(err)
+
+def test_token_claim_epoch_bitmap(web3, contracts, std_tx, tmp_path):
+    """ Test claiming leaves across words of the claimed bitmap, from a tree
+    built by the signer with an odd number of leaves
+    """
+    import pytest
+
+    merkle = pytest.importorskip('onclick_signer.merkle')
+
+    clickToken = contracts.get('ClickToken')
+
+    alice = web3.eth.accounts[0]
+    alice_original_bal = clickToken.functions.balanceOf(alice).call()
+    signer = web3.eth.accounts[3]
+    owner = clickToken.functions.owner().call()
+    size = 300
+
+    as_txhash = clickToken.functions.grantSigner(
+        signer,
+        ONE_ETH * size
+    ).transact(std_tx({
+        'from': owner
+    }))
+    assert web3.eth.waitForTransactionReceipt(as_txhash).status == 1
+
+    leaves = [
+        (i, alice, web3.sha3(text='bitmap epoch leaf {}'.format(i)), ONE_ETH)
+        for i in range(size)
+    ]
+    writer = merkle.MerkleTreeWriter(str(tmp_path))
+    for leaf in leaves:
+        # keccak(index ‖ recipient ‖ uid ‖ amount), 32 + 20 + 32 + 32 bytes
+        assert merkle.leaf_hash(*leaf) == web3.soliditySha3(
+            ['uint256', 'address', 'bytes32', 'uint256'],
+            leaf
+        )
+        writer.add(merkle.leaf_hash(*leaf))
+    root = writer.finish()
+    tree = merkle.MerkleTree(str(tmp_path))
+
+    publish_txhash = clickToken.functions.publishEpoch(
+        7,
+        root,
+        ONE_ETH * size
+    ).transact(std_tx({
+        'from': signer
+    }))
+    assert web3.eth.waitForTransactionReceipt(publish_txhash).status == 1
+
+    # Both ends of the first two words, and the last leaf, which is carried
+    # up without a sibling so has a short proof
+    indexes = (0, 255, 256, 299)
+    assert len(tree.proof(299)) < tree.depth
+
+    for index in indexes:
+        leaf = leaves[index]
+        proof = tree.proof(index)
+        assert merkle.leaf_hash(*leaf) == clickToken.functions.epochLeaf(
+            *leaf
+        ).call()
+        assert merkle.verify(proof, root, merkle.leaf_hash(*leaf))
+
+        claim_txhash = clickToken.functions.claimEpoch(
+            7,
+            *leaf,
+            proof
+        ).transact(std_tx({
+            'from': alice,
+        }))
+        assert web3.eth.waitForTransactionReceipt(claim_txhash).status == 1
+        assert clickToken.functions.isEpochClaimed(7, index).call()
+
+    # Only the claimed bits are set
+    for index in (1, 2, 253, 254, 255, 256, 257, 258, 297, 298, 299):
+        assert clickToken.functions.isEpochClaimed(7, index).call() == (
+            index in indexes
+        )
+    assert not clickToken.functions.isEpochClaimed(6, 0).call()
+
+    assert alice_original_bal + (
+        ONE_ETH * len(indexes)
+    ) == clickToken.functions.balanceOf(alice).call()
+
+    for index in (255, 256):
+        try:
+            clickToken.functions.claimEpoch(
+                7,
+                *leaves[index],
+                tree.proof(index)
+            ).transact(std_tx({
+                'from': alice,
+            }))
+            assert False, "Leaf {} claimed twice".format(index)
+        except Exception as err:
+            assert 'already-claimed' in str(err), \
+                "Unexpected error:, {}".format(err)
+
+    # A proof is for one index only
+    try:
+        clickToken.functions.claimEpoch(
+            7,
+            *leaves[257],
+            tree.proof(256)
+        ).transact(std_tx({
+            'from': alice,
+        }))
+        assert False, "Claimed with another leaf's proof"
+    except Exception as err:
+        assert 'invalid-proof' in str(err), \
+            "Unexpected error:, {}".format(err)
+    assert not clickToken.functions.isEpochClaimed(7, 257).call()
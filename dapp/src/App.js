@@ -10,7 +10,7 @@ import Footer from './components/Footer'
 import FAQModal from './components/FAQModal'
 import DebugModal from './components/DebugModal'
 import RedemptionModal from './components/RedemptionModal'
-import { getClicks, sendClick } from './utils/clicks'
+import { getClicks, sendClick, sendClicks, watchClicks } from './utils/clicks'
 import { DEFAULT_NETWORK, NETWORKS, CONTRACTS, getProvider } from './utils/eth'
 import { remove0xPrefix } from './utils/hex'
 
@@ -19,6 +19,12 @@ import 'App.css'
 const LOCAL_STORAGE_TOKEN = 'token'
 const LOCAL_STORAGE_NETWORK = 'ethnetwork'
 const LOCAL_STORAGE_CLAIMS = 'claims'
+// Clicks are collected and sent to the signer in batches
+const CLICK_FLUSH_INTERVAL = 2000
+const MIN_CLICK_INTERVAL = 250
+const MAX_CLICK_BATCH = 40
+// Clicks kept to retry while the signer can't be reached
+const MAX_PENDING_CLICKS = 4 * MAX_CLICK_BATCH
 
 class App extends React.Component {
   constructor(props) {
@@ -43,10 +49,19 @@ class App extends React.Component {
       claims: storedClaims ? JSON.parse(storedClaims) : {},
     }
 
+    this.pendingClicks = []
+    // Sent on the socket, and not replied to yet
+    this.sentClicks = null
+    this.lastClick = 0
+    this.flushing = false
+    this.socket = null
+
     this.updateClicks()
     this.updateBalance()
 
     this.click = this.click.bind(this)
+    this.flushClicks = this.flushClicks.bind(this)
+    this.watchClicks = this.watchClicks.bind(this)
     this.reset = this.reset.bind(this)
     this.toggleFAQ = this.toggleFAQ.bind(this)
     this.toggleDebug = this.toggleDebug.bind(this)
@@ -60,6 +75,60 @@ class App extends React.Component {
     this.updateBalance = this.updateBalance.bind(this)
   }
 
+  componentDidMount() {
+    this.flushTimer = setInterval(this.flushClicks, CLICK_FLUSH_INTERVAL)
+    this.watchClicks()
+  }
+
+  componentWillUnmount() {
+    clearInterval(this.flushTimer)
+    this.flushClicks()
+
+    if (this.socket) {
+      this.socket.close()
+    }
+  }
+
+  // Have the signer push click counts instead of polling for them
+  watchClicks() {
+    if (this.socket || !this.state.token) {
+      return
+    }
+
+    const socket = watchClicks(this.state.token, clicks => {
+      this.setState({
+        clicks: clicks + this.pendingClicks.length
+      })
+    }, reply => {
+      if (this.socket !== socket || !this.sentClicks) {
+        return
+      }
+
+      // Not counted at all, e.g. while the token was locked
+      if (reply.clicks === null) {
+        this.requeueClicks(this.sentClicks)
+      }
+
+      this.sentClicks = null
+      this.flushing = false
+    })
+
+    socket.onclose = () => {
+      if (this.socket === socket) {
+        this.socket = null
+
+        // Closed before the batch was counted
+        if (this.sentClicks) {
+          this.requeueClicks(this.sentClicks)
+          this.sentClicks = null
+          this.flushing = false
+        }
+      }
+    }
+
+    this.socket = socket
+  }
+
   updateClicks() {
     if (this.state.token) {
       getClicks(this.state.token).then(resp => {
@@ -101,9 +170,81 @@ class App extends React.Component {
     }
   }
 
+  // Put clicks that weren't counted back in front of the queue, to retry
+  // with the next flush.  The oldest are dropped past MAX_PENDING_CLICKS.
+  requeueClicks(timestamps) {
+    this.pendingClicks = timestamps
+      .concat(this.pendingClicks)
+      .slice(-MAX_PENDING_CLICKS)
+  }
+
+  async flushClicks() {
+    if (this.flushing || !this.pendingClicks.length || !this.state.token) {
+      return
+    }
+
+    const timestamps = this.pendingClicks.slice(0, MAX_CLICK_BATCH)
+    this.pendingClicks = this.pendingClicks.slice(MAX_CLICK_BATCH)
+    this.flushing = true
+
+    // The reply comes back on the socket, followed by the pushed count
+    if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+      this.sentClicks = timestamps
+      this.socket.send(JSON.stringify({ clicks: timestamps }))
+      return
+    }
+
+    // Reconnect for the next flush
+    this.watchClicks()
+
+    const { token } = this.state
+
+    try {
+      const resp = await sendClicks(token, timestamps)
+
+      if (resp.clicks !== null) {
+        this.setState({
+          clicks: resp.clicks + this.pendingClicks.length
+        })
+      } else if (token === this.state.token) {
+        this.requeueClicks(timestamps)
+      }
+    } catch (err) {
+      console.error(err)
+      // Unless the token was reset meanwhile
+      if (token === this.state.token) {
+        this.requeueClicks(timestamps)
+      }
+    } finally {
+      this.flushing = false
+    }
+  }
+
   click(ev) {
     ev.preventDefault()
 
+    // Once we have a token, collect clicks and send them in batches
+    if (this.state.token) {
+      const now = Date.now()
+
+      // The signer won't credit clicks any closer together than this
+      if (now - this.lastClick < MIN_CLICK_INTERVAL) {
+        return
+      }
+
+      this.lastClick = now
+      this.pendingClicks.push(now)
+      this.setState({
+        clicks: this.state.clicks + 1
+      })
+
+      if (this.pendingClicks.length >= MAX_CLICK_BATCH) {
+        this.flushClicks()
+      }
+
+      return
+    }
+
     this.setState({
       clicking: true
     })
@@ -118,7 +259,7 @@ class App extends React.Component {
         token: resp.token ? resp.token : this.state.token,
         clicks: resp.clicks,
         clicking: false
-      })
+      }, this.watchClicks)
 
       if (resp.token) {
         localStorage.setItem(LOCAL_STORAGE_TOKEN, resp.token)
@@ -208,6 +349,15 @@ class App extends React.Component {
   }
 
   reset() {
+    this.pendingClicks = []
+    this.sentClicks = null
+    this.flushing = false
+
+    if (this.socket) {
+      this.socket.close()
+      this.socket = null
+    }
+
     this.setState({
       clicks: 0,
       token: null,
@@ -2,12 +2,17 @@ import React from 'react'
 import { toast } from 'react-toastify';
 import { Button, ButtonGroup } from '@material-ui/core'
 import { DataGrid } from '@material-ui/data-grid'
-import ethers from 'ethers'
 
 import AccountSelector from './AccountSelector'
 import ClaimContainer from './ClaimContainer'
 import { truncateToken, add0xPrefix } from '../utils/hex'
-import { getClaim, packClaim, unpackClaim } from '../utils/claim'
+import {
+  compactSignature,
+  getClaim,
+  hashClaim,
+  packClaim,
+  unpackClaim
+} from '../utils/claim'
 import {
   NETWORKS,
   NET_BY_CONTRACT,
@@ -71,7 +76,7 @@ class RedemptionModal extends React.Component {
     })
   }
 
-  async sendClaim(recipient, token, clicks, signature) {
+  async sendClaim(recipient, token, clicks, signature, version = 1) {
     token = add0xPrefix(token)
 
     require(recipient, "Missing recipient")
@@ -94,12 +99,20 @@ class RedemptionModal extends React.Component {
 
     //console.log('contractAddress:', contractAddress)
 
-    const checkHash = ethers.utils.solidityKeccak256(
-      ['address', 'bytes32', 'uint256', 'address'],
-      [recipient, token, amount, contractAddress]
-    )
-    // Try and validate the claim before sending a tx
-    const hash = await this.wallet.clickToken.hashClaim(recipient, token, amount)
+    const checkHash = hashClaim({
+      version,
+      recipient,
+      uid: token,
+      amount,
+      contract: contractAddress,
+      chainId: Number(this.props.network)
+    })
+    // Try and validate the claim before sending a tx.  Version 2 claims are
+    // EIP-712 digests, signed without the eth_sign prefix.
+    const clickToken = this.wallet.clickToken
+    const hash = version === 2 ?
+      await clickToken.hashClaimPacked(recipient, token, amount) :
+      await clickToken.hashClaim(recipient, token, amount)
     
     /*console.log('hash:', hash)
     console.log('checkHash:', checkHash)*/
@@ -110,7 +123,9 @@ class RedemptionModal extends React.Component {
       throw new Error(`Hash verificaiton failed!  ${hash} != ${checkHash}`)
     }
 
-    const recoveredSigner = await this.wallet.clickToken.checkClaim(hash, signature)
+    const recoveredSigner = version === 2 ?
+      await clickToken['recoverSigner(bytes32,bytes)'](hash, signature) :
+      await clickToken.checkClaim(hash, signature)
 
     console.debug('recoveredSigner:', recoveredSigner)
     console.debug('signers:', SIGNERS[this.props.network])
@@ -126,12 +141,21 @@ class RedemptionModal extends React.Component {
       throw new Error(errMsg)
     }
 
-    // claim(address,bytes32,uint256,bytes)
-    const method = this.wallet.clickToken['claim(address,bytes32,uint256,bytes)']
+    let method, args
+    if (version === 2) {
+      // claimTyped(address,bytes32,uint256,bytes32,bytes32)
+      const { r, vs } = compactSignature(signature)
+      method = clickToken.claimTyped
+      args = [recipient, token, amount, r, vs]
+    } else {
+      // claim(address,bytes32,uint256,bytes)
+      method = clickToken['claim(address,bytes32,uint256,bytes)']
+      args = [recipient, token, amount, signature]
+    }
 
     let tx
     try {
-      tx = await method(recipient, token, amount, signature, {
+      tx = await method(...args, {
         gasLimit: 100000
       })
     } catch (err) {
@@ -244,7 +268,8 @@ class RedemptionModal extends React.Component {
                       this.state.recipient,
                       claims[k].token,
                       claims[k].clicks,
-                      claims[k].signature
+                      claims[k].signature,
+                      claims[k].version
                     )
                   }}
                 >
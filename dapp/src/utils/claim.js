@@ -1,6 +1,80 @@
+import { ethers } from 'ethers'
+
 const { remove0xPrefix } = require('./hex')
 const { SIGNER_URL } = process.env
 
+const {
+  arrayify,
+  defaultAbiCoder,
+  hexlify,
+  id,
+  keccak256,
+  solidityKeccak256,
+  splitSignature
+} = ethers.utils
+
+// Version 1 claims sign ClickToken.hashClaim() as an eth_sign message,
+// version 2 claims sign the EIP-712 digest from hashClaimPacked()
+export const CLAIM_VERSIONS = [1, 2]
+
+const DOMAIN_TYPEHASH = id(
+  'EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)'
+)
+const CLAIM_TYPEHASH = id('Claim(address recipient,bytes32 uid,uint256 amount)')
+
+// By chain ID and contract
+const domainSeparators = {}
+
+function domainSeparator(chainId, contract) {
+  const key = `${chainId}:${contract.toLowerCase()}`
+  if (!(key in domainSeparators)) {
+    domainSeparators[key] = keccak256(defaultAbiCoder.encode(
+      ['bytes32', 'bytes32', 'bytes32', 'uint256', 'address'],
+      [DOMAIN_TYPEHASH, id('ClickToken'), id('2'), chainId, contract]
+    ))
+  }
+  return domainSeparators[key]
+}
+
+/**
+ * The hash a claim's signature is for, matching ClickToken.hashClaim() for
+ * version 1 and ClickToken.hashClaimPacked() for version 2
+ */
+export function hashClaim({ version, recipient, uid, amount, contract, chainId }) {
+  if (!version || version === 1) {
+    return solidityKeccak256(
+      ['address', 'bytes32', 'uint256', 'address'],
+      [recipient, uid, amount, contract]
+    )
+  }
+
+  if (version === 2) {
+    const structHash = keccak256(defaultAbiCoder.encode(
+      ['bytes32', 'address', 'bytes32', 'uint256'],
+      [CLAIM_TYPEHASH, recipient, uid, amount]
+    ))
+    return solidityKeccak256(
+      ['bytes2', 'bytes32', 'bytes32'],
+      ['0x1901', domainSeparator(chainId, contract), structHash]
+    )
+  }
+
+  throw new Error(`Unknown claim version ${version}`)
+}
+
+/**
+ * Split a 65 byte signature into EIP-2098 r and vs, s with v's parity in the
+ * top bit, as ClickToken.claimTyped() takes it
+ */
+export function compactSignature(signature) {
+  const { r, s, recoveryParam } = splitSignature(signature)
+  const vs = arrayify(s)
+  if (recoveryParam) {
+    vs[0] |= 0x80
+  }
+  return { r, vs: hexlify(vs) }
+}
+
 export async function getClaim(token, recipient, contract) {
   if (!token || !recipient || !contract) {
     console.warn('Missing argument(s) to getClaim')
@@ -32,8 +106,8 @@ function base64ToObject(b) {
   return JSON.parse(atob(b))
 }
 
-export function packClaim({ token, claim, clicks, contract, signature }) {
-  return objectToBase64({ token, claim, clicks, contract, signature })
+export function packClaim({ token, claim, clicks, contract, signature, version }) {
+  return objectToBase64({ token, claim, clicks, contract, signature, version })
 }
 
 export function unpackClaim(packedClaim) {
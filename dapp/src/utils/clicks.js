@@ -30,3 +30,56 @@ export async function sendClick(token) {
 
   return await resp.json()
 }
+
+/**
+ * Send a batch of clicks made since the last flush
+ *
+ * @param token {string} to credit the clicks to
+ * @param timestamps {Array<number>} of each click, in ms
+ */
+export async function sendClicks(token, timestamps) {
+  const url = `${SIGNER_URL}/click`
+  const resp = await fetch(url, {
+    method: 'POST',
+    body: JSON.stringify({
+      token,
+      clicks: timestamps
+    })
+  })
+
+  // Rate limited responses still carry the current count
+  if (!resp.ok && resp.status !== 429) {
+    throw new Error(`Failed to fetch.  Return code ${resp.status} from ${url}`)
+  }
+
+  return await resp.json()
+}
+
+/**
+ * Open a socket the signer pushes a token's click count to as it changes.
+ * Batches of clicks can be sent on it as `{ clicks: timestamps }`.
+ *
+ * @param token {string} to watch
+ * @param onClicks {function} called with each count
+ * @param onReply {function} called with the reply to each batch sent
+ * @returns {WebSocket}
+ */
+export function watchClicks(token, onClicks, onReply) {
+  const url = `${SIGNER_URL.replace(/^http/, 'ws')}/ws/${token}`
+  const socket = new WebSocket(url)
+
+  socket.onmessage = ev => {
+    const msg = JSON.parse(ev.data)
+
+    // Only replies to batches say if they succeeded
+    if (onReply && msg.success !== undefined) {
+      onReply(msg)
+    }
+
+    if (msg.clicks !== null) {
+      onClicks(msg.clicks)
+    }
+  }
+
+  return socket
+}
@@ -0,0 +1,63 @@
+""" Compare the packed claim encoder against web3's solidityKeccak, and
+the version 2 typed claim digest against eth_abi's encoder
+
+    python benchmarks/claim_hash.py
+"""
+import sys
+import json
+import timeit
+from argparse import ArgumentParser
+from secrets import token_hex
+from web3 import Web3
+
+from onclick_signer.claims import (
+    create_claim,
+    create_claim_reference,
+    create_typed_claim,
+    create_typed_claim_reference,
+)
+
+RECIPIENT = Web3.toChecksumAddress('0x3e11d657331c286624826ac797a974777be0e47f')
+CONTRACT = '0xee67A313FA15595cd8D20C018a0d6C3765585589'
+CHAIN_ID = 1
+
+
+def parse_args(argv):
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=20000,
+                        help='Claims to hash per implementation')
+    return parser.parse_args(argv)
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    uid = '0x' + token_hex(32)
+    amount = 1234 * int(1e18)
+    results = {}
+
+    for name, fn, extra in (
+        ('solidityKeccak', create_claim_reference, ()),
+        ('packed', create_claim, ()),
+        ('typed_reference', create_typed_claim_reference, (CHAIN_ID,)),
+        ('typed', create_typed_claim, (CHAIN_ID,)),
+    ):
+        seconds = timeit.timeit(
+            lambda: fn(RECIPIENT, uid, amount, CONTRACT, *extra),
+            number=args.number
+        )
+        results[name] = {'us_per_claim': seconds / args.number * 1e6}
+
+    results['speedup'] = (
+        results['solidityKeccak']['us_per_claim']
+        / results['packed']['us_per_claim']
+    )
+    results['typed_speedup'] = (
+        results['typed_reference']['us_per_claim']
+        / results['typed']['us_per_claim']
+    )
+
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
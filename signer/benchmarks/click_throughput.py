@@ -0,0 +1,61 @@
+""" Measure /click throughput of a running signer
+
+Run the signer with different worker counts and compare, e.g.:
+
+    ocsigner -p 8888 -w 1 &
+    python benchmarks/click_throughput.py http://localhost:8888
+
+Every request creates a new token, since existing tokens (and the client IP)
+are rate limited.
+"""
+import sys
+import time
+import json
+from argparse import ArgumentParser
+from tornado.gen import multi
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+
+
+def parse_args(argv):
+    parser = ArgumentParser()
+    parser.add_argument('url', help='Base URL of the signer')
+    parser.add_argument('-c', '--concurrency', type=int, default=64,
+                        help='Requests in flight')
+    parser.add_argument('-d', '--duration', type=float, default=10,
+                        help='Seconds to run for')
+    return parser.parse_args(argv)
+
+
+async def bench(url, concurrency, duration):
+    AsyncHTTPClient.configure(None, max_clients=concurrency)
+    client = AsyncHTTPClient()
+    deadline = time.monotonic() + duration
+    counts = {'ok': 0, 'failed': 0}
+
+    async def worker():
+        while time.monotonic() < deadline:
+            response = await client.fetch(HTTPRequest(
+                url='{}/click'.format(url.rstrip('/')),
+                method='POST',
+                body='{}',
+            ), raise_error=False)
+            counts['ok' if response.code == 200 else 'failed'] += 1
+
+    start = time.monotonic()
+    await multi([worker() for _ in range(concurrency)])
+    elapsed = time.monotonic() - start
+
+    return dict(counts, seconds=elapsed, per_second=counts['ok'] / elapsed)
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    result = IOLoop.current().run_sync(
+        lambda: bench(args.url, args.concurrency, args.duration)
+    )
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+""" Compare the JSON work /click and /claim do per request, by backend
+
+    python benchmarks/json_cpu.py
+
+Each request parses and checks the request body, and serializes the
+response, like the handlers do.  Prints JSON with CPU microseconds per
+request for each backend installed.
+"""
+import sys
+import json
+import time
+from argparse import ArgumentParser
+from secrets import token_hex
+
+from onclick_signer.serialize import (
+    JSONSerializer,
+    OrjsonSerializer,
+    orjson,
+    parse_body,
+)
+from onclick_signer.web import CLAIM_SCHEMA, CLICK_SCHEMA
+
+TOKEN = token_hex(32)
+CONTRACT = '0xee67A313FA15595cd8D20C018a0d6C3765585589'
+RECIPIENT = '0x3E11d657331C286624826aC797a974777bE0e47F'
+
+REQUESTS = {
+    'click': (
+        CLICK_SCHEMA,
+        json.dumps({
+            'token': TOKEN,
+            'clicks': [1600000000000 + i * 250 for i in range(40)],
+        }).encode('utf-8'),
+        {
+            'success': True,
+            'clicks': 1234,
+            'token': TOKEN,
+            'accepted': 40,
+        },
+    ),
+    'claim': (
+        CLAIM_SCHEMA,
+        json.dumps({
+            'token': TOKEN,
+            'contract': CONTRACT,
+            'recipient': RECIPIENT,
+        }).encode('utf-8'),
+        {
+            'success': True,
+            'clicks': 1234,
+            'token': TOKEN,
+            'claim': '0x' + token_hex(32),
+            'signature': '0x' + token_hex(65),
+            'contract': CONTRACT,
+        },
+    ),
+}
+
+
+def parse_args(argv):
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--number', type=int, default=100000,
+                        help='Requests per endpoint and backend')
+    return parser.parse_args(argv)
+
+
+def cpu_per_request(serializer, schema, body, response, number):
+    start = time.process_time()
+    for _ in range(number):
+        parse_body(serializer, body, schema, 16 * 1024)
+        serializer.dumps(response)
+    return (time.process_time() - start) / number * 1e6
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    serializers = [JSONSerializer()]
+    if orjson is not None:
+        serializers.append(OrjsonSerializer())
+
+    result = {}
+    for endpoint, (schema, body, response) in REQUESTS.items():
+        result[endpoint] = {
+            serializer.name: cpu_per_request(
+                serializer,
+                schema,
+                body,
+                response,
+                args.number
+            )
+            for serializer in serializers
+        }
+
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
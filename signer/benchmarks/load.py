@@ -0,0 +1,281 @@
+""" Load test the signer with a mix of /click, /clicks/<token> and /claim
+
+    python benchmarks/load.py --mix click=8,clicks=4,claim=1 -c 64 -d 10
+    python benchmarks/load.py --redis memory
+    python benchmarks/load.py --url http://localhost:8888 --pid <signer pid>
+
+By default make_app() runs in this process, listening on a loopback socket,
+with Redis at REDIS_HOST.  Rate limits are off so every click counts, and
+-o key=value overrides any other config, e.g. -o click_aggregation=true.
+--redis memory uses the in-memory Redis backend, so nothing else needs to
+be running, though the numbers are then mostly the backend's.  In process, CPU
+includes the load generator's own.
+
+--url drives a signer that's already running, with its own config.  Give
+its --pid to report its CPU.
+
+Requests go to --tokens tokens created up front, chosen at random.  Prints
+JSON with requests per second, latency percentiles and response codes,
+overall and per endpoint, CPU per request overall, and the commit
+benchmarked so results can be compared across commits.
+"""
+import os
+import sys
+import time
+import json
+import random
+import logging
+import subprocess
+from argparse import ArgumentParser
+from tornado.gen import multi, sleep
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.testing import bind_unused_port
+
+CONTRACT = '0xee67A313FA15595cd8D20C018a0d6C3765585589'
+RECIPIENT = '0x3e11d657331c286624826ac797a974777be0e47f'
+ENDPOINTS = ('click', 'clicks', 'claim')
+
+
+def parse_mix(value):
+    """ click=8,clicks=4,claim=1 -> {'click': 8, 'clicks': 4, 'claim': 1} """
+    mix = {}
+    for part in value.split(','):
+        endpoint, weight = part.split('=')
+        if endpoint not in ENDPOINTS:
+            raise ValueError('Unknown endpoint {}'.format(endpoint))
+        mix[endpoint] = float(weight)
+    return mix
+
+
+def parse_override(value):
+    key, value = value.split('=', 1)
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def parse_args(argv):
+    parser = ArgumentParser()
+    parser.add_argument('--url', help='Base URL of a running signer')
+    parser.add_argument('--pid', type=int, help='Signer process to measure')
+    parser.add_argument('--redis', choices=('redis', 'memory'),
+                        default='redis',
+                        help='Redis backend for the signer run in process')
+    parser.add_argument('-o', '--override', type=parse_override,
+                        action='append', default=[], metavar='KEY=VALUE',
+                        help='Config for the signer run in process')
+    parser.add_argument('-m', '--mix', type=parse_mix,
+                        default='click=8,clicks=4,claim=1',
+                        help='Weight of each endpoint')
+    parser.add_argument('-c', '--concurrency', type=int, default=64,
+                        help='Requests in flight')
+    parser.add_argument('-d', '--duration', type=float, default=10,
+                        help='Seconds to measure for')
+    parser.add_argument('-w', '--warmup', type=float, default=1,
+                        help='Seconds to run before measuring')
+    parser.add_argument('-t', '--tokens', type=int, default=100,
+                        help='Tokens to spread requests over')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def cpu_seconds(pid):
+    """ User and system CPU time of a process, from /proc """
+    with open('/proc/{}/stat'.format(pid)) as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def merge_codes(codes):
+    merged = {}
+    for counts in codes:
+        for code, count in counts.items():
+            merged[code] = merged.get(code, 0) + count
+    return merged
+
+
+def summarize(latencies, codes, seconds, cpu):
+    ordered = sorted(latencies)
+    count = len(ordered)
+    result = {
+        'requests': count,
+        'codes': codes,
+        'per_second': count / seconds,
+        'latency_ms': {
+            'p50': percentile(ordered, 50),
+            'p95': percentile(ordered, 95),
+            'p99': percentile(ordered, 99),
+        },
+    }
+    if cpu is not None and count:
+        result['cpu_us_per_request'] = cpu / count * 1e6
+    return result
+
+
+def start_signer(redis, overrides):
+    """ Run make_app() in this process on a loopback port
+
+    :returns: base URL
+    """
+    from onclick_signer.web import make_app
+
+    # Logging each request would be most of the work
+    logging.basicConfig(level=logging.ERROR)
+
+    config = {
+        'redis_backend': redis,
+        'token_click_interval_ms': 0,
+        'ip_click_interval_ms': 0,
+    }
+    config.update(overrides)
+
+    sock, port = bind_unused_port()
+    HTTPServer(make_app(config)).add_sockets([sock])
+    return 'http://127.0.0.1:{}'.format(port)
+
+
+async def bench(url, mix, concurrency, duration, warmup, tokens, seed,
+                cpu):
+    AsyncHTTPClient.configure(None, max_clients=concurrency)
+    client = AsyncHTTPClient()
+    rand = random.Random(seed)
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    latencies = {e: [] for e in endpoints}
+    # Responses by status, so rate limited clicks can be told apart
+    codes = {e: {} for e in endpoints}
+
+    def request(endpoint, token):
+        if endpoint == 'clicks':
+            return HTTPRequest(url='{}/clicks/{}'.format(url, token))
+        if endpoint == 'click':
+            body = {'token': token}
+        else:
+            body = {
+                'token': token,
+                'contract': CONTRACT,
+                'recipient': RECIPIENT,
+            }
+        return HTTPRequest(
+            url='{}/{}'.format(url, endpoint),
+            method='POST',
+            body=json.dumps(body),
+            headers={'Content-Type': 'application/json'},
+        )
+
+    async def create_token():
+        response = await client.fetch(request('click', None))
+        return json.loads(response.body)['token']
+
+    async def worker(measure_from, deadline):
+        while True:
+            endpoint = rand.choices(endpoints, weights)[0]
+            req = request(endpoint, rand.choice(created))
+
+            start = time.monotonic()
+            if start >= deadline:
+                return
+            response = await client.fetch(req, raise_error=False)
+            end = time.monotonic()
+
+            if start < measure_from:
+                continue
+            counts = codes[endpoint]
+            counts[response.code] = counts.get(response.code, 0) + 1
+            # 599 is a connection error or timeout
+            if response.code != 599:
+                latencies[endpoint].append((end - start) * 1000)
+
+    created = await multi([create_token() for _ in range(tokens)])
+
+    measure_from = time.monotonic() + warmup
+    deadline = measure_from + duration
+    workers = multi([
+        worker(measure_from, deadline) for _ in range(concurrency)
+    ])
+
+    await sleep(max(0, measure_from - time.monotonic()))
+    cpu_start = cpu()
+    await workers
+    seconds = time.monotonic() - measure_from
+    cpu_used = cpu() - cpu_start if cpu_start is not None else None
+
+    result = summarize(
+        [ms for endpoint in endpoints for ms in latencies[endpoint]],
+        merge_codes(codes.values()),
+        seconds,
+        cpu_used
+    )
+    result.update(
+        seconds=seconds,
+        cpu_seconds=cpu_used,
+        endpoints={
+            endpoint: summarize(
+                latencies[endpoint],
+                codes[endpoint],
+                seconds,
+                # CPU isn't attributed to endpoints
+                None
+            )
+            for endpoint in endpoints
+        },
+    )
+    return result
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+
+    if args.url:
+        url = args.url.rstrip('/')
+        pid = args.pid
+    else:
+        url = start_signer(args.redis, dict(args.override))
+        pid = os.getpid()
+
+    def cpu():
+        return cpu_seconds(pid) if pid else None
+
+    result = IOLoop.current().run_sync(lambda: bench(
+        url,
+        args.mix,
+        args.concurrency,
+        args.duration,
+        args.warmup,
+        args.tokens,
+        args.seed,
+        cpu
+    ))
+    result.update(
+        commit=current_commit(),
+        target=args.url or 'in-process',
+        redis=None if args.url else args.redis,
+        mix=args.mix,
+        concurrency=args.concurrency,
+    )
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+""" Measure WebSocket messages per second through a running signer
+
+Run a single worker so the result is per core, e.g.:
+
+    ocsigner -p 8888 -w 1 --rate-limiter memory &
+    python benchmarks/ws_messages.py http://localhost:8888 --pid $!
+
+Each token gets one socket sending clicks as fast as replies come back, and
+some sockets watching for pushed counts.  Most clicks are rate limited, but
+every one is still a message in and a reply out.  With --pid, the signer's
+CPU time is read from /proc to give messages per CPU second.
+"""
+import os
+import sys
+import time
+import json
+from argparse import ArgumentParser
+from tornado.gen import multi
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+from tornado.websocket import websocket_connect
+
+
+def parse_args(argv):
+    parser = ArgumentParser()
+    parser.add_argument('url', help='Base URL of the signer')
+    parser.add_argument('-t', '--tokens', type=int, default=20,
+                        help='Tokens, each with one clicking socket')
+    parser.add_argument('-s', '--subscribers', type=int, default=10,
+                        help='Watching sockets per token')
+    parser.add_argument('-d', '--duration', type=float, default=10,
+                        help='Seconds to run for')
+    parser.add_argument('--pid', type=int, help='Signer process to measure')
+    return parser.parse_args(argv)
+
+
+def cpu_seconds(pid):
+    """ User and system CPU time of a process, from /proc """
+    with open('/proc/{}/stat'.format(pid)) as stat:
+        fields = stat.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+async def bench(url, tokens, subscribers, duration, pid=None):
+    url = url.rstrip('/')
+    ws_url = url.replace('http', 'ws', 1)
+    client = AsyncHTTPClient()
+    counts = {'replies': 0, 'pushes': 0}
+
+    async def create_token():
+        response = await client.fetch(HTTPRequest(
+            url='{}/click'.format(url),
+            method='POST',
+            body='{}',
+        ))
+        return json.loads(response.body)['token']
+
+    async def clicker(token, deadline):
+        conn = await websocket_connect('{}/ws/{}'.format(ws_url, token))
+        await conn.read_message()
+        while time.monotonic() < deadline:
+            conn.write_message('{}')
+            # Counts from accepted clicks are pushed here too
+            while True:
+                message = await conn.read_message()
+                if message is None:
+                    return
+                if 'success' in json.loads(message):
+                    break
+                counts['pushes'] += 1
+            counts['replies'] += 1
+        conn.close()
+
+    async def watch(token):
+        conn = await websocket_connect('{}/ws/{}'.format(ws_url, token))
+        await conn.read_message()
+        return conn
+
+    async def count_pushes(conn):
+        while await conn.read_message() is not None:
+            counts['pushes'] += 1
+
+    created = await multi([create_token() for _ in range(tokens)])
+    watchers = await multi([
+        watch(token) for token in created for _ in range(subscribers)
+    ])
+    reading = multi([count_pushes(conn) for conn in watchers])
+
+    cpu_start = cpu_seconds(pid) if pid else None
+    start = time.monotonic()
+    deadline = start + duration
+
+    await multi([clicker(token, deadline) for token in created])
+    elapsed = time.monotonic() - start
+
+    for conn in watchers:
+        conn.close()
+    await reading
+
+    # Every reply answers a click message
+    messages = counts['replies'] * 2 + counts['pushes']
+    result = dict(
+        counts,
+        messages=messages,
+        seconds=elapsed,
+        per_second=messages / elapsed,
+    )
+    if pid:
+        cpu = cpu_seconds(pid) - cpu_start
+        result.update(cpu_seconds=cpu, per_cpu_second=messages / cpu)
+    return result
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    result = IOLoop.current().run_sync(lambda: bench(
+        args.url,
+        args.tokens,
+        args.subscribers,
+        args.duration,
+        args.pid
+    ))
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+import time
+import asyncio
+import logging
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from onclick_signer.layout import FlatLayout, get_counter_layout
+from onclick_signer.metrics import REDIS_SECONDS
+from onclick_signer.push import CHANNEL_PREFIX
+
+log = logging.getLogger().getChild('aggregator')
+
+# KEYS: rate keys
+# ARGV: ms of the last click accepted for each key, then ms to keep them
+#
+# Keys are only moved forward, since another process may have marked them
+# since.
+MARK_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    local last = redis.call('GET', key)
+    if not last or tonumber(last) < tonumber(ARGV[i]) then
+        redis.call('SET', key, ARGV[i], 'PX', ARGV[#ARGV])
+    end
+end
+"""
+
+
+class ClickAggregator:
+    """ Collects click increments in memory and writes them to Redis in
+    pipelined batches
+
+    Pending clicks are flushed every interval_ms, or as soon as max_pending
+    clicks are waiting, so at most one interval of clicks is lost if the
+    process dies.  stop() flushes whatever is left.
+
+    Clicks being written still count as pending until the write returns, and
+    only one flush runs at a time.  A count read from Redis while a token's
+    clicks are being written may or may not include them, so readers check
+    settled() afterwards, see ClickStore.get_clicks().
+
+    Clicks counted without running ClickStore's click script have their rate
+    keys marked with mark(), and written with the next flush.
+
+    :param redis: client
+    :param interval_ms: longest clicks wait before being written
+    :param max_pending: clicks to hold before flushing early
+    :param layout: of the counters, FlatLayout by default
+    :param publish: if the new counts of the tokens written are published
+        for ClickHub, in one more pipeline per flush
+    """
+    def __init__(self, redis, interval_ms=50, max_pending=1000, layout=None,
+                 publish=False):
+        self.redis = redis
+        self.layout = layout or FlatLayout()
+        self.publish = publish
+        self.interval_ms = interval_ms
+        self.max_pending = max_pending
+        # token -> clicks not yet written
+        self._pending = {}
+        self._pending_clicks = 0
+        # token -> clicks being written by the running flush
+        self._flushing = {}
+        # rate key -> ms of the last click, and ms to keep the key
+        self._marks = {}
+        # Incremented as each flush finishes, whether it succeeded or not
+        self.generation = 0
+        self._lock = asyncio.Lock()
+        self._callback = None
+        self.stats = {
+            'flushes': 0,
+            'clicks': 0,
+            'writes': 0,
+            'errors': 0,
+        }
+
+    def start(self):
+        self._callback = PeriodicCallback(self.flush, self.interval_ms)
+        self._callback.start()
+
+    async def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+        await self.flush()
+
+    def pending(self, token):
+        """ Clicks for a token not yet written, including any being written """
+        return self._pending.get(token, 0) + self._flushing.get(token, 0)
+
+    def settled(self, token, generation):
+        """ If a count read from Redis since generation can be added to
+        pending(), because no write of the token's clicks ran meanwhile
+        """
+        return generation == self.generation and token not in self._flushing
+
+    def marked(self, keys):
+        """ If any of the rate keys have marks not yet written """
+        return any(key in self._marks for key in keys)
+
+    def mark(self, keys, now_ms, retention_ms):
+        """ Queue rate keys to be set to now_ms, like the click script would """
+        for key in keys:
+            self._marks[key] = (now_ms, retention_ms)
+
+    async def wait(self):
+        """ Wait for any running flush to finish """
+        async with self._lock:
+            pass
+
+    def add(self, token, clicks):
+        """ Queue clicks for a token
+
+        :returns: clicks pending for the token
+        """
+        self._pending[token] = self._pending.get(token, 0) + clicks
+        self._pending_clicks += clicks
+
+        if self._pending_clicks >= self.max_pending:
+            IOLoop.current().add_callback(self.flush)
+
+        return self.pending(token)
+
+    async def flush(self):
+        """ Write all pending clicks with one pipelined increment per token,
+        after any flush already running
+        """
+        if not self._pending and not self._marks and not self._lock.locked():
+            return
+
+        async with self._lock:
+            if not self._pending and not self._marks:
+                return
+
+            batch = self._flushing = self._pending
+            marks = self._marks
+            self._pending = {}
+            self._pending_clicks = 0
+            self._marks = {}
+
+            try:
+                await self._write(batch, marks)
+            finally:
+                self._flushing = {}
+                self.generation += 1
+
+    async def _write(self, batch, marks):
+        pipe = self.redis.pipeline(transaction=False)
+        # Where each token's new count is in the results
+        counts = {}
+        for token, clicks in batch.items():
+            counts[token] = len(pipe)
+            self.layout.incrby(pipe, token, clicks)
+        if marks:
+            # EVAL rather than a registered script, which would cost the
+            # pipeline a SCRIPT EXISTS round trip
+            keys = list(marks)
+            pipe.eval(
+                MARK_SCRIPT,
+                len(keys),
+                *keys,
+                *[marks[key][0] for key in keys],
+                max(retention for _, retention in marks.values())
+            )
+
+        start = time.perf_counter()
+        try:
+            results = await pipe.execute()
+            REDIS_SECONDS.observe(time.perf_counter() - start, 'flush')
+        except Exception:
+            log.exception('Failed to write %d tokens', len(batch))
+            self.stats['errors'] += 1
+
+            # Keep them for the next flush
+            for token, clicks in batch.items():
+                self._pending[token] = self._pending.get(token, 0) + clicks
+                self._pending_clicks += clicks
+            for key, mark in marks.items():
+                self._marks.setdefault(key, mark)
+            return
+
+        self.stats['flushes'] += 1
+        self.stats['writes'] += len(batch)
+        self.stats['clicks'] += sum(batch.values())
+
+        if self.publish and batch:
+            await self._publish({
+                token: int(results[i]) + self._pending.get(token, 0)
+                for token, i in counts.items()
+            })
+
+    async def _publish(self, counts):
+        """ Publish the counts of the tokens written.  A failure is logged
+        rather than raised, since the clicks have been written.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for token, clicks in counts.items():
+            pipe.publish(CHANNEL_PREFIX + token, clicks)
+        try:
+            await pipe.execute()
+        except Exception:
+            log.exception('Failed to publish clicks for %d tokens', len(counts))
+
+    def metrics(self):
+        return dict(
+            self.stats,
+            pending_tokens=len(self._pending),
+            pending_clicks=self._pending_clicks,
+            flushing_tokens=len(self._flushing)
+        )
+
+
+def get_click_aggregator(config, redis):
+    """ Create and start a click aggregator, if enabled by config """
+    if not config['click_aggregation']:
+        return None
+
+    aggregator = ClickAggregator(
+        redis,
+        interval_ms=config['click_flush_interval_ms'],
+        max_pending=config['click_flush_max_pending'],
+        layout=get_counter_layout(config),
+        publish=True,
+    )
+    aggregator.start()
+    return aggregator
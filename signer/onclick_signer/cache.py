@@ -0,0 +1,172 @@
+import time
+from collections import OrderedDict
+from hexbytes import HexBytes
+
+from onclick_signer.clock import Clock
+from onclick_signer.layout import FlatLayout, get_counter_layout
+from onclick_signer.metrics import REDIS_SECONDS
+
+CLAIM_PREFIX = 'claim:'
+
+
+class ClaimCache:
+    """ Signed claims, so repeated claim requests skip re-signing
+
+    Claims are stored in a Redis hash per token, keyed by recipient and
+    contract, with an in-process LRU in front.  Every entry records the click
+    count it was signed for, and is ignored once the count changes, so clicks
+    invalidate it without any extra writes.
+
+    :param redis: client, also used to read click counts
+    :param ttl: seconds to keep a token's claims in Redis
+    :param size: entries in the in-process LRU
+    :param layout: of the counters, FlatLayout by default
+    :param version: of the claims signed, so claims signed for another
+        version aren't reused
+    """
+    def __init__(self, redis, ttl, size, layout=None, version=1):
+        self.redis = redis
+        # Version 1 claims are keyed as they were before versions
+        self.field = '{}:{}' if version == 1 else '{}:{}:v' + str(version)
+        self.layout = layout or FlatLayout()
+        self.ttl = int(ttl)
+        self.size = size
+        self._lru = OrderedDict()
+        self.stats = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'misses': 0,
+        }
+
+    def _local(self, key, clicks):
+        entry = self._lru.get(key)
+        if entry is not None and entry[0] == clicks:
+            self._lru.move_to_end(key)
+            return entry[1:]
+        return None
+
+    def _remember(self, key, clicks, claim, signature):
+        self._lru[key] = (clicks, claim, signature)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.size:
+            self._lru.popitem(last=False)
+
+    async def lookup_many(self, requests):
+        """ Click counts and any cached claims, in one round trip
+
+        :param requests: list of (token, recipient, contract)
+        :returns: list of (clicks, (claim, signature) or None)
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for token, recipient, contract in requests:
+            self.layout.get(pipe, token)
+            pipe.hget(CLAIM_PREFIX + token, self.field.format(recipient, contract))
+        start = time.perf_counter()
+        values = await pipe.execute()
+        REDIS_SECONDS.observe(time.perf_counter() - start, 'claim_lookup')
+
+        results = []
+        for i, key in enumerate(requests):
+            clicks = int(values[i * 2] or 0)
+            cached = self._local(key, clicks) if clicks else None
+
+            if cached is not None:
+                self.stats['local_hits'] += 1
+            elif clicks and values[i * 2 + 1]:
+                stored_clicks, claim, signature = (
+                    values[i * 2 + 1].decode('utf-8').split(':')
+                )
+                if int(stored_clicks) == clicks:
+                    cached = (HexBytes(claim), HexBytes(signature))
+                    self._remember(key, clicks, *cached)
+                    self.stats['redis_hits'] += 1
+
+            if clicks and cached is None:
+                self.stats['misses'] += 1
+
+            results.append((clicks, cached))
+
+        return results
+
+    async def store_many(self, claims):
+        """ Cache signed claims
+
+        :param claims: list of (token, recipient, contract, clicks, claim,
+            signature)
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for token, recipient, contract, clicks, claim, signature in claims:
+            self._remember((token, recipient, contract), clicks, claim, signature)
+            pipe.hset(
+                CLAIM_PREFIX + token,
+                self.field.format(recipient, contract),
+                '{}:{}:{}'.format(clicks, claim.hex(), signature.hex())
+            )
+            pipe.expire(CLAIM_PREFIX + token, self.ttl)
+        await pipe.execute()
+
+    def metrics(self):
+        return dict(self.stats, local_entries=len(self._lru))
+
+
+class CountCache:
+    """ Recently read click counts, so polling doesn't hit Redis every time
+
+    Counts are kept for ttl_ms, and clicks handled by this process drop
+    them right away.  Clicks handled by other processes show up once the
+    entry expires.
+
+    :param ttl_ms: longest a count is served from memory
+    :param size: most entries kept
+    :param clock: Clock the entries expire by
+    """
+    def __init__(self, ttl_ms, size, clock=None):
+        self.ttl = ttl_ms / 1000
+        self.size = size
+        self.clock = clock or Clock()
+        # token -> (expiry, clicks), in expiry order
+        self._entries = OrderedDict()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+        }
+
+    def get(self, token):
+        entry = self._entries.get(token)
+        if entry is not None and entry[0] > self.clock.monotonic():
+            self.stats['hits'] += 1
+            return entry[1]
+        self.stats['misses'] += 1
+        return None
+
+    def set(self, token, clicks):
+        if self.ttl <= 0:
+            return
+        self._entries[token] = (self.clock.monotonic() + self.ttl, clicks)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        self._entries.pop(token, None)
+
+    def metrics(self):
+        return dict(self.stats, entries=len(self._entries))
+
+
+def get_count_cache(config, clock=None):
+    return CountCache(
+        config['clicks_cache_ms'],
+        config['clicks_cache_size'],
+        clock
+    )
+
+
+def get_claim_cache(config, redis):
+    return ClaimCache(
+        redis,
+        config['claim_cache_ttl'],
+        config['claim_cache_size'],
+        layout=get_counter_layout(config),
+        version=config['claim_version']
+    )
@@ -0,0 +1,160 @@
+from functools import lru_cache
+from eth_abi import encode_abi
+from eth_hash.auto import keccak
+from eth_utils.address import to_canonical_address
+from eth_utils.hexadecimal import add_0x_prefix, decode_hex
+from hexbytes import HexBytes
+from web3 import Web3
+
+from onclick_signer.signer import get_signer
+
+# Same prefix as ClickToken.prefixHash() and defunct_hash_message()
+SIGNED_MESSAGE_PREFIX = b'\x19Ethereum Signed Message:\n32'
+
+# 1 signs ClickToken.hashClaim() as an eth_sign message, 2 signs the EIP-712
+# digest from ClickToken.hashClaimPacked()
+CLAIM_VERSIONS = (1, 2)
+
+DOMAIN_TYPEHASH = keccak(
+    b'EIP712Domain(string name,string version,uint256 chainId,'
+    b'address verifyingContract)'
+)
+CLAIM_TYPEHASH = keccak(b'Claim(address recipient,bytes32 uid,uint256 amount)')
+DOMAIN_NAME_HASH = keccak(b'ClickToken')
+DOMAIN_VERSION_HASH = keccak(b'2')
+TYPED_DATA_PREFIX = b'\x19\x01'
+
+
+@lru_cache(maxsize=64)
+def _address_bytes(address):
+    return to_canonical_address(address)
+
+
+def create_claim_reference(recipient, uid, amount, contract_address):
+    """ The claim hash using web3's generic solidityKeccak.  Kept to check
+    create_claim() against.
+    """
+    return Web3.solidityKeccak(
+        ['address', 'bytes32', 'uint256', 'address'],
+        [recipient, uid, amount, contract_address]
+    )
+
+
+def create_claim(recipient, uid, amount, contract_address):
+    """ The claim hash, matching ClickToken.hashClaim()
+
+    Packs address(20) ‖ bytes32 ‖ uint256 ‖ address(20) directly instead of
+    going through solidityKeccak's ABI type handling.  The contract address
+    is the same for nearly every claim, so its bytes are cached.
+    """
+    if isinstance(uid, str):
+        uid = decode_hex(uid)
+    if len(uid) != 32:
+        raise ValueError('uid must be 32 bytes')
+
+    return HexBytes(keccak(
+        to_canonical_address(recipient)
+        + uid
+        + amount.to_bytes(32, 'big')
+        + _address_bytes(contract_address)
+    ))
+
+
+@lru_cache(maxsize=64)
+def domain_separator(contract_address, chain_id):
+    """ Same as ClickToken.domainSeparator() """
+    return keccak(
+        DOMAIN_TYPEHASH
+        + DOMAIN_NAME_HASH
+        + DOMAIN_VERSION_HASH
+        + chain_id.to_bytes(32, 'big')
+        + _address_bytes(contract_address).rjust(32, b'\0')
+    )
+
+
+def create_typed_claim_reference(recipient, uid, amount, contract_address,
+                                 chain_id):
+    """ The typed claim digest using eth_abi's generic encoder, with nothing
+    cached.  Kept to check create_typed_claim() against.
+    """
+    domain = keccak(encode_abi(
+        ['bytes32', 'bytes32', 'bytes32', 'uint256', 'address'],
+        [
+            DOMAIN_TYPEHASH,
+            DOMAIN_NAME_HASH,
+            DOMAIN_VERSION_HASH,
+            chain_id,
+            contract_address,
+        ]
+    ))
+    struct_hash = keccak(encode_abi(
+        ['bytes32', 'address', 'bytes32', 'uint256'],
+        [CLAIM_TYPEHASH, recipient, HexBytes(uid), amount]
+    ))
+    return Web3.solidityKeccak(
+        ['bytes2', 'bytes32', 'bytes32'],
+        [TYPED_DATA_PREFIX, domain, struct_hash]
+    )
+
+
+def create_typed_claim(recipient, uid, amount, contract_address, chain_id):
+    """ The EIP-712 claim digest, matching ClickToken.hashClaimPacked()
+
+    The domain separator only depends on the contract and chain, so it's
+    cached like the contract address is for create_claim().
+    """
+    if isinstance(uid, str):
+        uid = decode_hex(uid)
+    if len(uid) != 32:
+        raise ValueError('uid must be 32 bytes')
+
+    struct_hash = keccak(
+        CLAIM_TYPEHASH
+        + to_canonical_address(recipient).rjust(32, b'\0')
+        + uid
+        + amount.to_bytes(32, 'big')
+    )
+    return HexBytes(keccak(
+        TYPED_DATA_PREFIX
+        + domain_separator(contract_address, chain_id)
+        + struct_hash
+    ))
+
+
+def prefix_hash(message_hash):
+    """ Same as ClickToken.prefixHash() """
+    return HexBytes(keccak(SIGNED_MESSAGE_PREFIX + message_hash))
+
+
+def sign_claim(signer, recipient, token, clicks, contract, version=1,
+               chain_id=1):
+    """ Assemble and sign a claim for a token's clicks
+
+    :param version: of the claim, from CLAIM_VERSIONS
+    :param chain_id: of the contract, for version 2 claims
+    :returns: tuple of (claim hash or digest, signature)
+    """
+    uid = add_0x_prefix(token)
+    amount = clicks * int(1e18)
+
+    if version == 2:
+        claim = create_typed_claim(recipient, uid, amount, contract, chain_id)
+        # The digest is signed as is
+        signed = signer.sign_hash(claim)
+    else:
+        claim = create_claim(recipient, uid, amount, contract)
+        # signHash() does not prefix messages, so we're prefixing here
+        signed = signer.sign_hash(prefix_hash(claim))
+
+    return claim, signed.signature
+
+
+def sign_claims(claims, signer=None, version=1, chain_id=1):
+    """ sign_claim() each (recipient, token, clicks, contract) with signer,
+    or this process's signer.  Runs in the signing executor.
+    """
+    signer = signer or get_signer()
+    return [
+        sign_claim(signer, *claim, version=version, chain_id=chain_id)
+        for claim in claims
+    ]
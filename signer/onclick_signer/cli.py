@@ -1,24 +1,70 @@
 import os
 import sys
+import logging
 from getpass import getpass
-import tornado.ioloop
 from argparse import ArgumentParser
-from onclick_signer.web import make_app
+from onclick_signer.server import run
 
 def parse_args(argv):
     parser = ArgumentParser()
     parser.add_argument('-p', '--port', help='Port to listen on', type=int,
                         default=8888)
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='Worker processes to run, 0 for one per CPU')
+    parser.add_argument('--shutdown-timeout', type=float, default=10,
+                        help='Seconds to wait for requests on shutdown')
+    parser.add_argument('--log-level', default='WARNING',
+                        help='Log messages of this level and above')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve /metrics on this port (plus worker number)')
+    parser.add_argument('--redis-backend', choices=('redis', 'memory'),
+                        help='Redis server, or one in each process')
+    parser.add_argument('--redis-host', help='Redis server hostname')
+    parser.add_argument('--redis-port', help='Redis server port', type=int)
+    parser.add_argument('--redis-db', help='Redis database number', type=int)
+    parser.add_argument('--redis-pool-size', type=int,
+                        help='Maximum Redis connections per process')
+    parser.add_argument('--rate-limiter', choices=('redis', 'memory'),
+                        help='Where click rate limits are tracked')
+    parser.add_argument('--token-lock', choices=('redis', 'memory'),
+                        help='Where token locks are held')
+    parser.add_argument('--signing-executor', choices=('thread', 'process'),
+                        help='Pool to sign claims in')
+    parser.add_argument('--signing-workers', type=int,
+                        help='Size of the signing pool')
+    parser.add_argument('--click-aggregation', action='store_const',
+                        const=True, help='Write click counts behind in batches')
+    parser.add_argument('--click-flush-interval', type=int,
+                        help='Most ms clicks are held before being written')
     return parser.parse_args(argv)
 
 def main(argv=sys.argv[1:]):
     args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
 
     # Take passphrase at console instead of using env vars
     if not os.environ.get('ENCRYPTION_PASSPHRASE'):
         decrypt = getpass(prompt="Decrypt passphrase: ")
         os.environ['ENCRYPTION_PASSPHRASE'] = decrypt
 
-    app = make_app()
-    app.listen(args.port)
-    tornado.ioloop.IOLoop.current().start()
+    config = {
+        'metrics_port': args.metrics_port,
+        'redis_backend': args.redis_backend,
+        'redis_host': args.redis_host,
+        'redis_port': args.redis_port,
+        'redis_db': args.redis_db,
+        'redis_pool_size': args.redis_pool_size,
+        'rate_limiter': args.rate_limiter,
+        'token_lock': args.token_lock,
+        'signing_executor': args.signing_executor,
+        'signing_workers': args.signing_workers,
+        'click_aggregation': args.click_aggregation,
+        'click_flush_interval_ms': args.click_flush_interval,
+    }
+
+    run(
+        config,
+        args.port,
+        workers=args.workers,
+        shutdown_timeout=args.shutdown_timeout
+    )
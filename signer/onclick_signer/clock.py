@@ -0,0 +1,35 @@
+import time
+
+
+class Clock:
+    """ The time, for everything that depends on it: rate limits, cache
+    expiry and claimed token retention
+    """
+    def time(self):
+        """ Wall clock seconds, shared with other processes through Redis """
+        return time.time()
+
+    def monotonic(self):
+        """ Seconds for intervals within this process """
+        return time.monotonic()
+
+    def ms(self):
+        return int(self.time() * 1000)
+
+
+class FakeClock(Clock):
+    """ A clock that only moves when told to, for tests
+
+    :param start: wall clock seconds to start at
+    """
+    def __init__(self, start=1600000000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
@@ -0,0 +1,234 @@
+import time
+import logging
+import tornado.gen
+from secrets import token_hex
+from tornado.ioloop import PeriodicCallback
+
+from onclick_signer.clock import Clock
+from onclick_signer.epochs import INCLUDED_KEY
+from onclick_signer.layout import FlatLayout
+from onclick_signer.store import CLAIMED_KEY
+
+# Held by the process compacting, so workers take turns
+COMPACTION_LOCK = 'compaction:lock'
+
+# Remove claimed tokens that haven't been clicked since, along with the
+# clicks their claims kept out of epochs
+#
+# KEYS: claimed set, clicks included in epochs, then each token's counter
+# ARGV: for each token, the claimed member, the token, the clicks claimed,
+#       and the counter's hash field or '' for a string key
+#
+# Returns the number of counters removed
+COMPACT_SCRIPT = """
+local removed = 0
+for i = 3, #KEYS do
+    local member = ARGV[i * 4 - 11]
+    local token = ARGV[i * 4 - 10]
+    local claimed = ARGV[i * 4 - 9]
+    local field = ARGV[i * 4 - 8]
+    local clicks
+    if field == '' then
+        clicks = redis.call('GET', KEYS[i])
+    else
+        clicks = redis.call('HGET', KEYS[i], field)
+    end
+    if clicks == claimed then
+        if field == '' then
+            redis.call('DEL', KEYS[i])
+        else
+            redis.call('HDEL', KEYS[i], field)
+        end
+        redis.call('HDEL', KEYS[2], token)
+        removed = removed + 1
+    end
+    redis.call('ZREM', KEYS[1], member)
+end
+return removed
+"""
+
+log = logging.getLogger().getChild('compaction')
+
+
+class Compactor:
+    """ Reclaims memory from tokens nobody is using, in the background
+
+    Each pass removes claimed tokens whose retention has passed, and when
+    counters have a TTL, gives one to counters that were created without.
+    Work is done in small batches, no faster than rate keys a second, so
+    it doesn't hold up Redis for clicks.  Only one signer process runs a
+    pass at a time.
+
+    :param redis: client
+    :param layout: of the counters
+    :param interval: seconds between passes
+    :param batch: keys per Redis call
+    :param rate: most keys handled per second
+    :param clock: Clock that claimed retention is measured by
+    """
+    def __init__(self, redis, layout=None, interval=300, batch=100, rate=1000,
+                 clock=None):
+        self.redis = redis
+        self.clock = clock or Clock()
+        self.layout = layout or FlatLayout()
+        self.interval = interval
+        self.batch = batch
+        self.rate = rate
+        self.running = False
+        self._callback = None
+        self._compact_script = redis.register_script(COMPACT_SCRIPT)
+        self.stats = {
+            'passes': 0,
+            'scanned': 0,
+            'expiring': 0,
+            'removed': 0,
+        }
+
+    def start(self):
+        self._callback = PeriodicCallback(self.run, self.interval * 1000)
+        self._callback.start()
+
+    def stop(self):
+        if self._callback is not None:
+            self._callback.stop()
+            self._callback = None
+
+    async def _pace(self, keys):
+        await tornado.gen.sleep(keys / self.rate)
+
+    async def run(self):
+        """ Run a pass, unless one is running anywhere already """
+        if self.running:
+            return
+
+        # The lock expires on its own, so passes are at least an interval
+        # apart across all processes
+        if not await self.redis.set(
+            COMPACTION_LOCK,
+            token_hex(8),
+            nx=True,
+            px=self.interval * 1000
+        ):
+            return
+
+        self.running = True
+        start = time.monotonic()
+
+        try:
+            removed = await self.remove_claimed()
+            expiring = await self.expire_counters() if self.layout.ttl_ms else 0
+        except Exception:
+            log.exception('Compaction failed')
+            return
+        finally:
+            self.running = False
+
+        self.stats['passes'] += 1
+
+        log.info(
+            'Compaction removed %d tokens and set %d to expire in %.1fs',
+            removed,
+            expiring,
+            time.monotonic() - start
+        )
+
+    async def remove_claimed(self):
+        """ Remove tokens whose claimed retention has passed
+
+        :returns: number of counters removed
+        """
+        removed = 0
+
+        while True:
+            members = await self.redis.zrangebyscore(
+                CLAIMED_KEY,
+                '-inf',
+                self.clock.ms(),
+                start=0,
+                num=self.batch
+            )
+            if not members:
+                break
+
+            keys = [CLAIMED_KEY, INCLUDED_KEY]
+            args = []
+            for member in members:
+                token, clicks = member.decode('utf-8').rsplit(':', 1)
+                key, field = self.layout.locate(token)
+                keys.append(key)
+                args.extend([member, token, clicks, field or ''])
+
+            count = int(await self._compact_script(keys=keys, args=args))
+            removed += count
+            self.stats['removed'] += count
+            await self._pace(len(members))
+
+        return removed
+
+    def _match(self):
+        if isinstance(self.layout, FlatLayout):
+            # Tokens are 32 bytes of lowercase hex
+            return '[0-9a-f]' * 64
+        return self.layout.namespace + '*'
+
+    async def expire_counters(self):
+        """ Give counters without a TTL one, e.g. from before TTLs were
+        configured
+
+        :returns: number of keys given a TTL
+        """
+        expiring = 0
+        cursor = 0
+
+        while True:
+            cursor, keys = await self.redis.scan(
+                cursor,
+                match=self._match(),
+                count=self.batch
+            )
+            self.stats['scanned'] += len(keys)
+
+            if keys:
+                pipe = self.redis.pipeline(transaction=False)
+                for key in keys:
+                    pipe.pttl(key)
+                ttls = await pipe.execute()
+
+                # -1 is a key without an expiry
+                persistent = [k for k, ttl in zip(keys, ttls) if ttl == -1]
+                if persistent:
+                    pipe = self.redis.pipeline(transaction=False)
+                    for key in persistent:
+                        pipe.pexpire(key, self.layout.ttl_ms)
+                    await pipe.execute()
+                    expiring += len(persistent)
+                    self.stats['expiring'] += len(persistent)
+
+                await self._pace(len(keys))
+
+            if cursor == 0:
+                break
+
+        return expiring
+
+    def metrics(self):
+        return dict(self.stats, running=self.running)
+
+
+def get_compactor(config, redis, layout, clock=None):
+    """ Create and start a compactor, if there's anything for it to do """
+    if not config['compaction_interval'] or not (
+        config['token_ttl'] or config['claimed_token_ttl']
+    ):
+        return None
+
+    compactor = Compactor(
+        redis,
+        layout,
+        interval=config['compaction_interval'],
+        batch=config['compaction_batch'],
+        rate=config['compaction_rate'],
+        clock=clock,
+    )
+    compactor.start()
+    return compactor
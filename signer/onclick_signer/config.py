@@ -0,0 +1,117 @@
+import os
+from datetime import timedelta
+
+MIN_CLICK_DURATION = timedelta(milliseconds=250)
+_MIN_CLICK_MS = int(MIN_CLICK_DURATION.total_seconds() * 1000)
+
+# Defaults can be set with environment variables, and anything given to
+# make_app() or on the command line takes precedence.
+DEFAULTS = {
+    # 'redis', or 'memory' for a Redis in this process, which needs
+    # fakeredis and only suits a single process
+    'redis_backend': os.environ.get('REDIS_BACKEND', 'redis'),
+    'redis_host': os.environ.get('REDIS_HOST', 'localhost'),
+    'redis_port': int(os.environ.get('REDIS_PORT', 6379)),
+    'redis_db': int(os.environ.get('REDIS_DB', 0)),
+    'redis_pool_size': int(os.environ.get('REDIS_POOL_SIZE', 50)),
+    # Port for /metrics, plus the worker number with several workers.  0 to
+    # not serve metrics.
+    'metrics_port': int(os.environ.get('METRICS_PORT', 0)),
+    'metrics_address': os.environ.get('METRICS_ADDRESS', '127.0.0.1'),
+    # Longest /profile on the metrics port, in seconds
+    'profile_max_seconds': int(os.environ.get('PROFILE_MAX_SECONDS', 60)),
+    # Log the stack when the IOLoop is blocked this long.  0 to not check.
+    'blocking_threshold_ms': int(os.environ.get('BLOCKING_THRESHOLD_MS', 100)),
+    # 'redis' is shared by all processes, 'memory' is per-process
+    'rate_limiter': os.environ.get('RATE_LIMITER', 'redis'),
+    'token_click_interval_ms': int(
+        os.environ.get('TOKEN_CLICK_INTERVAL_MS', _MIN_CLICK_MS)
+    ),
+    'ip_click_interval_ms': int(
+        os.environ.get('IP_CLICK_INTERVAL_MS', _MIN_CLICK_MS)
+    ),
+    # 'auto' uses orjson if it's installed, or 'orjson' or 'json'
+    'json_backend': os.environ.get('JSON_BACKEND', 'auto'),
+    # Largest request body accepted, in bytes
+    'max_body_size': int(os.environ.get('MAX_BODY_SIZE', 16 * 1024)),
+    # Most clicks a client can send in one /click request
+    'max_click_batch': int(os.environ.get('MAX_CLICK_BATCH', 40)),
+    'rate_limit_max_entries': int(
+        os.environ.get('RATE_LIMIT_MAX_ENTRIES', 100000)
+    ),
+    # 'redis' is shared by all processes, 'memory' is per-process
+    'token_lock': os.environ.get('TOKEN_LOCK', 'redis'),
+    'token_lock_timeout_ms': int(
+        os.environ.get('TOKEN_LOCK_TIMEOUT_MS', 5000)
+    ),
+    # 'flat' keeps each counter in a key named by its token, 'hash' shards
+    # them into hashes named counter_namespace + the token's first
+    # counter_shard_chars characters
+    'counter_layout': os.environ.get('COUNTER_LAYOUT', 'flat'),
+    'counter_namespace': os.environ.get('COUNTER_NAMESPACE', 'clicks:'),
+    'counter_shard_chars': int(os.environ.get('COUNTER_SHARD_CHARS', 4)),
+    # With the hash layout, read and move flat counters that haven't been
+    # migrated yet
+    'counter_migrating': os.environ.get('COUNTER_MIGRATING', '') in (
+        '1', 'true', 'yes'
+    ),
+    # Seconds a token is kept after its last click, and after a claim is
+    # signed for it, 0 to keep tokens forever
+    'token_ttl': int(os.environ.get('TOKEN_TTL', 0)),
+    'claimed_token_ttl': int(os.environ.get('CLAIMED_TOKEN_TTL', 0)),
+    # Seconds between passes removing claimed tokens and giving old counters
+    # a TTL, and the most keys a second a pass handles
+    'compaction_interval': int(os.environ.get('COMPACTION_INTERVAL', 300)),
+    'compaction_batch': int(os.environ.get('COMPACTION_BATCH', 100)),
+    'compaction_rate': int(os.environ.get('COMPACTION_RATE', 1000)),
+    # 'thread' or 'process'
+    'signing_executor': os.environ.get('SIGNING_EXECUTOR', 'thread'),
+    'signing_workers': int(os.environ.get('SIGNING_WORKERS', 2)),
+    # Claims waiting to be signed before responding 503
+    'signing_max_queue': int(os.environ.get('SIGNING_MAX_QUEUE', 1000)),
+    'signing_retry_after': int(os.environ.get('SIGNING_RETRY_AFTER', 1)),
+    # Signed claims are reused until the token's click count changes
+    'claim_cache_ttl': int(os.environ.get('CLAIM_CACHE_TTL', 3600)),
+    'claim_cache_size': int(os.environ.get('CLAIM_CACHE_SIZE', 10000)),
+    'max_claim_batch': int(os.environ.get('MAX_CLAIM_BATCH', 100)),
+    # 1 for eth_sign claims of hashClaim(), 2 for EIP-712 claims of
+    # hashClaimPacked().  chain_id goes in version 2 claims' domain.
+    'claim_version': int(os.environ.get('CLAIM_VERSION', 1)),
+    'chain_id': int(os.environ.get('CHAIN_ID', 1)),
+    # Merkle epochs, see epochs.py.  Trees are kept in epoch_dir, and proofs
+    # are only served when it's set.
+    'epoch_dir': os.environ.get('EPOCH_DIR', ''),
+    'epoch_interval': int(os.environ.get('EPOCH_INTERVAL', 0)),
+    'epoch_batch': int(os.environ.get('EPOCH_BATCH', 1000)),
+    'epoch_contract': os.environ.get('EPOCH_CONTRACT'),
+    'ethereum_rpc': os.environ.get('ETHEREUM_RPC', 'http://localhost:8545'),
+    # GET /clicks/<token> counts are served from memory for this long, and
+    # may be cached by clients and proxies for clicks_max_age seconds
+    'clicks_cache_ms': int(os.environ.get('CLICKS_CACHE_MS', 500)),
+    'clicks_cache_size': int(os.environ.get('CLICKS_CACHE_SIZE', 10000)),
+    'clicks_max_age': int(os.environ.get('CLICKS_MAX_AGE', 1)),
+    # WebSocket clients per process, and seconds a socket can go without
+    # sending or receiving anything
+    'ws_max_connections': int(os.environ.get('WS_MAX_CONNECTIONS', 10000)),
+    'ws_idle_timeout': int(os.environ.get('WS_IDLE_TIMEOUT', 300)),
+    'ws_ping_interval': int(os.environ.get('WS_PING_INTERVAL', 30)),
+    # Write clicks behind in batches.  Up to click_flush_interval_ms of
+    # clicks can be lost if a process dies without shutting down.
+    'click_aggregation': os.environ.get('CLICK_AGGREGATION', '') in (
+        '1', 'true', 'yes'
+    ),
+    'click_flush_interval_ms': int(
+        os.environ.get('CLICK_FLUSH_INTERVAL_MS', 50)
+    ),
+    'click_flush_max_pending': int(
+        os.environ.get('CLICK_FLUSH_MAX_PENDING', 1000)
+    ),
+}
+
+
+def load_config(overrides=None):
+    """ Merge the given settings over the defaults """
+    config = dict(DEFAULTS)
+    if overrides:
+        config.update({k: v for k, v in overrides.items() if v is not None})
+    return config
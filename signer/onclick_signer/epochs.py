@@ -0,0 +1,403 @@
+""" Build, commit and publish epochs of Merkle claims
+
+Tokens are registered for epochs with their recipient by POST /epoch.  Each
+epoch snapshots the click count of every registered token, and every token
+clicked since it was last in an epoch gets a leaf for those clicks.  The
+leaves are streamed into a Merkle tree on disk, and the tree's root is
+published to ClickToken.publishEpoch(), which reduces the publishing
+signer's allowance by the epoch's total once.  Recipients then claim with
+the proofs served by GET /proofs/<token>.
+
+An epoch is built in three steps, each safe to repeat if interrupted:
+
+1. Build: leaves are staged in the Redis hash epoch:leaves:<epoch> while the
+   tree is written to EPOCH_DIR/<epoch>, and epoch.json is written last.
+2. Commit: each token's clicks included in epochs so far, and its leaf in
+   epoch:claims:<token>, are recorded from the staged leaves, and then
+   epoch:current is set to the epoch.
+3. Publish: the root is sent to the contract, and epoch:published set.
+
+A registered token whose counter is gone, because it expired or was
+compacted, is removed from epoch:recipients and epoch:included by the next
+build, so ocsigner-epoch must use the signers' COUNTER_LAYOUT.  Its claims
+in epoch:claims:<token>, and the trees in EPOCH_DIR, are kept so its proofs
+can still be served.
+
+    ocsigner-epoch --interval 3600
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+from argparse import ArgumentParser
+from secrets import token_hex
+from redis import Redis
+from eth_utils.hexadecimal import add_0x_prefix, decode_hex, encode_hex
+from web3 import Web3
+
+from onclick_signer.config import load_config
+from onclick_signer.layout import get_counter_layout
+from onclick_signer.locks import RELEASE_SCRIPT
+from onclick_signer.merkle import MerkleTree, MerkleTreeWriter, leaf_hash
+from onclick_signer.signer import get_signer
+
+# token -> recipient registered for epochs
+RECIPIENTS_KEY = 'epoch:recipients'
+# token -> clicks included in committed epochs, or claimed with signed
+# claims before the token was registered
+INCLUDED_KEY = 'epoch:included'
+# Last committed and last published epoch
+CURRENT_KEY = 'epoch:current'
+PUBLISHED_KEY = 'epoch:published'
+# + epoch: token -> index:recipient:clicks:amount, while building
+LEAVES_PREFIX = 'epoch:leaves:'
+# + token: epoch -> index:recipient:amount
+CLAIMS_PREFIX = 'epoch:claims:'
+# Held while building an epoch, so only one is built at a time
+LOCK_KEY = 'epoch:lock'
+LOCK_TIMEOUT_MS = 3600 * 1000
+
+METADATA_FILE = 'epoch.json'
+CLICK_AMOUNT = int(1e18)
+
+PUBLISH_ABI = [
+    {
+        'inputs': [
+            {'internalType': 'uint256', 'name': 'epoch', 'type': 'uint256'},
+            {'internalType': 'bytes32', 'name': 'root', 'type': 'bytes32'},
+            {'internalType': 'uint256', 'name': 'total', 'type': 'uint256'},
+        ],
+        'name': 'publishEpoch',
+        'outputs': [],
+        'stateMutability': 'nonpayable',
+        'type': 'function',
+    },
+    {
+        'inputs': [
+            {'internalType': 'uint256', 'name': '', 'type': 'uint256'},
+        ],
+        'name': 'epochRoots',
+        'outputs': [
+            {'internalType': 'bytes32', 'name': '', 'type': 'bytes32'},
+        ],
+        'stateMutability': 'view',
+        'type': 'function',
+    },
+]
+
+log = logging.getLogger().getChild('epochs')
+
+
+class MissingEpoch(Exception):
+    """ An epoch's tree isn't in the epoch directory, e.g. not synced yet """
+    def __init__(self, epoch):
+        super().__init__('Epoch {} not found'.format(epoch))
+        self.epoch = epoch
+
+
+def epoch_path(directory, epoch):
+    return os.path.join(directory, str(epoch))
+
+
+def read_metadata(directory, epoch):
+    """ An epoch's epoch.json, or None if it wasn't finished """
+    try:
+        with open(os.path.join(epoch_path(directory, epoch), METADATA_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def parse_claim(value):
+    """ index:recipient:amount from epoch:claims:<token> """
+    index, recipient, amount = value.decode('utf-8').split(':')
+    return int(index), recipient, int(amount)
+
+
+def read_claims(directory, token, entries):
+    """ A token's claims in every epoch, with their proofs.  Reads the
+    trees, so should be run off the IOLoop.
+
+    :param entries: of the token's epoch:claims:<token> hash
+    :returns: list of claims as served by GET /proofs/<token>
+    :raises MissingEpoch: if a tree isn't in directory
+    """
+    claims = []
+    for epoch in sorted(int(epoch) for epoch in entries):
+        index, recipient, amount = parse_claim(entries[str(epoch).encode()])
+        try:
+            proof = MerkleTree(epoch_path(directory, epoch)).proof(index)
+        except FileNotFoundError:
+            raise MissingEpoch(epoch)
+
+        claims.append({
+            'epoch': epoch,
+            'index': index,
+            'recipient': recipient,
+            'uid': add_0x_prefix(token),
+            # Too large for JavaScript numbers
+            'amount': str(amount),
+            'proof': [encode_hex(node) for node in proof],
+        })
+
+    return claims
+
+
+def scan_hash(r, key, batch):
+    """ Yield lists of up to about batch (field, value) of a hash """
+    cursor = 0
+    while True:
+        cursor, entries = r.hscan(key, cursor, count=batch)
+        if entries:
+            yield [
+                (field.decode('utf-8'), value.decode('utf-8'))
+                for field, value in entries.items()
+            ]
+        if cursor == 0:
+            break
+
+
+def build_epoch(r, layout, directory, epoch, batch=1000):
+    """ Stage leaves for every registered token clicked since it was last
+    in an epoch, and build their tree
+
+    :returns: the epoch's metadata, or None if there's nothing to claim
+    """
+    staging = LEAVES_PREFIX + str(epoch)
+    path = epoch_path(directory, epoch)
+
+    # Anything left from an interrupted build
+    r.delete(staging)
+    shutil.rmtree(path, ignore_errors=True)
+
+    writer = MerkleTreeWriter(path)
+    total = 0
+
+    for entries in scan_hash(r, RECIPIENTS_KEY, batch):
+        tokens = [token for token, _ in entries]
+
+        pipe = r.pipeline(transaction=False)
+        for token in tokens:
+            layout.get(pipe, token)
+        pipe.hmget(INCLUDED_KEY, tokens)
+        values = pipe.execute()
+
+        pipe = r.pipeline(transaction=False)
+        for (token, recipient), clicks, included in zip(
+            entries,
+            values[:-1],
+            values[-1]
+        ):
+            if clicks is None:
+                # Expired or compacted, so it can't be clicked again
+                pipe.hdel(RECIPIENTS_KEY, token)
+                pipe.hdel(INCLUDED_KEY, token)
+                continue
+
+            clicks = int(clicks)
+            new_clicks = clicks - int(included or 0)
+            if new_clicks <= 0:
+                continue
+
+            index = writer.size
+            amount = new_clicks * CLICK_AMOUNT
+            writer.add(leaf_hash(index, recipient, decode_hex(token), amount))
+            pipe.hset(staging, token, '{}:{}:{}:{}'.format(
+                index,
+                recipient,
+                clicks,
+                amount
+            ))
+            total += amount
+        pipe.execute()
+
+    root = writer.finish()
+    if root is None:
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+
+    metadata = {
+        'epoch': epoch,
+        'root': encode_hex(root),
+        'leaves': writer.size,
+        'total': str(total),
+    }
+    with open(os.path.join(path, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f)
+
+    return metadata
+
+
+def commit_epoch(r, epoch, batch=1000):
+    """ Record the staged leaves of a built epoch, so proofs can be served
+    and the next epoch starts from its clicks
+    """
+    staging = LEAVES_PREFIX + str(epoch)
+
+    for entries in scan_hash(r, staging, batch):
+        pipe = r.pipeline(transaction=False)
+        for token, value in entries:
+            index, recipient, clicks, amount = value.split(':')
+            pipe.hset(INCLUDED_KEY, token, clicks)
+            pipe.hset(
+                CLAIMS_PREFIX + token,
+                epoch,
+                '{}:{}:{}'.format(index, recipient, amount)
+            )
+        pipe.execute()
+
+    r.set(CURRENT_KEY, epoch)
+    r.delete(staging)
+
+
+def publish_epoch(web3, account, contract_address, metadata):
+    """ Publish an epoch's root to ClickToken, unless it already has been
+
+    :param account: SignerService of a signer with allowance for the total
+    """
+    contract = web3.eth.contract(
+        address=Web3.toChecksumAddress(contract_address),
+        abi=PUBLISH_ABI
+    )
+    epoch = metadata['epoch']
+    root = decode_hex(metadata['root'])
+
+    published = contract.functions.epochRoots(epoch).call()
+    if published == root:
+        return
+    if published != bytes(32):
+        raise ValueError('Epoch {} has another root'.format(epoch))
+
+    tx = contract.functions.publishEpoch(
+        epoch,
+        root,
+        int(metadata['total'])
+    ).buildTransaction({
+        'from': account.address,
+        'nonce': web3.eth.getTransactionCount(account.address),
+    })
+    signed = account.sign_transaction(tx)
+    receipt = web3.eth.waitForTransactionReceipt(
+        web3.eth.sendRawTransaction(signed.rawTransaction)
+    )
+    if receipt.status != 1:
+        raise ValueError('Publishing epoch {} failed'.format(epoch))
+
+
+def run_epoch(r, layout, directory, batch=1000, publish=None):
+    """ Finish any interrupted epoch, then build, commit and publish the
+    next
+
+    :param publish: called with an epoch's metadata to publish it, or None
+        to leave publishing to something else
+    :returns: the metadata of the epoch built, or None if there was
+        nothing to claim or another process is building one
+    """
+    lock = token_hex(16)
+    if not r.set(LOCK_KEY, lock, nx=True, px=LOCK_TIMEOUT_MS):
+        log.warning('Another epoch is being built')
+        return None
+
+    try:
+        current = int(r.get(CURRENT_KEY) or 0)
+        epoch = current + 1
+
+        # A built epoch whose commit was interrupted is committed as is,
+        # since its leaves may already be partly recorded
+        metadata = None
+        if r.exists(LEAVES_PREFIX + str(epoch)):
+            metadata = read_metadata(directory, epoch)
+
+        if metadata is None:
+            r.delete(LEAVES_PREFIX + str(current))
+            metadata = build_epoch(r, layout, directory, epoch, batch)
+
+        if metadata is not None:
+            commit_epoch(r, epoch, batch)
+            current = epoch
+
+        if publish is not None:
+            published = int(r.get(PUBLISHED_KEY) or 0)
+            for unpublished in range(published + 1, current + 1):
+                publish(read_metadata(directory, unpublished))
+                r.set(PUBLISHED_KEY, unpublished)
+
+        return metadata
+    finally:
+        # Not if it timed out, and another run holds it now
+        if not r.register_script(RELEASE_SCRIPT)(keys=[LOCK_KEY], args=[lock]):
+            log.warning('Epoch lock expired while building')
+
+
+def parse_args(argv):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--redis-host', help='Redis server hostname')
+    parser.add_argument('--redis-port', help='Redis server port', type=int)
+    parser.add_argument('--redis-db', help='Redis database number', type=int)
+    parser.add_argument('--epoch-dir', help='Directory to keep trees in')
+    parser.add_argument('--contract', help='ClickToken to publish roots to')
+    parser.add_argument('--rpc', help='Ethereum JSON-RPC URL')
+    parser.add_argument('-b', '--batch', type=int,
+                        help='Tokens to read per Redis call')
+    parser.add_argument('-i', '--interval', type=int,
+                        help='Seconds between epochs, or 0 to run one')
+    parser.add_argument('--no-publish', action='store_true',
+                        help="Build and commit epochs without publishing")
+    return parser.parse_args(argv)
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    config = load_config({
+        'redis_host': args.redis_host,
+        'redis_port': args.redis_port,
+        'redis_db': args.redis_db,
+        'epoch_dir': args.epoch_dir,
+        'epoch_contract': args.contract,
+        'ethereum_rpc': args.rpc,
+        'epoch_batch': args.batch,
+        'epoch_interval': args.interval,
+    })
+    logging.basicConfig(level=logging.INFO)
+
+    if not config['epoch_dir']:
+        raise SystemExit('EPOCH_DIR or --epoch-dir is required')
+
+    r = Redis(
+        host=config['redis_host'],
+        port=config['redis_port'],
+        db=config['redis_db']
+    )
+    layout = get_counter_layout(config)
+
+    publish = None
+    if not args.no_publish:
+        if not config['epoch_contract']:
+            raise SystemExit('EPOCH_CONTRACT or --contract is required')
+        web3 = Web3(Web3.HTTPProvider(config['ethereum_rpc']))
+        signer = get_signer()
+
+        def publish(metadata):
+            publish_epoch(web3, signer, config['epoch_contract'], metadata)
+
+    while True:
+        start = time.monotonic()
+        metadata = run_epoch(
+            r,
+            layout,
+            config['epoch_dir'],
+            batch=config['epoch_batch'],
+            publish=publish
+        )
+        if metadata is not None:
+            print(json.dumps(dict(
+                metadata,
+                seconds=time.monotonic() - start
+            )))
+            sys.stdout.flush()
+
+        if not config['epoch_interval']:
+            break
+        time.sleep(config['epoch_interval'])
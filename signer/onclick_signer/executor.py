@@ -0,0 +1,163 @@
+import time
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from tornado.ioloop import IOLoop
+
+from onclick_signer.claims import CLAIM_VERSIONS, sign_claims
+from onclick_signer.metrics import SIGN_SECONDS
+from onclick_signer.signer import get_signer
+
+
+class ExecutorBusy(Exception):
+    """ The signing queue is full """
+    pass
+
+
+# The signer of this process, in process pool workers
+_worker_signer = None
+
+
+def _init_worker(signer):
+    # Forked workers inherit the signer with its unlocked key
+    global _worker_signer
+    _worker_signer = signer
+    if not signer.loaded:
+        signer.load()
+
+
+def _sign_in_worker(claims, version, chain_id):
+    return sign_claims(
+        claims,
+        signer=_worker_signer,
+        version=version,
+        chain_id=chain_id
+    )
+
+
+class SigningExecutor:
+    """ Runs claim hashing and signing off the IOLoop thread
+
+    At most max_queue claims can be waiting or in progress.  Beyond that
+    sign() raises ExecutorBusy so handlers can shed load.
+
+    :param kind: 'thread' or 'process'.  Process workers are forked with a
+        copy of the signer, so they need to be restarted by reload() after
+        the key changes.
+    :param workers: size of the pool
+    :param max_queue: claims allowed in flight
+    :param signer: SignerService to sign with, get_signer() if not given
+    :param version: of the claims to sign, from CLAIM_VERSIONS
+    :param chain_id: of the contracts claims are for
+    """
+    def __init__(self, kind='thread', workers=2, max_queue=1000, signer=None,
+                 version=1, chain_id=1):
+        if version not in CLAIM_VERSIONS:
+            raise ValueError('Unknown claim version: {}'.format(version))
+
+        if kind not in ('thread', 'process'):
+            raise ValueError('Unknown signing executor: {}'.format(kind))
+
+        self.kind = kind
+        self.workers = workers
+        self.version = version
+        self.signer = signer or get_signer()
+        self._pool = self._create_pool()
+
+        if kind == 'thread':
+            self._sign = partial(
+                sign_claims,
+                signer=self.signer,
+                version=version,
+                chain_id=chain_id
+            )
+        else:
+            self._sign = partial(
+                _sign_in_worker,
+                version=version,
+                chain_id=chain_id
+            )
+        self.max_queue = max_queue
+        self.depth = 0
+        self.stats = {
+            'submitted': 0,
+            'rejected': 0,
+            'completed': 0,
+            'sign_seconds': 0.0,
+            'max_sign_seconds': 0.0,
+            'reloads': 0,
+        }
+
+    def _create_pool(self):
+        if self.kind == 'thread':
+            return ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix='signer'
+            )
+
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker,
+            initargs=(self.signer,)
+        )
+
+    def reload(self):
+        """ Sign with the signer's current key from now on
+
+        Thread workers share the signer already.  Process workers hold the
+        key they were forked with, so new ones replace them, and the old
+        ones exit once the claims they were given are signed.
+        """
+        if self.kind == 'process':
+            pool, self._pool = self._pool, self._create_pool()
+            pool.shutdown(wait=False)
+        self.stats['reloads'] += 1
+
+    async def sign(self, claims):
+        """ Sign (recipient, token, clicks, contract) claims
+
+        :returns: list of (claim hash, signature)
+        """
+        if self.depth + len(claims) > self.max_queue:
+            self.stats['rejected'] += len(claims)
+            raise ExecutorBusy()
+
+        self.depth += len(claims)
+        self.stats['submitted'] += len(claims)
+        start = time.perf_counter()
+
+        try:
+            return await IOLoop.current().run_in_executor(
+                self._pool,
+                self._sign,
+                claims
+            )
+        finally:
+            elapsed = time.perf_counter() - start
+            SIGN_SECONDS.observe(elapsed)
+            self.depth -= len(claims)
+            self.stats['completed'] += len(claims)
+            self.stats['sign_seconds'] += elapsed
+            self.stats['max_sign_seconds'] = max(
+                self.stats['max_sign_seconds'],
+                elapsed
+            )
+
+    def metrics(self):
+        return dict(self.stats, queue_depth=self.depth)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+def get_signing_executor(config, signer=None):
+    """ Create the signing executor selected by config """
+    return SigningExecutor(
+        kind=config['signing_executor'],
+        workers=config['signing_workers'],
+        max_queue=config['signing_max_queue'],
+        signer=signer,
+        version=config['claim_version'],
+        chain_id=config['chain_id'],
+    )
@@ -0,0 +1,120 @@
+""" Where click counters are kept in Redis """
+
+# Moves a token's flat counter into its hash field, for counters not
+# migrated to the hash layout yet.  Returns the count, or false if there's
+# no flat counter.
+MOVE_FLAT_LUA = """
+local function move_flat(key, field, flat)
+    local clicks = redis.call('GET', flat)
+    if not clicks then
+        return false
+    end
+    clicks = redis.call('HINCRBY', key, field, clicks)
+    redis.call('DEL', flat)
+    return tostring(clicks)
+end
+"""
+
+# KEYS: counter hash, flat counter
+# ARGV: hash field
+GET_MIGRATING_SCRIPT = MOVE_FLAT_LUA + """
+return redis.call('HGET', KEYS[1], ARGV[1]) or move_flat(KEYS[1], ARGV[1], KEYS[2])
+"""
+
+
+class FlatLayout:
+    """ One string key per token, named by the token itself
+
+    :param ttl_ms: if set, a counter expires this long after its last
+        click
+    """
+    name = 'flat'
+    migrating = False
+
+    def __init__(self, ttl_ms=0):
+        self.ttl_ms = int(ttl_ms)
+
+    def locate(self, token):
+        """ :returns: tuple of (key, hash field or None) """
+        return token, None
+
+    def get(self, r, token):
+        return r.get(token)
+
+    def incrby(self, r, token, clicks):
+        """ Queue an increment, and refresh the expiry, on a pipeline """
+        r.incrby(token, clicks)
+        if self.ttl_ms:
+            r.pexpire(token, self.ttl_ms)
+        return r
+
+    def delete(self, r, token):
+        return r.delete(token)
+
+
+class HashLayout:
+    """ Counters sharded into hashes by token prefix
+
+    The first shard_chars characters of a token pick the hash, named
+    namespace + prefix, and the rest of the token is its field.  Hashes
+    small enough for Redis' listpack encoding take a fraction of the memory
+    of one key per token.
+
+    :param namespace: prefix of the hash keys
+    :param shard_chars: token characters that pick the hash.  With 4, there
+        are 65536 hashes, which stay listpack encoded up to about 8 million
+        tokens with the default hash-max-listpack-entries of 128.
+    :param ttl_ms: if set, a hash expires this long after the last click on
+        any of its tokens
+    :param migrating: if flat counters may still exist.  A token without a
+        hash field then has its flat counter read, and moved into the hash,
+        by the first read or click.
+    """
+    name = 'hash'
+
+    def __init__(self, namespace='clicks:', shard_chars=4, ttl_ms=0,
+                 migrating=False):
+        self.namespace = namespace
+        self.shard_chars = shard_chars
+        self.ttl_ms = int(ttl_ms)
+        self.migrating = migrating
+
+    def locate(self, token):
+        return (
+            self.namespace + token[:self.shard_chars],
+            token[self.shard_chars:]
+        )
+
+    def get(self, r, token):
+        key, field = self.locate(token)
+        if self.migrating:
+            return r.eval(GET_MIGRATING_SCRIPT, 2, key, token, field)
+        return r.hget(key, field)
+
+    def incrby(self, r, token, clicks):
+        key, field = self.locate(token)
+        r.hincrby(key, field, clicks)
+        if self.ttl_ms:
+            r.pexpire(key, self.ttl_ms)
+        return r
+
+    def delete(self, r, token):
+        return r.hdel(*self.locate(token))
+
+
+def get_counter_layout(config):
+    """ Create the counter layout selected by config """
+    kind = config['counter_layout']
+    ttl_ms = config['token_ttl'] * 1000
+
+    if kind == 'flat':
+        return FlatLayout(ttl_ms)
+    elif kind == 'hash':
+        return HashLayout(
+            config['counter_namespace'],
+            config['counter_shard_chars'],
+            ttl_ms,
+            migrating=config['counter_migrating']
+        )
+
+    raise ValueError('Unknown counter layout: {}'.format(kind))
@@ -0,0 +1,109 @@
+from secrets import token_hex
+from contextlib import asynccontextmanager
+
+LOCK_PREFIX = 'lock:'
+
+# Only delete the lock if we still hold it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class TokenLocked(Exception):
+    """ Another request is already working with this token """
+    pass
+
+
+class LockManager:
+    """ Keeps concurrent requests from working on the same token
+
+    Use lock() as an async context manager.  The lock is released when the
+    block exits, however it exits.
+    """
+    def __init__(self):
+        self.stats = {
+            'acquired': 0,
+            'contended': 0,
+        }
+
+    async def acquire(self, token):
+        """ Take the lock, returning a value for release() or None """
+        raise NotImplementedError()
+
+    async def release(self, token, value):
+        raise NotImplementedError()
+
+    @asynccontextmanager
+    async def lock(self, token):
+        value = await self.acquire(token)
+
+        if value is None:
+            self.stats['contended'] += 1
+            raise TokenLocked(token)
+
+        self.stats['acquired'] += 1
+
+        try:
+            yield
+        finally:
+            await self.release(token, value)
+
+
+class MemoryLockManager(LockManager):
+    """ Per-process token locks, only holding tokens that are locked """
+    def __init__(self):
+        super().__init__()
+        self._held = set()
+
+    def __len__(self):
+        return len(self._held)
+
+    async def acquire(self, token):
+        if token in self._held:
+            return None
+        self._held.add(token)
+        return True
+
+    async def release(self, token, value):
+        self._held.discard(token)
+
+
+class RedisLockManager(LockManager):
+    """ Token locks shared by all signer processes using SET NX PX
+
+    The timeout only matters if a process dies while holding a lock.
+    """
+    def __init__(self, redis, timeout_ms):
+        super().__init__()
+        self.redis = redis
+        self.timeout_ms = int(timeout_ms)
+        self._release_script = redis.register_script(RELEASE_SCRIPT)
+
+    async def acquire(self, token):
+        value = token_hex(16)
+        if await self.redis.set(
+            LOCK_PREFIX + token,
+            value,
+            nx=True,
+            px=self.timeout_ms
+        ):
+            return value
+        return None
+
+    async def release(self, token, value):
+        await self._release_script(keys=[LOCK_PREFIX + token], args=[value])
+
+
+def get_lock_manager(config, redis):
+    """ Create the token lock manager selected by config """
+    kind = config['token_lock']
+
+    if kind == 'redis':
+        return RedisLockManager(redis, config['token_lock_timeout_ms'])
+    elif kind == 'memory':
+        return MemoryLockManager()
+
+    raise ValueError('Unknown token lock: {}'.format(kind))
@@ -0,0 +1,130 @@
+""" Merkle trees of epoch claims, kept in files
+
+A tree is a directory with a file for each level, level-0 holding the
+leaves, each a 32 byte hash stored back to back.  Building a tree only holds
+a chunk of one level in memory at a time, so trees of millions of leaves
+are built in bounded memory, and a proof is read with one seek per level.
+
+Siblings are hashed in sorted order, like OpenZeppelin's MerkleProof, so
+proofs don't need to say which side each sibling is on.  A node without a
+sibling is carried up to the next level as is.
+"""
+import os
+from eth_hash.auto import keccak
+from eth_utils.address import to_canonical_address
+
+HASH_SIZE = 32
+# Hashes read at a time while building.  Even, so pairs don't span chunks.
+CHUNK_HASHES = 4096
+
+
+def leaf_hash(index, recipient, uid, amount):
+    """ Same as ClickToken.epochLeaf() """
+    return keccak(
+        index.to_bytes(32, 'big')
+        + to_canonical_address(recipient)
+        + uid
+        + amount.to_bytes(32, 'big')
+    )
+
+
+def hash_pair(a, b):
+    return keccak(a + b if a <= b else b + a)
+
+
+def verify(proof, root, leaf):
+    """ Same as MerkleProof.verify() """
+    for sibling in proof:
+        leaf = hash_pair(leaf, sibling)
+    return leaf == root
+
+
+def level_path(directory, level):
+    return os.path.join(directory, 'level-{}'.format(level))
+
+
+class MerkleTreeWriter:
+    """ Builds a tree in a directory from leaves added in order
+
+    :param directory: to write the tree to, created if necessary
+    """
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.size = 0
+        self._leaves = open(level_path(directory, 0), 'wb')
+
+    def add(self, leaf):
+        """ Append a leaf
+
+        :returns: the leaf's index
+        """
+        self._leaves.write(leaf)
+        self.size += 1
+        return self.size - 1
+
+    def finish(self):
+        """ Build the levels above the leaves
+
+        :returns: the root, or None if there are no leaves
+        """
+        self._leaves.close()
+        if not self.size:
+            return None
+
+        level = 0
+        count = self.size
+        while count > 1:
+            with open(level_path(self.directory, level), 'rb') as nodes, \
+                    open(level_path(self.directory, level + 1), 'wb') as parents:
+                while True:
+                    chunk = nodes.read(CHUNK_HASHES * HASH_SIZE)
+                    if not chunk:
+                        break
+                    for i in range(0, len(chunk), HASH_SIZE * 2):
+                        left = chunk[i:i + HASH_SIZE]
+                        right = chunk[i + HASH_SIZE:i + HASH_SIZE * 2]
+                        parents.write(hash_pair(left, right) if right else left)
+            level += 1
+            count = (count + 1) // 2
+
+        return MerkleTree(self.directory).root
+
+
+class MerkleTree:
+    """ A tree built by MerkleTreeWriter
+
+    :param directory: the tree was written to
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.size = os.path.getsize(level_path(directory, 0)) // HASH_SIZE
+        self.depth = (self.size - 1).bit_length() if self.size else 0
+
+    @property
+    def root(self):
+        with open(level_path(self.directory, self.depth), 'rb') as top:
+            return top.read(HASH_SIZE)
+
+    def leaf(self, index):
+        with open(level_path(self.directory, 0), 'rb') as leaves:
+            leaves.seek(index * HASH_SIZE)
+            return leaves.read(HASH_SIZE)
+
+    def proof(self, index):
+        """ Sibling hashes from the leaf at index up to the root """
+        if not 0 <= index < self.size:
+            raise IndexError('No leaf {}'.format(index))
+
+        proof = []
+        count = self.size
+        for level in range(self.depth):
+            sibling = index ^ 1
+            if sibling < count:
+                with open(level_path(self.directory, level), 'rb') as nodes:
+                    nodes.seek(sibling * HASH_SIZE)
+                    proof.append(nodes.read(HASH_SIZE))
+            index //= 2
+            count = (count + 1) // 2
+
+        return proof
@@ -0,0 +1,205 @@
+""" Counters and histograms, exposed in the Prometheus text format
+
+Metrics are kept per process, and recording one is a dict lookup and an
+addition, so they can stay on in production.  Stats the signer's
+components already keep (rate limiter, locks, caches, executor...) are
+read when metrics are scraped.
+"""
+from bisect import bisect_left
+import tornado.web
+
+from onclick_signer.profiling import ProfileHandler
+
+# Seconds, from well under a Redis round trip to a slow signature
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5,
+)
+
+# settings of the signer app read on scrape
+COMPONENTS = (
+    'signer',
+    'locks',
+    'executor',
+    'claim_cache',
+    'hub',
+    'compactor',
+    'blocking',
+)
+STORE_COMPONENTS = (
+    'limiter',
+    'aggregator',
+    'counts',
+)
+
+
+def _labels(names, values, extra=''):
+    pairs = ['{}="{}"'.format(n, v) for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """ A count that only goes up, optionally by label values """
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        # label values -> count
+        self.values = {}
+
+    def inc(self, *labels, n=1):
+        self.values[labels] = self.values.get(labels, 0) + n
+
+    def render(self):
+        for labels, value in self.values.items():
+            yield '{}{} {}'.format(
+                self.name,
+                _labels(self.labels, labels),
+                value
+            )
+
+
+class Histogram:
+    """ Observations counted into fixed buckets, optionally by label values
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [count per bucket..., count over the last, sum]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self):
+        for labels, counts in self.values.items():
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                yield '{}_bucket{} {}'.format(
+                    self.name,
+                    _labels(self.labels, labels, 'le="{}"'.format(bound)),
+                    total
+                )
+            yield '{}_sum{} {}'.format(
+                self.name,
+                _labels(self.labels, labels),
+                counts[-1]
+            )
+            yield '{}_count{} {}'.format(
+                self.name,
+                _labels(self.labels, labels),
+                total
+            )
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        for metric in self.metrics:
+            yield '# HELP {} {}'.format(metric.name, metric.help)
+            yield '# TYPE {} {}'.format(metric.name, metric.kind)
+            yield from metric.render()
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'signer_request_seconds',
+    'Time to handle requests',
+    labels=('handler', 'code')
+)
+REDIS_SECONDS = REGISTRY.histogram(
+    'signer_redis_seconds',
+    'Redis round trips',
+    labels=('op',)
+)
+SIGN_SECONDS = REGISTRY.histogram(
+    'signer_sign_seconds',
+    'Time to sign a batch of claims, including the wait for the executor'
+)
+CLICKS = REGISTRY.counter(
+    'signer_clicks_total',
+    'Click requests, by result',
+    labels=('result',)
+)
+TOKENS_CREATED = REGISTRY.counter(
+    'signer_tokens_created_total',
+    'New tokens handed out'
+)
+
+
+def render_stats(app):
+    """ The stats of an app's components, as gauges named
+    signer_<component>_<stat>.  Stats without a value yet are left out.
+    """
+    store = app.settings['store']
+    components = [(name, app.settings.get(name)) for name in COMPONENTS]
+    components += [(name, getattr(store, name)) for name in STORE_COMPONENTS]
+    components.append(('app', app))
+
+    for name, component in components:
+        if component is None:
+            continue
+        if hasattr(component, 'metrics'):
+            stats = component.metrics()
+        else:
+            stats = getattr(component, 'stats', {})
+
+        for stat, value in stats.items():
+            if value is None:
+                continue
+            metric = 'signer_{}_{}'.format(name, stat)
+            yield '# TYPE {} gauge'.format(metric)
+            yield '{} {}'.format(metric, float(value))
+
+
+def render(app):
+    lines = list(REGISTRY.render())
+    lines.extend(render_stats(app))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def initialize(self, app):
+        self.app = app
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(render(self.app))
+
+
+def make_metrics_app(app):
+    """ An app serving /metrics and /profile for the signer app, to listen
+    on a port of its own
+    """
+    return tornado.web.Application([
+        (r'/metrics', MetricsHandler, {'app': app}),
+        (r'/profile', ProfileHandler, {
+            'max_seconds': app.settings['config']['profile_max_seconds'],
+        }),
+    ])
@@ -0,0 +1,175 @@
+""" Move flat click counters into the hash counter layout
+
+Counters are found with SCAN and moved in batches.  Each batch is moved by
+one script, so a click counted while the migration runs is either moved
+with its counter or lands after it, and is never lost.
+
+Signers still using flat keys don't see counters that have been moved, so
+restart them with COUNTER_LAYOUT=hash and COUNTER_MIGRATING=1 first.  They
+then read any flat counter not moved yet, and move it themselves on first
+touch.  Run the migration once they've all restarted, after which
+COUNTER_MIGRATING can be turned off.  Otherwise stop every signer before
+running it.
+"""
+import sys
+import json
+import time
+from argparse import ArgumentParser
+from redis import Redis
+from redis.exceptions import ResponseError
+
+from onclick_signer.config import load_config
+from onclick_signer.layout import MOVE_FLAT_LUA, HashLayout
+
+# Tokens are 32 bytes of lowercase hex
+FLAT_TOKEN_MATCH = '[0-9a-f]' * 64
+
+# KEYS: flat counter and its hash, in pairs
+# ARGV: hash field of each pair
+#
+# Returns the number of counters moved
+MIGRATE_SCRIPT = MOVE_FLAT_LUA + """
+local moved = 0
+for i = 1, #ARGV do
+    if move_flat(KEYS[i * 2], ARGV[i], KEYS[i * 2 - 1]) then
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+
+def parse_args(argv):
+    parser = ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--redis-host', help='Redis server hostname')
+    parser.add_argument('--redis-port', help='Redis server port', type=int)
+    parser.add_argument('--redis-db', help='Redis database number', type=int)
+    parser.add_argument('--namespace', help='Prefix of the counter hashes')
+    parser.add_argument('--shard-chars', type=int,
+                        help='Token characters that pick the hash')
+    parser.add_argument('-b', '--batch', type=int, default=1000,
+                        help='Counters to move per script call')
+    parser.add_argument('--sample', type=int, default=100,
+                        help='Keys to measure memory use of')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+                        help='Count and measure flat counters only')
+    return parser.parse_args(argv)
+
+
+def used_memory(r):
+    try:
+        return r.info('memory')['used_memory']
+    except ResponseError:
+        return None
+
+
+def memory_usage(r, keys):
+    """ Total MEMORY USAGE of keys, or None if the server can't tell """
+    try:
+        return sum(r.memory_usage(key, samples=0) or 0 for key in keys)
+    except ResponseError:
+        return None
+
+
+def scan_flat(r, batch):
+    """ Yield lists of up to about batch flat counter keys """
+    cursor = 0
+    while True:
+        cursor, keys = r.scan(
+            cursor,
+            match=FLAT_TOKEN_MATCH,
+            count=batch,
+            _type='string'
+        )
+        if keys:
+            yield [key.decode('utf-8') for key in keys]
+        if cursor == 0:
+            break
+
+
+def migrate(r, layout, batch=1000, sample=100, dry_run=False):
+    """ Move every flat counter into the hash layout
+
+    :returns: dict of what was moved, and memory use before and after
+    """
+    move = r.register_script(MIGRATE_SCRIPT)
+    memory_before = used_memory(r)
+    flat_sampled = []
+    flat_bytes = 0
+    hashes = set()
+    found = 0
+    moved = 0
+    start = time.monotonic()
+
+    for tokens in scan_flat(r, batch):
+        found += len(tokens)
+
+        # Measure some counters before they're moved
+        measure = tokens[:sample - len(flat_sampled)]
+        if measure and flat_bytes is not None:
+            used = memory_usage(r, measure)
+            flat_bytes = None if used is None else flat_bytes + used
+            flat_sampled.extend(measure)
+
+        if dry_run:
+            continue
+
+        keys = []
+        fields = []
+        for token in tokens:
+            key, field = layout.locate(token)
+            keys.extend([token, key])
+            fields.append(field)
+            if len(hashes) < sample:
+                hashes.add(key)
+
+        moved += move(keys=keys, args=fields)
+
+    hash_bytes = memory_usage(r, hashes)
+    hash_tokens = sum(r.hlen(key) for key in hashes)
+
+    return {
+        'found': found,
+        'moved': moved,
+        'seconds': time.monotonic() - start,
+        'used_memory_before': memory_before,
+        'used_memory_after': used_memory(r),
+        'flat_bytes_per_token': (
+            flat_bytes / len(flat_sampled)
+            if flat_bytes is not None and flat_sampled else None
+        ),
+        'hash_bytes_per_token': (
+            hash_bytes / hash_tokens
+            if hash_bytes is not None and hash_tokens else None
+        ),
+    }
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    config = load_config({
+        'redis_host': args.redis_host,
+        'redis_port': args.redis_port,
+        'redis_db': args.redis_db,
+        'counter_namespace': args.namespace,
+        'counter_shard_chars': args.shard_chars,
+    })
+
+    r = Redis(
+        host=config['redis_host'],
+        port=config['redis_port'],
+        db=config['redis_db']
+    )
+    layout = HashLayout(
+        config['counter_namespace'],
+        config['counter_shard_chars']
+    )
+
+    result = migrate(
+        r,
+        layout,
+        batch=args.batch,
+        sample=args.sample,
+        dry_run=args.dry_run
+    )
+    print(json.dumps(result))
@@ -0,0 +1,205 @@
+""" Seeing where a live signer process spends its time """
+import io
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import traceback
+from collections import Counter
+import tornado.gen
+import tornado.web
+from tornado.ioloop import PeriodicCallback
+
+log = logging.getLogger().getChild('profiling')
+
+
+def collapse(frame):
+    """ A stack as file:function frames from the outermost, joined by ; """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{}:{}'.format(
+            os.path.basename(code.co_filename),
+            code.co_name
+        ))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """ Samples the stack of a thread from a background thread
+
+    Samples are kept as collapsed stacks, the input of flamegraph.pl and
+    speedscope.
+
+    :param thread_id: to sample, e.g. the IOLoop's thread
+    :param interval: seconds between samples
+    """
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapse(frame)] += 1
+
+    def collapsed(self):
+        return ''.join(
+            '{} {}\n'.format(stack, count)
+            for stack, count in self.samples.most_common()
+        )
+
+
+class BlockingDetector:
+    """ Logs the IOLoop's stack whenever one callback runs longer than
+    threshold seconds, like Tornado's old set_blocking_log_threshold()
+
+    The IOLoop updates a heartbeat every threshold / 2 seconds, and a
+    watchdog thread checks it.
+
+    :param threshold: seconds a callback may run
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.stats = {
+            'blocked': 0,
+            'max_blocked_seconds': 0,
+        }
+        self._heartbeat = time.monotonic()
+        self._thread_id = None
+        self._callback = None
+        self._stop = threading.Event()
+
+    def _beat(self):
+        self._heartbeat = time.monotonic()
+
+    def start(self):
+        """ Start watching the current thread's IOLoop """
+        self._thread_id = threading.get_ident()
+        self._beat()
+        self._callback = PeriodicCallback(self._beat, self.threshold * 500)
+        self._callback.start()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._callback is not None:
+            self._callback.stop()
+
+    def _watch(self):
+        # Each block is only logged once
+        logged = None
+
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.threshold / 2
+
+            if blocked < self.threshold:
+                continue
+
+            self.stats['max_blocked_seconds'] = max(
+                self.stats['max_blocked_seconds'],
+                blocked
+            )
+            if logged == heartbeat:
+                continue
+            logged = heartbeat
+
+            self.stats['blocked'] += 1
+            frame = sys._current_frames().get(self._thread_id)
+            log.warning(
+                'IOLoop blocked for %.3fs\n%s',
+                blocked,
+                ''.join(traceback.format_stack(frame)) if frame else ''
+            )
+
+    def metrics(self):
+        return self.stats
+
+
+def get_blocking_detector(config):
+    """ Create and start a blocking detector for the current IOLoop, if
+    enabled by config
+    """
+    if not config['blocking_threshold_ms']:
+        return None
+
+    detector = BlockingDetector(config['blocking_threshold_ms'] / 1000)
+    detector.start()
+    return detector
+
+
+class ProfileHandler(tornado.web.RequestHandler):
+    """ Profile this process for ?seconds=N
+
+    ?mode=sample (the default) responds with collapsed stacks of the IOLoop
+    thread.  ?mode=cprofile responds with cProfile stats of everything run
+    on it, by cumulative time.
+    """
+    running = False
+
+    def initialize(self, max_seconds):
+        self.max_seconds = max_seconds
+
+    async def get(self):
+        try:
+            seconds = float(self.get_argument('seconds', '10'))
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason='Invalid seconds')
+        if not 0 < seconds <= self.max_seconds:
+            raise tornado.web.HTTPError(400, reason='Invalid seconds')
+
+        mode = self.get_argument('mode', 'sample')
+        if mode not in ('sample', 'cprofile'):
+            raise tornado.web.HTTPError(400, reason='Invalid mode')
+
+        # Profiles would include each other
+        if ProfileHandler.running:
+            raise tornado.web.HTTPError(409, reason='Already profiling')
+
+        ProfileHandler.running = True
+        log.warning('Profiling (%s) for %.1fs', mode, seconds)
+
+        try:
+            if mode == 'sample':
+                body = await self.sample(seconds)
+            else:
+                body = await self.cprofile(seconds)
+        finally:
+            ProfileHandler.running = False
+
+        self.set_header('Content-Type', 'text/plain')
+        self.write(body)
+
+    async def sample(self, seconds):
+        profiler = SamplingProfiler(threading.get_ident())
+        profiler.start()
+        await tornado.gen.sleep(seconds)
+        profiler.stop()
+        return profiler.collapsed()
+
+    async def cprofile(self, seconds):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        await tornado.gen.sleep(seconds)
+        profiler.disable()
+
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(50)
+        return out.getvalue()
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+
+CHANNEL_PREFIX = 'clicks:'
+
+log = logging.getLogger().getChild('push')
+
+
+class ClickHub:
+    """ Passes click counts on to the WebSocket clients of this process
+
+    Counts are published on a Redis channel per token by ClickStore's click
+    scripts, or by the aggregator as it writes them, so every signer process
+    hears about clicks counted by any other and pushes them to its own
+    subscribers.  A process only subscribes to channels it has clients for,
+    all on one pub/sub connection.
+
+    :param redis: client
+    :param max_connections: most WebSocket clients in this process
+    """
+    def __init__(self, redis, max_connections):
+        self.redis = redis
+        self.max_connections = max_connections
+        self.connections = 0
+        # token -> set of subscribed handlers
+        self._subscribers = {}
+        self._pubsub = None
+        self._reader = None
+        self.stats = {
+            'received': 0,
+            'delivered': 0,
+            'rejected': 0,
+        }
+
+    def full(self):
+        return self.connections >= self.max_connections
+
+    async def subscribe(self, token, handler):
+        """ Push a token's counts to handler.push(token, clicks) """
+        handlers = self._subscribers.get(token)
+
+        if handlers is None:
+            handlers = self._subscribers[token] = set()
+            if self._pubsub is None:
+                self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            await self._pubsub.subscribe(CHANNEL_PREFIX + token)
+
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.ensure_future(self._read())
+
+        handlers.add(handler)
+
+    async def unsubscribe(self, token, handler):
+        handlers = self._subscribers.get(token)
+        if handlers is None:
+            return
+
+        handlers.discard(handler)
+        if not handlers:
+            del self._subscribers[token]
+            await self._pubsub.unsubscribe(CHANNEL_PREFIX + token)
+
+    async def _read(self):
+        while self._subscribers:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except Exception:
+                log.exception('Failed to read click updates')
+                await asyncio.sleep(1)
+                continue
+
+            if message is None or message['type'] != 'message':
+                continue
+
+            token = message['channel'].decode('utf-8')[len(CHANNEL_PREFIX):]
+            clicks = int(message['data'])
+            self.stats['received'] += 1
+
+            for handler in list(self._subscribers.get(token, ())):
+                handler.push(token, clicks)
+                self.stats['delivered'] += 1
+
+    async def close(self):
+        """ Close every client and the pub/sub connection """
+        for handlers in list(self._subscribers.values()):
+            for handler in list(handlers):
+                handler.close(1001, 'Shutting down')
+
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.reset()
+
+    def metrics(self):
+        return dict(
+            self.stats,
+            connections=self.connections,
+            tokens=len(self._subscribers)
+        )
+
+
+def get_click_hub(config, redis):
+    return ClickHub(redis, config['ws_max_connections'])
@@ -0,0 +1,191 @@
+from collections import OrderedDict
+
+from onclick_signer.clock import Clock
+
+RATE_PREFIX = 'lastclick:'
+
+# Shared by the rate limit and click scripts.  Rate keys hold the time of the
+# last accepted click in ms, according to the signer's clock, which is
+# always the last ARGV.
+RATE_LUA = """
+local now = tonumber(ARGV[#ARGV])
+
+local function limited(key, window)
+    local last = redis.call('GET', key)
+    return last and now - tonumber(last) < tonumber(window)
+end
+
+local function mark(key, retention)
+    redis.call('SET', key, now, 'PX', retention)
+end
+"""
+
+# KEYS: token rate key, IP rate key
+# ARGV: token window in ms, IP window in ms, 1 to check before marking,
+#       ms to keep rate keys, now in ms
+#
+# Returns 1 if allowed, 0 if limited
+RATE_SCRIPT = RATE_LUA + """
+if ARGV[3] == '1' and (
+    limited(KEYS[1], ARGV[1]) or limited(KEYS[2], ARGV[2])
+) then
+    return 0
+end
+mark(KEYS[1], ARGV[4])
+mark(KEYS[2], ARGV[4])
+return 1
+"""
+
+
+class RateLimiter:
+    """ Minimum time between clicks, by token and by remote IP
+
+    Stats count hits (a recent click was found, so the click was limited)
+    and misses (the click was allowed).
+    """
+    # If the limit is enforced by ClickStore's click script
+    in_redis = False
+
+    def __init__(self, token_interval_ms, ip_interval_ms, retention_ms=None,
+                 clock=None):
+        self.clock = clock or Clock()
+        self.token_interval_ms = int(token_interval_ms)
+        self.ip_interval_ms = int(ip_interval_ms)
+        # How long the time of the last click is kept in Redis.  Click
+        # batches are credited from it, so it's also the longest a batch
+        # can cover.
+        self.retention_ms = int(
+            retention_ms or max(token_interval_ms, ip_interval_ms, 1)
+        )
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+        }
+
+    def record(self, allowed):
+        if allowed:
+            self.stats['misses'] += 1
+        else:
+            self.stats['hits'] += 1
+        return allowed
+
+    async def allow(self, token, remote_ip, check=True):
+        """ Mark a click, returning False if it should be limited
+
+        :param token: clicked
+        :param remote_ip: of the client
+        :param check: if False, only mark the click (e.g. for new tokens)
+        """
+        raise NotImplementedError()
+
+
+class MemoryRateLimiter(RateLimiter):
+    """ Per-process rate limiter with bounded memory
+
+    Entries expire once their interval has passed, so memory stays
+    proportional to the click rate rather than to every token and IP ever
+    seen.  Only suitable for a single signer process.
+    """
+    def __init__(self, token_interval_ms, ip_interval_ms, retention_ms=None,
+                 max_entries=100000, clock=None):
+        super().__init__(token_interval_ms, ip_interval_ms, retention_ms,
+                         clock)
+        self.max_entries = max_entries
+        # key -> expiry, kept in expiry order since every entry in a dict
+        # shares the same interval
+        self._tokens = OrderedDict()
+        self._ips = OrderedDict()
+
+    def __len__(self):
+        return len(self._tokens) + len(self._ips)
+
+    def _evict(self, entries, now):
+        while entries:
+            key, expires = next(iter(entries.items()))
+            if expires > now and len(entries) <= self.max_entries:
+                break
+            entries.popitem(last=False)
+
+    def _limited(self, entries, key, now):
+        expires = entries.get(key)
+        return expires is not None and expires > now
+
+    def _mark(self, entries, key, now, interval_ms):
+        if interval_ms > 0:
+            entries[key] = now + interval_ms / 1000
+            entries.move_to_end(key)
+
+    def limited(self, token, remote_ip=None):
+        """ If a click on the token, and from remote_ip if given, would be
+        limited, without marking it
+        """
+        now = self.clock.monotonic()
+        return self._limited(self._tokens, token, now) or (
+            remote_ip is not None and self._limited(self._ips, remote_ip, now)
+        )
+
+    async def allow(self, token, remote_ip, check=True):
+        now = self.clock.monotonic()
+
+        self._evict(self._tokens, now)
+        self._evict(self._ips, now)
+
+        if check and (
+            self._limited(self._tokens, token, now)
+            or self._limited(self._ips, remote_ip, now)
+        ):
+            return self.record(False)
+
+        self._mark(self._tokens, token, now, self.token_interval_ms)
+        self._mark(self._ips, remote_ip, now, self.ip_interval_ms)
+
+        return self.record(True)
+
+
+class RedisRateLimiter(RateLimiter):
+    """ Rate limiter shared by all signer processes using Redis PX keys """
+    in_redis = True
+
+    def __init__(self, redis, token_interval_ms, ip_interval_ms,
+                 retention_ms=None, clock=None):
+        super().__init__(token_interval_ms, ip_interval_ms, retention_ms,
+                         clock)
+        self.redis = redis
+        self._rate_script = redis.register_script(RATE_SCRIPT)
+
+    def keys(self, token, remote_ip):
+        return [RATE_PREFIX + token, RATE_PREFIX + remote_ip]
+
+    async def allow(self, token, remote_ip, check=True):
+        allowed = await self._rate_script(
+            keys=self.keys(token, remote_ip),
+            args=[
+                self.token_interval_ms,
+                self.ip_interval_ms,
+                1 if check else 0,
+                self.retention_ms,
+                self.clock.ms(),
+            ],
+        )
+        return self.record(bool(allowed))
+
+
+def get_rate_limiter(config, redis, clock=None):
+    """ Create the rate limiter selected by config """
+    kind = config['rate_limiter']
+    token_ms = config['token_click_interval_ms']
+    ip_ms = config['ip_click_interval_ms']
+    retention_ms = max(token_ms, ip_ms, 1) * config['max_click_batch']
+
+    if kind == 'redis':
+        return RedisRateLimiter(redis, token_ms, ip_ms, retention_ms, clock)
+    elif kind == 'memory':
+        return MemoryRateLimiter(
+            token_ms,
+            ip_ms,
+            retention_ms,
+            max_entries=config['rate_limit_max_entries'],
+            clock=clock
+        )
+
+    raise ValueError('Unknown rate limiter: {}'.format(kind))
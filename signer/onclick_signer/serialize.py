@@ -0,0 +1,103 @@
+import json
+from tornado.web import HTTPError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class InvalidBody(HTTPError):
+    """ The request body is too big, isn't JSON, or doesn't match its schema
+    """
+    def __init__(self, message, status_code=400):
+        super().__init__(status_code, message)
+        self.message = message
+
+
+class JSONSerializer:
+    """ The standard library json module """
+    name = 'json'
+
+    def dumps(self, v):
+        return json.dumps(v)
+
+    def loads(self, s):
+        return json.loads(s)
+
+
+class OrjsonSerializer:
+    """ orjson, several times faster than json for small documents """
+    name = 'orjson'
+
+    def dumps(self, v):
+        return orjson.dumps(v)
+
+    def loads(self, s):
+        return orjson.loads(s)
+
+
+def get_serializer(config):
+    """ The JSON library selected by config.  'auto' uses orjson if it's
+    installed.
+    """
+    kind = config['json_backend']
+
+    if kind == 'auto':
+        kind = 'json' if orjson is None else 'orjson'
+
+    if kind == 'json':
+        return JSONSerializer()
+    elif kind == 'orjson':
+        if orjson is None:
+            raise ValueError('orjson is not installed')
+        return OrjsonSerializer()
+
+    raise ValueError('Unknown JSON backend: {}'.format(kind))
+
+
+def check_schema(obj, schema):
+    """ Check the types of an object's fields
+
+    :param obj: parsed JSON
+    :param schema: dict of field name to the types allowed.  Fields are
+        optional, may be null, and fields not in the schema are ignored.
+    :returns: list of invalid field names
+    """
+    return [
+        name for name, types in schema.items()
+        if obj.get(name) is not None and (
+            # bool is an int, but never a valid number here
+            isinstance(obj[name], bool) or not isinstance(obj[name], types)
+        )
+    ]
+
+
+def parse_body(serializer, body, schema, max_size):
+    """ Parse a request body that should be a JSON object
+
+    Oversized bodies and anything that isn't an object are rejected before
+    parsing.
+
+    :raises InvalidBody: if the body is too big, malformed or doesn't match
+        the schema
+    """
+    if len(body) > max_size:
+        raise InvalidBody('Body too large', 413)
+    # Bytes from HTTP requests, str from WebSocket messages
+    if body.lstrip()[:1] not in (b'{', '{'):
+        raise InvalidBody('Expected a JSON object')
+
+    try:
+        obj = serializer.loads(body)
+    except ValueError:
+        raise InvalidBody('Malformed JSON')
+
+    if not isinstance(obj, dict):
+        raise InvalidBody('Expected a JSON object')
+
+    invalids = check_schema(obj, schema)
+    if invalids:
+        raise InvalidBody('Invalid input: {}'.format(', '.join(invalids)))
+
+    return obj
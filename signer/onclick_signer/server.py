@@ -0,0 +1,121 @@
+import os
+import signal
+import logging
+import tornado.gen
+import tornado.ioloop
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+from onclick_signer.metrics import make_metrics_app
+from onclick_signer.profiling import get_blocking_detector
+from onclick_signer.signer import get_signer
+from onclick_signer.web import make_app
+
+log = logging.getLogger().getChild('server')
+
+
+def serve(sockets, config, shutdown_timeout, worker=0):
+    """ Run one signer process on already bound sockets until SIGTERM
+
+    :param worker: number of this process, to pick its metrics port
+    """
+    app = make_app(config)
+    server = HTTPServer(app)
+    server.add_sockets(sockets)
+
+    metrics_port = app.settings['config']['metrics_port']
+    if metrics_port:
+        make_metrics_app(app).listen(
+            metrics_port + worker,
+            address=app.settings['config']['metrics_address']
+        )
+
+    app.settings['blocking'] = get_blocking_detector(app.settings['config'])
+
+    loop = tornado.ioloop.IOLoop.current()
+
+    async def shutdown():
+        log.warning('Shutting down, draining %d requests', app.inflight)
+
+        # Stop accepting connections and let in-flight requests finish
+        server.stop()
+        deadline = loop.time() + shutdown_timeout
+        while app.inflight > 0 and loop.time() < deadline:
+            await tornado.gen.sleep(0.05)
+
+        await server.close_all_connections()
+        if app.settings['compactor'] is not None:
+            app.settings['compactor'].stop()
+        if app.settings['blocking'] is not None:
+            app.settings['blocking'].stop()
+        await app.settings['hub'].close()
+        # Write any clicks still held by the aggregator
+        await app.settings['store'].close()
+        app.settings['executor'].shutdown()
+        loop.stop()
+
+    def on_signal(sig, frame):
+        if sig == signal.SIGHUP:
+            # Re-read the signing key for key rotation
+            loop.add_callback_from_signal(app.reload_signer)
+        else:
+            loop.add_callback_from_signal(shutdown)
+
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, on_signal)
+
+    loop.start()
+
+
+def run(config, port, workers=1, shutdown_timeout=10):
+    """ Run the signer with the given number of worker processes
+
+    Workers share the listening socket, and share rate limit and lock state
+    through Redis.  Signals sent to the parent are passed on to every worker.
+
+    :param config: for make_app()
+    :param port: to listen on
+    :param workers: number of processes, or 0 for one per CPU
+    :param shutdown_timeout: seconds to wait for in-flight requests
+    """
+    if not workers:
+        workers = os.cpu_count() or 1
+
+    sockets = bind_sockets(port)
+
+    # Unlock the key before forking so each worker has it loaded once
+    get_signer().load()
+
+    if workers == 1:
+        serve(sockets, config, shutdown_timeout)
+        return
+
+    children = []
+
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                serve(sockets, config, shutdown_timeout, worker=i)
+            except Exception:
+                log.exception('Worker %d failed', i)
+                status = 1
+            finally:
+                os._exit(status)
+        children.append(pid)
+
+    log.info('Started %d workers on port %d', workers, port)
+
+    def forward(sig, frame):
+        for pid in children:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, forward)
+
+    for pid in children:
+        os.waitpid(pid, 0)
@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+from threading import Lock
+from eth_account import Account
+
+# TODO: Move this to a separate package?
+from solidbyte.accounts import Accounts
+
+_cached_signer = None
+
+log = logging.getLogger().getChild('signer')
+
+
+class SignerService:
+    """ Process-wide holder for the unlocked claim signing key.
+
+    Decrypting the keystore runs scrypt, which takes hundreds of milliseconds
+    of CPU, so it is done once at startup (and on reload) instead of on every
+    claim request.  Given a private_key, no keystore is used at all, e.g. for
+    tests.
+    """
+    def __init__(self, keystore_dir=None, passphrase=None, private_key=None):
+        self.keystore_dir = keystore_dir
+        self.passphrase = passphrase
+        self.private_key = private_key
+        self._account = None
+        self._lock = Lock()
+        self.stats = {
+            'loads': 0,
+            'last_load_seconds': None,
+            'last_loaded_at': None,
+            'signatures': 0,
+        }
+
+    @property
+    def loaded(self):
+        return self._account is not None
+
+    @property
+    def address(self):
+        if not self.loaded:
+            self.load()
+        return self._account.address
+
+    def _unlock(self):
+        if self.private_key is not None:
+            return Account.from_key(self.private_key)
+
+        keystore_dir = self.keystore_dir or os.environ.get('ETHEREUM_KEYSTORE')
+        passphrase = self.passphrase or os.environ.get('ENCRYPTION_PASSPHRASE')
+
+        if not passphrase:
+            raise ValueError('ENCRYPTION_PASSPHRASE must be defined')
+
+        accounts = Accounts(keystore_dir=keystore_dir)
+        stored_accounts = accounts.get_accounts()
+        account = None
+
+        if not stored_accounts:
+            account = accounts.create_account(passphrase)
+        elif len(stored_accounts) > 1:
+            raise NotImplementedError('TODO: Support multiple accounts in keystore...')
+        else:
+            account = stored_accounts[0].address
+
+        return Account.from_key(accounts.unlock(account, passphrase))
+
+    def load(self):
+        """ Decrypt the signing key and hold it in memory """
+        with self._lock:
+            start = time.perf_counter()
+            account = self._unlock()
+            elapsed = time.perf_counter() - start
+
+            self._account = account
+            self.stats['loads'] += 1
+            self.stats['last_load_seconds'] = elapsed
+            self.stats['last_loaded_at'] = time.time()
+
+        log.info(
+            'Using account %s as signer (unlocked in %.3fs)',
+            account.address,
+            elapsed
+        )
+
+        return account.address
+
+    def reload(self):
+        """ Re-read the keystore, e.g. after a key rotation """
+        log.warning('Reloading signer key')
+        return self.load()
+
+    def sign_hash(self, message_hash):
+        """ Sign an already prefixed message hash """
+        if not self.loaded:
+            self.load()
+        self.stats['signatures'] += 1
+        return self._account.signHash(message_hash)
+
+    def sign_transaction(self, tx):
+        """ Sign a transaction, e.g. publishing an epoch's root """
+        if not self.loaded:
+            self.load()
+        return self._account.sign_transaction(tx)
+
+    def metrics(self):
+        return dict(self.stats, loaded=self.loaded)
+
+
+def get_signer():
+    global _cached_signer
+    if _cached_signer is None:
+        _cached_signer = SignerService()
+    return _cached_signer
@@ -0,0 +1,480 @@
+import time
+from onclick_signer.clock import Clock
+from onclick_signer.epochs import INCLUDED_KEY, RECIPIENTS_KEY
+from onclick_signer.layout import MOVE_FLAT_LUA, FlatLayout
+from onclick_signer.metrics import REDIS_SECONDS
+from onclick_signer.push import CHANNEL_PREFIX
+from onclick_signer.ratelimit import (
+    RATE_LUA,
+    RATE_PREFIX,
+    MemoryRateLimiter,
+)
+
+# Results of ClickStore.click() and click_batch()
+CLICK_OK = 1
+CLICK_LIMITED = 0
+CLICK_UNKNOWN = -1
+
+# Tokens with a claim signed, scored by when they can be removed
+CLAIMED_KEY = 'claimed'
+
+# Counters are a string key, or a hash field if one is given ('' for none).
+# With a TTL, the key expires that many ms after the last increment.  While
+# migrating to the hash layout, KEYS[4] is the flat counter, moved into the
+# hash field by get_count() if the field doesn't exist.
+COUNTER_LUA = MOVE_FLAT_LUA + """
+local function get_count(key, field)
+    if field ~= '' then
+        local clicks = redis.call('HGET', key, field)
+        if not clicks and KEYS[4] then
+            clicks = move_flat(key, field, KEYS[4])
+        end
+        return tonumber(clicks or '0')
+    end
+    return tonumber(redis.call('GET', key) or '0')
+end
+
+local function incr_count(key, field, n, ttl)
+    local clicks
+    if field ~= '' then
+        clicks = redis.call('HINCRBY', key, field, n)
+    else
+        clicks = redis.call('INCRBY', key, n)
+    end
+    if tonumber(ttl) > 0 then
+        redis.call('PEXPIRE', key, ttl)
+    end
+    return clicks
+end
+
+-- For ClickHub, from the script so it costs no extra round trip
+local function publish(channel, clicks)
+    if channel ~= '' then
+        redis.call('PUBLISH', channel, clicks)
+    end
+end
+"""
+
+# KEYS: counter, token rate key, IP rate key, and the flat counter while
+#       migrating
+# ARGV: token window in ms, IP window in ms, 1 if the token must already
+#       exist, 1 to enforce the rate limit windows, ms to keep rate keys,
+#       1 to increment (0 if the caller aggregates increments itself),
+#       channel to publish the new count on or '', counter TTL in ms or 0,
+#       counter hash field or '', now in ms
+#
+# Returns {status, clicks}, where clicks is the count stored in Redis after
+# the script ran.
+CLICK_SCRIPT = RATE_LUA + COUNTER_LUA + """
+local clicks = get_count(KEYS[1], ARGV[9])
+if ARGV[3] == '1' then
+    if clicks == 0 then
+        return {-1, 0}
+    end
+    if ARGV[4] == '1' and (
+        limited(KEYS[2], ARGV[1]) or limited(KEYS[3], ARGV[2])
+    ) then
+        return {0, clicks}
+    end
+end
+mark(KEYS[2], ARGV[5])
+mark(KEYS[3], ARGV[5])
+if ARGV[6] == '0' then
+    return {1, clicks}
+end
+clicks = incr_count(KEYS[1], ARGV[9], 1, ARGV[8])
+publish(ARGV[7], clicks)
+return {1, clicks}
+"""
+
+# KEYS: counter, token rate key, IP rate key, and the flat counter while
+#       migrating
+# ARGV: token window in ms, IP window in ms, clicks in the batch, ms to keep
+#       rate keys, most clicks to credit without a previous click on record,
+#       1 to increment (0 if the caller aggregates increments itself),
+#       channel to publish the new count on or '', counter TTL in ms or 0,
+#       counter hash field or '', now in ms
+#
+# At most one click is credited per window since the last accepted click, for
+# both the token and the IP.
+#
+# Returns {status, clicks, credited}
+BATCH_SCRIPT = RATE_LUA + COUNTER_LUA + """
+local clicks = get_count(KEYS[1], ARGV[9])
+if clicks == 0 then
+    return {-1, 0, 0}
+end
+
+local function allowance(key, window)
+    window = tonumber(window)
+    if window <= 0 then
+        return tonumber(ARGV[3])
+    end
+    local last = redis.call('GET', key)
+    if not last then
+        return tonumber(ARGV[5])
+    end
+    return math.floor((now - tonumber(last)) / window)
+end
+
+local credit = math.min(
+    tonumber(ARGV[3]),
+    allowance(KEYS[2], ARGV[1]),
+    allowance(KEYS[3], ARGV[2])
+)
+if credit <= 0 then
+    return {0, clicks, 0}
+end
+mark(KEYS[2], ARGV[4])
+mark(KEYS[3], ARGV[4])
+if ARGV[6] == '0' then
+    return {1, clicks, credit}
+end
+clicks = incr_count(KEYS[1], ARGV[9], credit, ARGV[8])
+publish(ARGV[7], clicks)
+return {1, clicks, credit}
+"""
+
+
+# Record signed claims, unless their token is registered for epochs.  The
+# check and the record are one step, so a token can't be registered for
+# epochs in between and have the same clicks put in an epoch.
+#
+# KEYS: epoch recipients, clicks included in epochs, claimed tokens
+# ARGV: when claimed tokens can be removed in ms or 0 to keep them, then
+#       each token and the clicks claimed
+#
+# Returns 1 for each claim refused, 0 for each recorded
+CLAIMED_SCRIPT = """
+local refused = {}
+for i = 2, #ARGV, 2 do
+    local token = ARGV[i]
+    local clicks = tonumber(ARGV[i + 1])
+    if redis.call('HEXISTS', KEYS[1], token) == 1 then
+        refused[#refused + 1] = 1
+    else
+        local included = tonumber(redis.call('HGET', KEYS[2], token) or '0')
+        if clicks > included then
+            redis.call('HSET', KEYS[2], token, clicks)
+        end
+        if ARGV[1] ~= '0' then
+            redis.call('ZADD', KEYS[3], ARGV[1], token .. ':' .. clicks)
+        end
+        refused[#refused + 1] = 0
+    end
+end
+return refused
+"""
+
+
+def count_spaced(timestamps, interval_ms):
+    """ Count client click timestamps that are at least interval_ms apart
+
+    :param timestamps: in ms, in the order they were clicked
+    :returns: number of clicks that could have been accepted one at a time,
+        or 0 if the timestamps are malformed
+    """
+    count = 0
+    last = None
+    for ts in timestamps:
+        if isinstance(ts, bool) or not isinstance(ts, (int, float)):
+            return 0
+        if last is not None and ts < last:
+            return 0
+        if last is None or ts - last >= interval_ms:
+            count += 1
+            last = ts
+    return count
+
+
+class ClickStore:
+    """ Click counters kept in Redis
+
+    Clicks are counted with a server-side script so the existence check, rate
+    limiting and increment happen in one atomic round trip.  A Redis rate
+    limiter is enforced inside that script, any other limiter is checked
+    before it.  Either way, the time of the last click is kept in Redis so
+    click batches can be credited against it.
+
+    With an aggregator, the scripts only check and rate limit clicks on
+    existing tokens, and the increments are written behind.  Counts returned
+    then include clicks this process hasn't written yet.  Clicks this process
+    has limited recently, or on a token with clicks pending, are rate limited
+    in memory and only read the stored count, see click_local().  Their rate
+    keys are marked in Redis by the next flush, so with a Redis rate limiter
+    other processes can accept a click up to a flush interval early.
+
+    :param redis: client
+    :param limiter: RateLimiter
+    :param max_batch: most clicks one batch can carry
+    :param aggregator: optional ClickAggregator
+    :param counts: optional CountCache for read_clicks()
+    :param layout: of the counters, FlatLayout by default
+    :param claimed_ttl_ms: if set, how long a token is kept after a claim is
+        signed for it, unless it's clicked again
+    :param clock: Clock, for rate limits and claimed retention
+    :param publish: if new counts are published for ClickHub.  Scripts that
+        increment a counter publish it, and otherwise the aggregator does.
+    """
+    def __init__(self, redis, limiter, max_batch, aggregator=None,
+                 counts=None, layout=None, claimed_ttl_ms=0, clock=None,
+                 publish=False):
+        self.redis = redis
+        self.publish = publish
+        self.clock = clock or Clock()
+        self.layout = layout or FlatLayout()
+        self.claimed_ttl_ms = int(claimed_ttl_ms)
+        self.limiter = limiter
+        self.max_batch = max_batch
+        self.aggregator = aggregator
+        self.counts = counts
+        # Limits clicks on tokens with clicks pending.  The memory limiter
+        # already has every click this process accepted.
+        self._local = limiter if not limiter.in_redis else MemoryRateLimiter(
+            limiter.token_interval_ms,
+            limiter.ip_interval_ms,
+            limiter.retention_ms,
+            clock=limiter.clock
+        )
+        # Sent with EVALSHA, and loaded into Redis on first use
+        self._click_script = redis.register_script(CLICK_SCRIPT)
+        self._batch_script = redis.register_script(BATCH_SCRIPT)
+        self._claimed_script = redis.register_script(CLAIMED_SCRIPT)
+
+    def _keys(self, token, remote_ip):
+        """ :returns: tuple of script keys, and the counter and clock script
+        args
+        """
+        key, field = self.layout.locate(token)
+        keys = [key, RATE_PREFIX + token, RATE_PREFIX + remote_ip]
+        if self.layout.migrating:
+            keys.append(token)
+        return keys, [self.layout.ttl_ms, field or '', self.clock.ms()]
+
+    async def _stored_clicks(self, token):
+        return int(await self.layout.get(self.redis, token) or 0)
+
+    async def get_clicks(self, token):
+        if self.aggregator is None:
+            return await self._stored_clicks(token)
+
+        # Read again if the token's pending clicks were written meanwhile,
+        # since they may or may not be in the stored count
+        while True:
+            generation = self.aggregator.generation
+            clicks = await self._stored_clicks(token)
+            if self.aggregator.settled(token, generation):
+                return clicks + self.aggregator.pending(token)
+            await self.aggregator.wait()
+
+    def _channel(self, token, publish):
+        """ Script arg to publish a token's count on, if publish """
+        return CHANNEL_PREFIX + token if publish and self.publish else ''
+
+    def _generation(self):
+        return self.aggregator.generation if self.aggregator is not None else 0
+
+    async def _add_pending(self, token, clicks, generation):
+        """ Add pending clicks to a count a script read, or read it again
+        like get_clicks() if they were written meanwhile
+        """
+        if self.aggregator.settled(token, generation):
+            return clicks + self.aggregator.pending(token)
+        return await self.get_clicks(token)
+
+    async def read_clicks(self, token):
+        """ get_clicks(), served from the count cache if it's recent """
+        if self.counts is None:
+            return await self.get_clicks(token)
+
+        clicks = self.counts.get(token)
+        if clicks is None:
+            clicks = await self.get_clicks(token)
+            self.counts.set(token, clicks)
+        return clicks
+
+    def _clicked(self, token):
+        if self.counts is not None:
+            self.counts.invalidate(token)
+
+    async def sync(self, tokens):
+        """ Write pending clicks for any of the tokens, e.g. before signing
+        claims for them
+        """
+        # pending() includes clicks being written, and flush() waits for
+        # that write before writing the rest
+        if self.aggregator is not None and any(
+            self.aggregator.pending(token) for token in tokens
+        ):
+            await self.aggregator.flush()
+
+    async def claimed(self, claims):
+        """ Record claims signed, before handing them out.  Their clicks
+        are kept out of epochs, whether or not epochs are built yet, and
+        with claimed_ttl_ms the tokens can be removed once it passes without
+        another click.
+
+        :param claims: list of (token, clicks)
+        :returns: set of tokens refused, as they're registered for epochs
+        """
+        if not claims:
+            return set()
+
+        expires = self.clock.ms() + self.claimed_ttl_ms
+        args = [expires if self.claimed_ttl_ms else 0]
+        for token, clicks in claims:
+            args.extend([token, clicks])
+
+        start = time.perf_counter()
+        refused = await self._claimed_script(
+            keys=[RECIPIENTS_KEY, INCLUDED_KEY, CLAIMED_KEY],
+            args=args
+        )
+        REDIS_SECONDS.observe(time.perf_counter() - start, 'claimed')
+
+        return {
+            token for (token, clicks), r in zip(claims, refused) if int(r)
+        }
+
+    async def close(self):
+        if self.aggregator is not None:
+            await self.aggregator.stop()
+
+    async def click_local(self, token, remote_ip):
+        """ Count a click without the click script, if the aggregator has
+        clicks pending for the token or this process limits it.  Nothing is
+        written, so the token's lock isn't needed.
+
+        :returns: tuple of (status, clicks), or None to run the script
+        """
+        if self.aggregator is None:
+            return None
+
+        pending = self.aggregator.pending(token)
+        if not pending and not self._local.limited(token):
+            return None
+
+        if self._local.limited(token, remote_ip):
+            self.limiter.record(False)
+            return CLICK_LIMITED, await self.get_clicks(token)
+
+        await self._local.allow(token, remote_ip, check=False)
+        if self.limiter.in_redis:
+            self.limiter.record(True)
+        self.aggregator.add(token, 1)
+        self.aggregator.mark(
+            [RATE_PREFIX + token, RATE_PREFIX + remote_ip],
+            self.clock.ms(),
+            self.limiter.retention_ms
+        )
+        self._clicked(token)
+        return CLICK_OK, await self.get_clicks(token)
+
+    async def click(self, token, remote_ip, create=False):
+        """ Count a click for a token
+
+        :param token: to count the click for
+        :param remote_ip: of the client, also rate limited
+        :param create: if the token is new and need not exist already
+        :returns: tuple of (status, clicks)
+        """
+        if not create:
+            result = await self.click_local(token, remote_ip)
+            if result is not None:
+                return result
+
+        if not self.limiter.in_redis and not await self.limiter.allow(
+            token,
+            remote_ip,
+            check=not create
+        ):
+            return CLICK_LIMITED, await self.get_clicks(token)
+
+        keys, counter_args = self._keys(token, remote_ip)
+        generation = self._generation()
+        start = time.perf_counter()
+        status, clicks = await self._click_script(
+            keys=keys,
+            args=[
+                self.limiter.token_interval_ms,
+                self.limiter.ip_interval_ms,
+                0 if create else 1,
+                1 if self.limiter.in_redis else 0,
+                self.limiter.retention_ms,
+                0 if self.aggregator is not None and not create else 1,
+                self._channel(token, self.aggregator is None and not create),
+            ] + counter_args,
+        )
+        REDIS_SECONDS.observe(time.perf_counter() - start, 'click')
+        status = int(status)
+        clicks = int(clicks)
+
+        if self.limiter.in_redis and not create and status != CLICK_UNKNOWN:
+            self.limiter.record(status == CLICK_OK)
+
+        if status == CLICK_OK:
+            self._clicked(token)
+
+        if self.aggregator is not None and not create:
+            if status == CLICK_OK:
+                self.aggregator.add(token, 1)
+                if self.limiter.in_redis:
+                    await self._local.allow(token, remote_ip, check=False)
+            clicks = await self._add_pending(token, clicks, generation)
+
+        return status, clicks
+
+    async def click_batch(self, token, remote_ip, timestamps):
+        """ Count a batch of clicks made by a client
+
+        Clicks are credited if they're spaced out by the token interval on
+        the client's clock, and then no faster than one per interval of the
+        server's clock since the last accepted click.
+
+        :param token: to count the clicks for
+        :param remote_ip: of the client
+        :param timestamps: of each click on the client, in ms
+        :returns: tuple of (status, clicks, credited)
+        """
+        count = count_spaced(timestamps, self.limiter.token_interval_ms)
+
+        if count < 1:
+            return CLICK_LIMITED, await self.get_clicks(token), 0
+
+        keys, counter_args = self._keys(token, remote_ip)
+        if self.aggregator is not None and self.aggregator.marked(keys[1:]):
+            # Credit the batch from the last click, not the last flush
+            await self.aggregator.flush()
+        generation = self._generation()
+        start = time.perf_counter()
+        status, clicks, credited = await self._batch_script(
+            keys=keys,
+            args=[
+                self.limiter.token_interval_ms,
+                self.limiter.ip_interval_ms,
+                min(count, self.max_batch),
+                self.limiter.retention_ms,
+                self.max_batch,
+                0 if self.aggregator is not None else 1,
+                self._channel(token, self.aggregator is None),
+            ] + counter_args,
+        )
+        REDIS_SECONDS.observe(time.perf_counter() - start, 'click_batch')
+        status = int(status)
+        clicks = int(clicks)
+        credited = int(credited)
+
+        if self.aggregator is not None:
+            if status == CLICK_OK:
+                self.aggregator.add(token, credited)
+            clicks = await self._add_pending(token, clicks, generation)
+
+        if status != CLICK_UNKNOWN:
+            self.limiter.record(status == CLICK_OK)
+
+        if status == CLICK_OK:
+            self._clicked(token)
+            if not self.limiter.in_redis:
+                await self.limiter.allow(token, remote_ip, check=False)
+
+        return status, clicks, credited
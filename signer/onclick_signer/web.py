@@ -1,43 +1,100 @@
 import re
 import os
-import json
-import redis
 import tornado.web
+import tornado.ioloop
+import tornado.websocket
 import logging
 from pathlib import Path
-from datetime import datetime, timedelta
 from secrets import token_hex
 from eth_account import Account
-from eth_account.messages import defunct_hash_message
 from eth_utils.address import is_address
 from eth_utils.hexadecimal import add_0x_prefix, remove_0x_prefix
+from redis import asyncio as aioredis
 from web3 import Web3
 
-#from onclick_signer.account import create_account
-# TODO: Move this to a separate package?
-from solidbyte.accounts import Accounts
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from onclick_signer.aggregator import get_click_aggregator
+from onclick_signer.cache import get_claim_cache, get_count_cache
+from onclick_signer.claims import create_claim
+from onclick_signer.clock import Clock
+from onclick_signer.compaction import get_compactor
+from onclick_signer.config import MIN_CLICK_DURATION, load_config
+from onclick_signer.epochs import (
+    CLAIMS_PREFIX,
+    RECIPIENTS_KEY,
+    MissingEpoch,
+    read_claims,
+)
+from onclick_signer.executor import ExecutorBusy, get_signing_executor
+from onclick_signer.layout import get_counter_layout
+from onclick_signer.locks import TokenLocked, get_lock_manager
+from onclick_signer.metrics import CLICKS, REQUEST_SECONDS, TOKENS_CREATED
+from onclick_signer.push import get_click_hub
+from onclick_signer.serialize import (
+    InvalidBody,
+    get_serializer,
+    parse_body,
+)
+from onclick_signer.ratelimit import get_rate_limiter
+from onclick_signer.signer import get_signer
+from onclick_signer.store import (
+    CLICK_LIMITED,
+    CLICK_OK,
+    CLICK_UNKNOWN,
+    ClickStore,
+)
 
 TOKEN_BYTES = 32
+# Enough for a full click batch
+WS_MAX_MESSAGE_SIZE = 16 * 1024
+# Fields of JSON request bodies, and the types allowed for them
+CLICK_SCHEMA = {
+    'token': str,
+    'clicks': list,
+}
+CLAIM_SCHEMA = {
+    'token': str,
+    'recipient': str,
+    'contract': str,
+}
+CLAIMS_SCHEMA = {
+    'claims': list,
+}
+EPOCH_SCHEMA = {
+    'token': str,
+    'recipient': str,
+}
 HEX_PATTERN = r'^(0x)?([A-Fa-f0-9]{64})$'
-MIN_CLICK_DURATION = timedelta(milliseconds=250)
 KEYSTORE_DIR = Path(
     os.environ.get('ETHEREUM_KEYSTORE', '~/.ethereum/keystore')
 ).expanduser().resolve()
 
-_cached_redis = None
-# in-memory click tracking
-_last_click = dict()
-_token_lock = dict()
-
 log = logging.getLogger().getChild('web')
-log.setLevel('DEBUG')
 
-def get_redis():
-    global _cached_redis
-    if _cached_redis is None:
-        # TODO this should probably be configurable
-        _cached_redis = redis.Redis(host='localhost', port=6379, db=0)
-    return _cached_redis
+def get_redis(config):
+    """ Create an asyncio Redis client backed by a connection pool, or by
+    an in-memory server
+    """
+    if config['redis_backend'] == 'memory':
+        if fakeredis is None:
+            raise ValueError('The memory Redis backend needs fakeredis')
+        return fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer())
+    elif config['redis_backend'] != 'redis':
+        raise ValueError(
+            'Unknown Redis backend: {}'.format(config['redis_backend'])
+        )
+
+    pool = aioredis.BlockingConnectionPool(
+        host=config['redis_host'],
+        port=config['redis_port'],
+        db=config['redis_db'],
+        max_connections=config['redis_pool_size'],
+    )
+    return aioredis.Redis(connection_pool=pool)
 
 def is_valid_token(tok):
     try:
@@ -49,20 +106,111 @@ def is_valid_token(tok):
     except AssertionError:
         return False
 
-def rgetint(r, key, default):
-    v = r.get(key)
-    if v:
-        return int(v)
-    return int(default)
+def normalize_token(tok):
+    """ A valid token as clicks are counted for it, without 0x """
+    return remove_0x_prefix(tok).lower()
+
+def parse_claim_request(req):
+    """ Validate a claim request
+
+    :returns: tuple of (token, recipient, contract, invalids), with the
+        token normalized and the addresses checksummed if they're valid
+    """
+    token = req.get('token')
+    recipient = req.get('recipient')
+    contract = req.get('contract')
+
+    invalids = []
+    if not is_valid_token(token):
+        invalids.append('token')
+    else:
+        token = normalize_token(token)
+    if not recipient or not is_address(recipient):
+        invalids.append('recipient')
+    else:
+        recipient = Web3.toChecksumAddress(recipient)
+    if not contract or not is_address(contract):
+        invalids.append('contract')
+    else:
+        contract = Web3.toChecksumAddress(contract)
+
+    return token, recipient, contract, invalids
 
-def create_claim(recipient, uid, amount, contract_address):
-    return Web3.solidityKeccak(
-        ['address', 'bytes32', 'uint256', 'address'],
-        [recipient, uid, amount, contract_address]
+def is_valid_batch(timestamps, max_batch):
+    return timestamps is None or (
+        isinstance(timestamps, list) and len(timestamps) <= max_batch
     )
 
+async def count_clicks(store, locks, token, remote_ip, timestamps=None):
+    """ Count one click, or a batch of client click timestamps, while
+    holding the token's lock
+
+    :returns: tuple of (status, clicks, accepted)
+    :raises TokenLocked: if another request holds the lock
+    """
+    # Clicks this process can count in memory don't need the lock
+    if timestamps is None:
+        result = await store.click_local(token, remote_ip)
+        if result is not None:
+            return result + (1,)
+
+    # No concurrent requests.  Only the click itself is locked.
+    async with locks.lock(token):
+        # Count the click if the token exists and isn't rate limited
+        if timestamps is None:
+            status, clicks = await store.click(token, remote_ip)
+            return status, clicks, 1
+        return await store.click_batch(token, remote_ip, timestamps)
+
+
+class SignerApplication(tornado.web.Application):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Requests being handled, so shutdown can wait for them
+        self.inflight = 0
+
+    def log_request(self, handler):
+        REQUEST_SECONDS.observe(
+            handler.request.request_time(),
+            type(handler).__name__,
+            handler.get_status()
+        )
+        super().log_request(handler)
+
+    async def reload_signer(self):
+        """ Re-read the signing key, e.g. on SIGHUP after a key rotation
+
+        Decrypting the keystore runs scrypt, so it's done off the IOLoop.
+        If it fails the old key is kept.
+        """
+        try:
+            await tornado.ioloop.IOLoop.current().run_in_executor(
+                None,
+                self.settings['signer'].reload
+            )
+        except Exception:
+            log.exception('Reloading the signer failed, keeping the old key')
+            return
+
+        self.settings['executor'].reload()
+
+    def metrics(self):
+        return {
+            'inflight': self.inflight,
+        }
+
 
 class JSONRequestHandler(tornado.web.RequestHandler):
+    _counted = False
+
+    def prepare(self):
+        self.application.inflight += 1
+        self._counted = True
+
+    def on_finish(self):
+        if self._counted:
+            self.application.inflight -= 1
+
     def set_default_headers(self, *args, **kwargs):
         # TODO: Should we care about CORS Origin?
         self.set_header("Access-Control-Allow-Origin", "*")
@@ -70,7 +218,38 @@ class JSONRequestHandler(tornado.web.RequestHandler):
         self.set_header("Access-Control-Allow-Methods", "POST, GET, OPTIONS")
 
     def write_json(self, v):
-        self.write(json.dumps(v))
+        self.write(self.settings['serializer'].dumps(v))
+
+    def write_error(self, status_code, **kwargs):
+        exc = kwargs.get('exc_info', (None, None, None))[1]
+        self.write_json({
+            'success': False,
+            'message': (
+                exc.message if isinstance(exc, InvalidBody) else self._reason
+            ),
+        })
+
+    def read_json(self, schema):
+        """ Parse the request body, which should be a JSON object
+
+        :raises InvalidBody: responded to with a 400, or a 413 for bodies
+            over max_body_size
+        """
+        return parse_body(
+            self.settings['serializer'],
+            self.request.body,
+            schema,
+            self.settings['config']['max_body_size']
+        )
+
+    def write_busy(self, v):
+        """ Respond 503, asking the client to back off """
+        self.set_status(503)
+        self.set_header(
+            'Retry-After',
+            str(self.settings['config']['signing_retry_after'])
+        )
+        self.write_json(v)
 
 class MainHandler(JSONRequestHandler):
     def get(self):
@@ -80,10 +259,25 @@ class MainHandler(JSONRequestHandler):
 
 class ClicksHandler(JSONRequestHandler):
     def initialize(self):
-        self.redis = get_redis()
+        self.store = self.settings['store']
+        self.max_age = self.settings['config']['clicks_max_age']
+        self.clicks = None
 
-    def get(self, token):
-        clicks = rgetint(self.redis, token, 0)
+    def compute_etag(self):
+        # The response only depends on the count
+        return '"{}"'.format(self.clicks)
+
+    async def get(self, token):
+        self.clicks = clicks = await self.store.read_clicks(token)
+
+        self.set_header(
+            'Cache-Control',
+            'public, max-age={}'.format(self.max_age)
+        )
+        self.set_etag_header()
+        if self.check_etag_header():
+            self.set_status(304)
+            return
 
         self.write_json({
             'success': True,
@@ -92,9 +286,10 @@ class ClicksHandler(JSONRequestHandler):
 
 class ClickHandler(JSONRequestHandler):
     def initialize(self):
-        self.redis = get_redis()
+        self.store = self.settings['store']
+        self.locks = self.settings['locks']
 
-    def post(self):
+    async def post(self):
         """ Handle POST request """
 
         if not self.request.body:
@@ -107,15 +302,35 @@ class ClickHandler(JSONRequestHandler):
             })
             return
 
-        now = datetime.now()
-        req = json.loads(self.request.body)
+        req = self.read_json(CLICK_SCHEMA)
         token = req.get('token')
+        # Optional batch of client click timestamps in ms
+        timestamps = req.get('clicks')
         clicks = 0
+        accepted = 1
 
-        # No concurrent requests
-        if token is not None:
-            if _token_lock.get(token):
-                log.warning('Token locked: {}'.format(token))
+        if not is_valid_batch(timestamps, self.store.max_batch):
+            log.warning('Invalid click batch')
+            self.set_status(400)
+            self.write_json({
+                'success': False,
+                'clicks': None,
+                'token': token,
+            })
+            return
+
+        if is_valid_token(token):
+            try:
+                status, clicks, accepted = await count_clicks(
+                    self.store,
+                    self.locks,
+                    token,
+                    self.request.remote_ip,
+                    timestamps
+                )
+            except TokenLocked:
+                log.warning('Token locked: %s', token)
+                CLICKS.inc('locked')
                 self.write_json({
                     'success': False,
                     'clicks': None,
@@ -123,94 +338,179 @@ class ClickHandler(JSONRequestHandler):
                 })
                 return
 
-            # Lock token
-            _token_lock[token] = True
-
-        if is_valid_token(token):
-            # Verify it exists
-            clicks = rgetint(self.redis, token, 0)
-
-            # Rate limiting by both token and IP address
-            if (
-                (
-                    _last_click.get(token)
-                    and now - _last_click[token] < MIN_CLICK_DURATION
-                )
-                or (
-                    _last_click.get(self.request.remote_ip)
-                    and now - _last_click[self.request.remote_ip] < MIN_CLICK_DURATION
-                )
-            ):
+            if status == CLICK_LIMITED:
                 log.warning('Clicking too often')
+                CLICKS.inc('limited')
 
                 self.set_status(429)
                 self.write_json({
                     'success': False,
                     'clicks': clicks,
                     'token': token,
+                    'accepted': 0,
                 })
-
-                # Unlock token
-                _token_lock[token] = False
-
                 return
+
         elif token is not None:
-            log.error('ERROR: Given token is invalid: {}'.format(token))
-        
+            log.error('ERROR: Given token is invalid: %s', token)
+
         # Generate token if needed, do not just accept what's given
         if token is None or clicks == 0:
-            if token is not None:
-                # Unlock the bad token
-                _token_lock[token] = False
-
             # Recreate the token to send back to the client
             token = token_hex(TOKEN_BYTES)
 
-            log.warning('Created token: {}'.format(token))
-
-        # Increment clicks
-        clicks += 1
-        self.redis.incr(token)
-        _last_click[token] = now
-        _last_click[self.request.remote_ip] = now
+            log.warning('Created token: %s', token)
+            TOKENS_CREATED.inc()
 
-        # Unlock token
-        _token_lock[token] = False
+            status, clicks = await self.store.click(
+                token,
+                self.request.remote_ip,
+                create=True
+            )
+            accepted = 1
 
         log.info('Clicked.')
+        CLICKS.inc('accepted')
 
         self.write_json({
             'success': True,
             'clicks': clicks,
             'token': token,
+            'accepted': accepted,
         })
 
-class ClaimHandler(JSONRequestHandler):
+class ClickSocketHandler(tornado.websocket.WebSocketHandler):
+    """ Push a token's click count as it changes, and take clicks
+
+    Clients send {} for one click or {"clicks": [<timestamp ms>, ...]} for a
+    batch, and get the same fields /click responds with.  Counts from clicks
+    on any signer process are pushed as {"token": ..., "clicks": ...}.
+    """
     def initialize(self):
-        self.redis = get_redis()
-        self.accounts = Accounts(keystore_dir=os.environ.get('ETHEREUM_KEYSTORE'))
+        self.store = self.settings['store']
+        self.locks = self.settings['locks']
+        self.hub = self.settings['hub']
+        self.idle_timeout = self.settings['config']['ws_idle_timeout']
+        self.token = None
+        self._idle = None
+
+    def check_origin(self, origin):
+        # Same as the Access-Control-Allow-Origin of the JSON handlers
+        return True
+
+    async def get(self, *args, **kwargs):
+        if self.hub.full():
+            log.warning('Too many WebSocket connections')
+            self.hub.stats['rejected'] += 1
+            self.set_status(503)
+            self.finish()
+            return
+        await super().get(*args, **kwargs)
+
+    def _touch(self):
+        """ Restart the idle timeout """
+        loop = tornado.ioloop.IOLoop.current()
+        if self._idle is not None:
+            loop.remove_timeout(self._idle)
+        self._idle = loop.call_later(self.idle_timeout, self._close_idle)
+
+    def _close_idle(self):
+        self._idle = None
+        self.close(1000, 'Idle')
+
+    def _reply(self, v):
+        try:
+            self.write_message(self.settings['serializer'].dumps(v))
+        except tornado.websocket.WebSocketClosedError:
+            pass
+
+    async def open(self, token):
+        if not is_valid_token(token):
+            self.close(1008, 'Invalid token')
+            return
 
-        stored_accounts = self.accounts.get_accounts()
-        passphrase = os.environ.get('ENCRYPTION_PASSPHRASE')
-        account = None
+        self.token = token
+        self.hub.connections += 1
+        self._touch()
 
-        if not passphrase:
-            raise ValueError('ENCRYPTION_PASSPHRASE must be defined')
+        await self.hub.subscribe(token, self)
+        if self.ws_connection is None:
+            # Closed while subscribing
+            await self.hub.unsubscribe(token, self)
+            return
 
-        if not stored_accounts:
-            account = self.accounts.create_account(passphrase)
-        elif len(stored_accounts) > 1:
-            raise NotImplementedError('TODO: Support multiple accounts in keystore...')
-        else:
-            account = stored_accounts[0].address
+        self.push(token, await self.store.read_clicks(token))
 
-        log.info('Using account {} as signer'.format(account))
+    def push(self, token, clicks):
+        self._touch()
+        self._reply({
+            'token': token,
+            'clicks': clicks,
+        })
 
-        privkey = self.accounts.unlock(account, passphrase)
-        self.signer_account_privkey = privkey
-        self.signer_account_address = account
+    async def on_message(self, message):
+        self._touch()
+
+        try:
+            req = parse_body(
+                self.settings['serializer'],
+                message,
+                CLICK_SCHEMA,
+                WS_MAX_MESSAGE_SIZE
+            )
+        except InvalidBody:
+            req = None
+        timestamps = req.get('clicks') if req is not None else None
+
+        if req is None or not is_valid_batch(timestamps, self.store.max_batch):
+            self._reply({
+                'success': False,
+                'clicks': None,
+                'token': self.token,
+                'accepted': 0,
+            })
+            return
 
-    def post(self):
+        try:
+            status, clicks, accepted = await count_clicks(
+                self.store,
+                self.locks,
+                self.token,
+                self.request.remote_ip,
+                timestamps
+            )
+        except TokenLocked:
+            status, clicks = CLICK_UNKNOWN, None
+
+        self._reply({
+            'success': status == CLICK_OK,
+            'clicks': clicks if status != CLICK_UNKNOWN else None,
+            'token': self.token,
+            'accepted': accepted if status == CLICK_OK else 0,
+        })
+
+    def on_close(self):
+        if self.token is None:
+            return
+
+        if self._idle is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(self._idle)
+            self._idle = None
+
+        self.hub.connections -= 1
+        tornado.ioloop.IOLoop.current().add_callback(
+            self.hub.unsubscribe,
+            self.token,
+            self
+        )
+
+class ClaimHandler(JSONRequestHandler):
+    def initialize(self):
+        self.store = self.settings['store']
+        self.claim_cache = self.settings['claim_cache']
+        self.executor = self.settings['executor']
+
+    async def post(self):
         """ Handle POST request """
 
         if not self.request.body:
@@ -223,25 +523,235 @@ class ClaimHandler(JSONRequestHandler):
             })
             return
 
-        req = json.loads(self.request.body)
+        req = self.read_json(CLAIM_SCHEMA)
+        token, recipient, contract, invalids = parse_claim_request(req)
+
+        if len(invalids) > 0:
+            log.warning('Invalid input: %s', ', '.join(invalids))
+
+            self.set_status(400)
+            self.write_json({
+                'success': False,
+                'clicks': None,
+                'token': '',
+                'message': 'Invalid input'
+            })
+            return
+
+        # Verify it exists, and look for a claim already signed for these
+        # clicks
+        await self.store.sync([token])
+        [(clicks, cached)] = await self.claim_cache.lookup_many([
+            (token, recipient, contract)
+        ])
+
+        if not clicks:
+            log.warning('Token has no clicks')
+            self.write_json({
+                'success': False,
+                'clicks': None,
+                'token': token,
+                'message': 'Try clicking first'
+            })
+            return
+
+        if cached is not None:
+            claim, signature = cached
+        else:
+            log.info(
+                'create_claim(%s, %s, %s, %s)',
+                recipient,
+                add_0x_prefix(token),
+                clicks * int(1e18),
+                contract
+            )
+
+            try:
+                [(claim, signature)] = await self.executor.sign([
+                    (recipient, token, clicks, contract)
+                ])
+            except ExecutorBusy:
+                log.warning('Signing queue full')
+                self.write_busy({
+                    'success': False,
+                    'clicks': clicks,
+                    'token': token,
+                    'message': 'Busy, try again later'
+                })
+                return
+
+            # Tokens registered for epochs are claimed with proofs instead
+            if await self.store.claimed([(token, clicks)]):
+                log.warning('Token is registered for epochs')
+                self.write_json({
+                    'success': False,
+                    'clicks': None,
+                    'token': token,
+                    'message': 'Claim with epoch proofs'
+                })
+                return
+
+            await self.claim_cache.store_many([
+                (token, recipient, contract, clicks, claim, signature)
+            ])
+
+        self.write_json({
+            'success': True,
+            'clicks': clicks,
+            'token': token,
+            'claim': claim.hex(),
+            'signature': signature.hex(),
+            'contract': contract,
+            'version': self.executor.version,
+        })
+
+class ClaimsHandler(JSONRequestHandler):
+    """ Sign claims for many tokens in one request """
+    def initialize(self):
+        self.store = self.settings['store']
+        self.claim_cache = self.settings['claim_cache']
+        self.executor = self.settings['executor']
+        self.max_claims = self.settings['config']['max_claim_batch']
+
+    async def post(self):
+        """ Handle POST request """
+
+        req = self.read_json(CLAIMS_SCHEMA) if self.request.body else {}
+        items = req.get('claims')
+
+        if (
+            not isinstance(items, list)
+            or not items
+            or len(items) > self.max_claims
+        ):
+            log.warning('Invalid claim batch')
+            self.set_status(400)
+            self.write_json({
+                'success': False,
+                'claims': None,
+                'message': 'Expected 1 to {} claims'.format(self.max_claims)
+            })
+            return
+
+        parsed = [
+            parse_claim_request(item) if isinstance(item, dict)
+            else (None, None, None, ['claim'])
+            for item in items
+        ]
+
+        valid = [i for i, p in enumerate(parsed) if not p[3]]
+
+        # Fetch every click count and cached claim in one round trip
+        await self.store.sync([parsed[i][0] for i in valid])
+        lookups = await self.claim_cache.lookup_many(
+            [parsed[i][:3] for i in valid]
+        )
+        clicks = {i: lookup[0] for i, lookup in zip(valid, lookups)}
+        signatures = {
+            i: lookup[1] for i, lookup in zip(valid, lookups)
+            if lookup[1] is not None
+        }
+
+        to_sign = [i for i in valid if clicks[i] and i not in signatures]
+
+        try:
+            signed = await self.executor.sign([
+                (parsed[i][1], parsed[i][0], clicks[i], parsed[i][2])
+                for i in to_sign
+            ]) if to_sign else []
+        except ExecutorBusy:
+            log.warning('Signing queue full')
+            self.write_busy({
+                'success': False,
+                'claims': None,
+                'message': 'Busy, try again later'
+            })
+            return
+
+        # Tokens registered for epochs are claimed with proofs instead
+        refused = await self.store.claimed([
+            (parsed[i][0], clicks[i]) for i in to_sign
+        ])
+        in_epochs = {i for i in to_sign if parsed[i][0] in refused}
+        signed = [
+            (i, s) for i, s in zip(to_sign, signed) if i not in in_epochs
+        ]
+        to_sign = [i for i, _ in signed]
+        signatures.update(signed)
+
+        if to_sign:
+            await self.claim_cache.store_many([
+                parsed[i][:3] + (clicks[i],) + signatures[i] for i in to_sign
+            ])
+
+        results = []
+        for i, (token, recipient, contract, invalids) in enumerate(parsed):
+            if invalids:
+                results.append({
+                    'success': False,
+                    'clicks': None,
+                    'token': '',
+                    'message': 'Invalid input: {}'.format(', '.join(invalids))
+                })
+            elif i in in_epochs:
+                results.append({
+                    'success': False,
+                    'clicks': None,
+                    'token': token,
+                    'message': 'Claim with epoch proofs'
+                })
+            elif i not in signatures:
+                results.append({
+                    'success': False,
+                    'clicks': None,
+                    'token': token,
+                    'message': 'Try clicking first'
+                })
+            else:
+                claim, signature = signatures[i]
+                results.append({
+                    'success': True,
+                    'clicks': clicks[i],
+                    'token': token,
+                    'claim': claim.hex(),
+                    'signature': signature.hex(),
+                    'contract': contract,
+                    'version': self.executor.version,
+                })
+
+        log.info(
+            'Signed %d of %d claims (%d cached)',
+            len(to_sign),
+            len(items),
+            len(signatures) - len(to_sign)
+        )
+
+        self.write_json({
+            'success': True,
+            'claims': results,
+        })
+
+class EpochHandler(JSONRequestHandler):
+    """ Register a token's clicks to be claimed in Merkle epochs """
+    def initialize(self):
+        self.store = self.settings['store']
+        self.redis = self.settings['redis']
+
+    async def post(self):
+        """ Handle POST request """
+
+        req = self.read_json(EPOCH_SCHEMA) if self.request.body else {}
         token = req.get('token')
         recipient = req.get('recipient')
-        contract = req.get('contract')
 
         invalids = []
         if not is_valid_token(token):
             invalids.append('token')
         if not recipient or not is_address(recipient):
             invalids.append('recipient')
-        if not contract or not is_address(contract):
-            invalids.append('contract')
-
-        recipient = Web3.toChecksumAddress(recipient)
-        contract = Web3.toChecksumAddress(contract)
-
-        if len(invalids) > 0:
-            log.warning('Invalid input: {}'.format(', '.join(invalids)))
 
+        if invalids:
+            log.warning('Invalid input: %s', ', '.join(invalids))
             self.set_status(400)
             self.write_json({
                 'success': False,
@@ -251,11 +761,9 @@ class ClaimHandler(JSONRequestHandler):
             })
             return
 
-        # Verify it exists
-        clicks = rgetint(self.redis, token, 0)
-
+        token = normalize_token(token)
+        clicks = await self.store.get_clicks(token)
         if not clicks:
-            log.warning('Token has no clicks')
             self.write_json({
                 'success': False,
                 'clicks': None,
@@ -264,41 +772,120 @@ class ClaimHandler(JSONRequestHandler):
             })
             return
 
-        log.info('create_claim({}, {}, {}, {})'.format(
-            recipient,
-            add_0x_prefix(token),
-            clicks * int(1e18),
-            contract
-        ))
-
-        # Assemble claim
-        claim = create_claim(
-            recipient,
-            add_0x_prefix(token),
-            clicks * int(1e18),
-            contract
-        )
-        prefixed_claim_hash = defunct_hash_message(claim)
-        # Docstring for this function sugests this does not prefix messages, so
-        # we're prefixing above
-        signed = self.accounts.eth_account.signHash(
-            prefixed_claim_hash,
-            self.signer_account_privkey
-        )
+        # Later epochs go to the latest recipient
+        recipient = Web3.toChecksumAddress(recipient)
+        await self.redis.hset(RECIPIENTS_KEY, token, recipient)
 
         self.write_json({
             'success': True,
             'clicks': clicks,
             'token': token,
-            'claim': claim.hex(),
-            'signature': signed.signature.hex(),
-            'contract': contract,
+            'recipient': recipient,
         })
 
-def make_app():
-    return tornado.web.Application([
+class ProofsHandler(JSONRequestHandler):
+    """ Merkle proofs of a token's claims in every committed epoch """
+    def initialize(self):
+        self.redis = self.settings['redis']
+        self.epoch_dir = self.settings['config']['epoch_dir']
+
+    async def get(self, token):
+        if not is_valid_token(token):
+            log.warning('Invalid input: token')
+            self.set_status(400)
+            self.write_json({
+                'success': False,
+                'claims': None,
+                'token': '',
+                'message': 'Invalid input'
+            })
+            return
+
+        token = normalize_token(token)
+        entries = await self.redis.hgetall(CLAIMS_PREFIX + token)
+
+        try:
+            claims = await tornado.ioloop.IOLoop.current().run_in_executor(
+                None,
+                read_claims,
+                self.epoch_dir,
+                token,
+                entries
+            )
+        except MissingEpoch as exc:
+            log.error('%s in %s', exc, self.epoch_dir)
+            self.set_status(404)
+            self.write_json({
+                'success': False,
+                'claims': None,
+                'token': token,
+                'message': str(exc)
+            })
+            return
+
+        self.write_json({
+            'success': True,
+            'token': token,
+            'claims': claims,
+        })
+
+
+def make_app(config=None, redis=None, clock=None, signer=None):
+    """ Create the signer app
+
+    :param config: overriding DEFAULTS
+    :param redis: client to use instead of one from get_redis()
+    :param clock: Clock to use instead of the system clock
+    :param signer: SignerService to use instead of get_signer()
+    """
+    config = load_config(config)
+    redis = redis or get_redis(config)
+    clock = clock or Clock()
+    limiter = get_rate_limiter(config, redis, clock)
+    layout = get_counter_layout(config)
+
+    # Unlock the signing key up front so claims don't pay for it
+    signer = signer or get_signer()
+    if not signer.loaded:
+        signer.load()
+
+    routes = [
         (r"/", MainHandler),
         (r"/claim", ClaimHandler),
+        (r"/claims", ClaimsHandler),
         (r"/click", ClickHandler),
         (r"/clicks/([A-Fa-f0-9]+)", ClicksHandler),
-    ])
+        (r"/ws/([A-Fa-f0-9]+)", ClickSocketHandler),
+    ]
+    if config['epoch_dir']:
+        routes.extend([
+            (r"/epoch", EpochHandler),
+            (r"/proofs/([A-Fa-f0-9]+)", ProofsHandler),
+        ])
+
+    return SignerApplication(
+        routes,
+        config=config,
+        store=ClickStore(
+            redis,
+            limiter,
+            config['max_click_batch'],
+            aggregator=get_click_aggregator(config, redis),
+            counts=get_count_cache(config, clock),
+            layout=layout,
+            claimed_ttl_ms=config['claimed_token_ttl'] * 1000,
+            clock=clock,
+            publish=True
+        ),
+        locks=get_lock_manager(config, redis),
+        signer=signer,
+        executor=get_signing_executor(config, signer),
+        claim_cache=get_claim_cache(config, redis),
+        hub=get_click_hub(config, redis),
+        serializer=get_serializer(config),
+        compactor=get_compactor(config, redis, layout, clock),
+        clock=clock,
+        redis=redis,
+        websocket_ping_interval=config['ws_ping_interval'],
+        websocket_max_message_size=WS_MAX_MESSAGE_SIZE,
+    )
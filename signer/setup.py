@@ -42,10 +42,14 @@ setup(
     install_requires=requirements_to_list('requirements.txt'),
     extras_require={
         'test': requirements_to_list('requirements.test.txt'),
+        'orjson': ['orjson>=3'],
+        'memory': ['fakeredis[lua]>=2'],
     },
     entry_points={
         'console_scripts': [
             'ocsigner=onclick_signer.cli:main',
+            'ocsigner-migrate=onclick_signer.migrate:main',
+            'ocsigner-epoch=onclick_signer.epochs:main',
         ],
     },
     package_data={
@@ -0,0 +1,38 @@
+import pytest
+
+from onclick_signer.clock import FakeClock
+from onclick_signer.signer import SignerService
+from onclick_signer.web import make_app
+
+# Any key will do, so the keystore and its scrypt are skipped
+TEST_KEY = '0x' + '4c' * 32
+
+# Every app gets its own in-memory Redis
+CONFIG = { 'redis_backend': 'memory' }
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers',
+        'app_config(**settings): config for the app fixture, over CONFIG'
+    )
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(scope='session')
+def signer():
+    return SignerService(private_key=TEST_KEY)
+
+
+@pytest.fixture
+def app(request, clock, signer):
+    """ make_app() with CONFIG, and any settings from the app_config mark """
+    config = dict(CONFIG)
+    marker = request.node.get_closest_marker('app_config')
+    if marker is not None:
+        config.update(marker.kwargs)
+    return make_app(config, clock=clock, signer=signer)
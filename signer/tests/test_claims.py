@@ -0,0 +1,100 @@
+import random
+from eth_account import Account
+from eth_account.messages import defunct_hash_message
+from eth_utils.hexadecimal import encode_hex
+from web3 import Web3
+
+from onclick_signer.claims import (
+    create_claim,
+    create_claim_reference,
+    create_typed_claim,
+    create_typed_claim_reference,
+    prefix_hash,
+    sign_claim,
+)
+
+def random_address(rand):
+    return Web3.toChecksumAddress(encode_hex(rand.getrandbits(160).to_bytes(20, 'big')))
+
+def test_create_claim_matches_reference():
+    """ The packed encoder must match solidityKeccak byte for byte """
+    rand = random.Random(1337)
+    contracts = [random_address(rand) for _ in range(3)]
+
+    for i in range(2000):
+        recipient = random_address(rand)
+        uid = encode_hex(rand.getrandbits(256).to_bytes(32, 'big'))
+        amount = rand.choice([
+            0,
+            1,
+            rand.getrandbits(64) * int(1e18),
+            rand.getrandbits(256),
+            2 ** 256 - 1,
+        ])
+        contract = rand.choice(contracts)
+
+        claim = create_claim(recipient, uid, amount, contract)
+
+        assert claim == create_claim_reference(recipient, uid, amount, contract)
+        assert prefix_hash(claim) == defunct_hash_message(claim)
+
+
+def test_create_typed_claim_matches_reference():
+    """ The typed claim digest must match the generic ABI encoding """
+    rand = random.Random(1337)
+    contracts = [random_address(rand) for _ in range(3)]
+
+    for i in range(500):
+        recipient = random_address(rand)
+        uid = encode_hex(rand.getrandbits(256).to_bytes(32, 'big'))
+        amount = rand.choice([0, 1, rand.getrandbits(256), 2 ** 256 - 1])
+        contract = rand.choice(contracts)
+        chain_id = rand.choice([1, 1337, rand.getrandbits(64)])
+
+        assert create_typed_claim(
+            recipient,
+            uid,
+            amount,
+            contract,
+            chain_id
+        ) == create_typed_claim_reference(
+            recipient,
+            uid,
+            amount,
+            contract,
+            chain_id
+        )
+
+
+def test_sign_claim_versions(signer):
+    """ Version 1 signs the prefixed claim hash, version 2 the digest """
+    rand = random.Random(1337)
+    recipient = random_address(rand)
+    contract = random_address(rand)
+    token = encode_hex(rand.getrandbits(256).to_bytes(32, 'big'))[2:]
+    amount = 3 * int(1e18)
+
+    claim, signature = sign_claim(signer, recipient, token, 3, contract)
+    assert claim == create_claim(recipient, '0x' + token, amount, contract)
+    assert Account.recoverHash(
+        prefix_hash(claim),
+        signature=signature
+    ) == signer.address
+
+    claim, signature = sign_claim(
+        signer,
+        recipient,
+        token,
+        3,
+        contract,
+        version=2,
+        chain_id=1337
+    )
+    assert claim == create_typed_claim(
+        recipient,
+        '0x' + token,
+        amount,
+        contract,
+        1337
+    )
+    assert Account.recoverHash(claim, signature=signature) == signer.address
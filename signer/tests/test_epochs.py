@@ -0,0 +1,374 @@
+import json
+import shutil
+import fakeredis
+import pytest
+from eth_utils.hexadecimal import decode_hex
+from web3 import Web3
+
+from onclick_signer.epochs import (
+    CURRENT_KEY,
+    INCLUDED_KEY,
+    LOCK_KEY,
+    PUBLISHED_KEY,
+    RECIPIENTS_KEY,
+    build_epoch,
+    epoch_path,
+    run_epoch,
+)
+from onclick_signer.layout import FlatLayout
+from onclick_signer.merkle import leaf_hash, verify
+from onclick_signer.web import make_app
+from test_web import http_get, http_post
+
+RECIPIENT = Web3.toChecksumAddress('0x3e11d657331c286624826ac797a974777be0e47f')
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def sync_redis(server):
+    """ The builder's client, sharing the app's in-memory Redis """
+    return fakeredis.FakeRedis(server=server)
+
+
+@pytest.fixture
+def app(server, tmp_path, clock, signer):
+    return make_app(
+        {'redis_backend': 'memory', 'epoch_dir': str(tmp_path)},
+        redis=fakeredis.aioredis.FakeRedis(server=server),
+        clock=clock,
+        signer=signer
+    )
+
+
+async def click(http_client, base_url, clock, token=None, times=1):
+    for i in range(times):
+        response = await http_post(
+            http_client,
+            "{}/click".format(base_url),
+            { 'token': token }
+        )
+        token = json.loads(response.body)['token']
+        clock.advance(1)
+    return token
+
+
+async def get_proofs(http_client, base_url, token):
+    response = await http_get(
+        http_client,
+        "{}/proofs/{}".format(base_url, token)
+    )
+    assert response.code == 200
+    body = json.loads(response.body)
+    assert body['success']
+    return body['claims']
+
+
+@pytest.mark.gen_test
+async def test_epochs(http_client, base_url, clock, sync_redis, tmp_path):
+    token = await click(http_client, base_url, clock, times=3)
+
+    response = await http_post(
+        http_client,
+        "{}/epoch".format(base_url),
+        { 'token': token, 'recipient': RECIPIENT.lower() }
+    )
+    body = json.loads(response.body)
+    assert body['success']
+    assert body['clicks'] == 3
+    assert body['recipient'] == RECIPIENT
+
+    # Not in an epoch yet
+    assert await get_proofs(http_client, base_url, token) == []
+
+    published = []
+    first = run_epoch(
+        sync_redis,
+        FlatLayout(),
+        str(tmp_path),
+        publish=published.append
+    )
+    assert first['epoch'] == 1
+    assert first['leaves'] == 1
+    assert first['total'] == str(3 * 10 ** 18)
+    assert published == [first]
+
+    # Only clicks since the last epoch are in the next
+    await click(http_client, base_url, clock, token, times=2)
+    second = run_epoch(sync_redis, FlatLayout(), str(tmp_path))
+    assert second['epoch'] == 2
+    assert second['total'] == str(2 * 10 ** 18)
+
+    # Nothing new
+    assert run_epoch(sync_redis, FlatLayout(), str(tmp_path)) is None
+    assert int(sync_redis.get(CURRENT_KEY)) == 2
+
+    claims = await get_proofs(http_client, base_url, token)
+    assert [c['epoch'] for c in claims] == [1, 2]
+
+    for claim, metadata in zip(claims, (first, second)):
+        assert claim['index'] == 0
+        assert claim['recipient'] == RECIPIENT
+        assert claim['amount'] == metadata['total']
+        assert verify(
+            [decode_hex(node) for node in claim['proof']],
+            decode_hex(metadata['root']),
+            leaf_hash(
+                claim['index'],
+                claim['recipient'],
+                decode_hex(claim['uid']),
+                int(claim['amount'])
+            )
+        )
+
+
+@pytest.mark.gen_test
+async def test_epoch_many_tokens(http_client, base_url, clock, sync_redis,
+                                 tmp_path):
+    tokens = []
+    for i in range(20):
+        token = await click(http_client, base_url, clock, times=i % 3 + 1)
+        tokens.append(token)
+        sync_redis.hset(RECIPIENTS_KEY, token, RECIPIENT)
+
+    # Read a few tokens at a time
+    metadata = run_epoch(sync_redis, FlatLayout(), str(tmp_path), batch=3)
+    assert metadata['leaves'] == 20
+
+    indexes = set()
+    for i, token in enumerate(tokens):
+        [claim] = await get_proofs(http_client, base_url, token)
+        assert int(claim['amount']) == (i % 3 + 1) * 10 ** 18
+        assert verify(
+            [decode_hex(node) for node in claim['proof']],
+            decode_hex(metadata['root']),
+            leaf_hash(
+                claim['index'],
+                RECIPIENT,
+                decode_hex(token),
+                int(claim['amount'])
+            )
+        )
+        indexes.add(claim['index'])
+
+    assert indexes == set(range(20))
+
+
+@pytest.mark.gen_test
+async def test_epoch_resumes_commit(http_client, base_url, clock, sync_redis,
+                                    tmp_path):
+    """ An epoch built but not committed is committed as built """
+    token = await click(http_client, base_url, clock, times=2)
+    sync_redis.hset(RECIPIENTS_KEY, token, RECIPIENT)
+
+    built = build_epoch(sync_redis, FlatLayout(), str(tmp_path), 1)
+
+    # Clicked before the next run
+    await click(http_client, base_url, clock, token)
+
+    published = []
+    assert run_epoch(
+        sync_redis,
+        FlatLayout(),
+        str(tmp_path),
+        publish=published.append
+    ) == built
+    assert published == [built]
+    assert int(sync_redis.get(PUBLISHED_KEY)) == 1
+
+    [claim] = await get_proofs(http_client, base_url, token)
+    assert claim['amount'] == str(2 * 10 ** 18)
+
+    # The click since is in the next epoch
+    assert run_epoch(
+        sync_redis,
+        FlatLayout(),
+        str(tmp_path)
+    )['total'] == str(10 ** 18)
+
+
+@pytest.mark.gen_test
+async def test_epoch_invalid(http_client, base_url):
+    response = await http_post(
+        http_client,
+        "{}/epoch".format(base_url),
+        { 'token': 'ab' * 32, 'recipient': 'nope' },
+        raise_error=False
+    )
+    assert response.code == 400
+
+    response = await http_post(
+        http_client,
+        "{}/epoch".format(base_url),
+        { 'token': 'ab' * 32, 'recipient': RECIPIENT }
+    )
+    body = json.loads(response.body)
+    assert not body['success']
+    assert body['message'] == 'Try clicking first'
+
+
+@pytest.mark.gen_test
+async def test_proofs_missing_epoch(http_client, base_url, clock, sync_redis,
+                                    tmp_path):
+    token = await click(http_client, base_url, clock, times=2)
+    sync_redis.hset(RECIPIENTS_KEY, token, RECIPIENT)
+    run_epoch(sync_redis, FlatLayout(), str(tmp_path))
+
+    # Not synced to this signer
+    shutil.rmtree(epoch_path(str(tmp_path), 1))
+
+    response = await http_get(
+        http_client,
+        "{}/proofs/{}".format(base_url, token),
+        raise_error=False
+    )
+    assert response.code == 404
+    body = json.loads(response.body)
+    assert not body['success']
+    assert body['message'] == 'Epoch 1 not found'
+
+
+@pytest.mark.gen_test
+async def test_proofs_invalid(http_client, base_url):
+    response = await http_get(
+        http_client,
+        "{}/proofs/{}".format(base_url, 'ab' * 8),
+        raise_error=False
+    )
+    assert response.code == 400
+
+
+async def post_claim(http_client, base_url, token):
+    response = await http_post(http_client, "{}/claim".format(base_url), {
+        'token': token,
+        'contract': '0xee67A313FA15595cd8D20C018a0d6C3765585589',
+        'recipient': RECIPIENT,
+    })
+    return json.loads(response.body)
+
+
+@pytest.mark.gen_test
+async def test_epoch_token_prefixed(http_client, base_url, clock, sync_redis,
+                                    tmp_path):
+    token = await click(http_client, base_url, clock, times=2)
+
+    response = await http_post(
+        http_client,
+        "{}/epoch".format(base_url),
+        { 'token': '0x' + token.upper(), 'recipient': RECIPIENT }
+    )
+    body = json.loads(response.body)
+    assert body['success']
+    assert body['token'] == token
+
+    metadata = run_epoch(sync_redis, FlatLayout(), str(tmp_path))
+    assert metadata['total'] == str(2 * 10 ** 18)
+
+
+@pytest.mark.gen_test
+async def test_epoch_excludes_claims(http_client, base_url, clock, sync_redis,
+                                     tmp_path):
+    token = await click(http_client, base_url, clock, times=2)
+
+    # Clicks claimed with a signed claim aren't put in epochs
+    assert (await post_claim(http_client, base_url, token))['success']
+
+    await click(http_client, base_url, clock, token)
+    await http_post(
+        http_client,
+        "{}/epoch".format(base_url),
+        { 'token': token, 'recipient': RECIPIENT }
+    )
+    metadata = run_epoch(sync_redis, FlatLayout(), str(tmp_path))
+    assert metadata['total'] == str(10 ** 18)
+
+    # Once registered, the token is only claimed in epochs
+    body = await post_claim(http_client, base_url, token)
+    assert not body['success']
+    assert body['message'] == 'Claim with epoch proofs'
+
+    response = await http_post(http_client, "{}/claims".format(base_url), {
+        'claims': [{
+            'token': token,
+            'contract': '0xee67A313FA15595cd8D20C018a0d6C3765585589',
+            'recipient': RECIPIENT,
+        }],
+    })
+    [result] = json.loads(response.body)['claims']
+    assert not result['success']
+    assert result['message'] == 'Claim with epoch proofs'
+
+
+@pytest.mark.gen_test
+async def test_epoch_registered_while_signing(http_server, http_client,
+                                              base_url, clock, sync_redis,
+                                              tmp_path, monkeypatch):
+    """ A claim is refused if the token was registered while it was signed,
+    and its clicks are left to epochs
+    """
+    token = await click(http_client, base_url, clock, times=2)
+    executor = http_server.request_callback.settings['executor']
+    sign = executor.sign
+
+    async def sign_and_register(claims):
+        signed = await sign(claims)
+        await http_post(
+            http_client,
+            "{}/epoch".format(base_url),
+            { 'token': token, 'recipient': RECIPIENT }
+        )
+        return signed
+
+    monkeypatch.setattr(executor, 'sign', sign_and_register)
+
+    body = await post_claim(http_client, base_url, '0x' + token.upper())
+    assert not body['success']
+    assert body['message'] == 'Claim with epoch proofs'
+    assert not sync_redis.hexists(INCLUDED_KEY, token)
+
+    metadata = run_epoch(sync_redis, FlatLayout(), str(tmp_path))
+    assert metadata['total'] == str(2 * 10 ** 18)
+
+
+@pytest.mark.gen_test
+async def test_epoch_lock_kept(http_client, base_url, clock, sync_redis,
+                               tmp_path):
+    """ A run that outlived its lock leaves the next run's lock alone """
+    token = await click(http_client, base_url, clock)
+    sync_redis.hset(RECIPIENTS_KEY, token, RECIPIENT)
+
+    def publish(metadata):
+        # Expired, and taken by another run
+        sync_redis.set(LOCK_KEY, 'other')
+
+    run_epoch(sync_redis, FlatLayout(), str(tmp_path), publish=publish)
+    assert sync_redis.get(LOCK_KEY) == b'other'
+
+    sync_redis.delete(LOCK_KEY)
+    await click(http_client, base_url, clock, token)
+    run_epoch(sync_redis, FlatLayout(), str(tmp_path))
+    assert sync_redis.get(LOCK_KEY) is None
+
+
+@pytest.mark.gen_test
+async def test_epoch_prunes_removed(http_client, base_url, clock, sync_redis,
+                                    tmp_path):
+    """ Tokens whose counters are gone are dropped, but keep their proofs """
+    tokens = [await click(http_client, base_url, clock) for i in range(2)]
+    for token in tokens:
+        sync_redis.hset(RECIPIENTS_KEY, token, RECIPIENT)
+    run_epoch(sync_redis, FlatLayout(), str(tmp_path))
+
+    # Expired
+    sync_redis.delete(tokens[0])
+    await click(http_client, base_url, clock, tokens[1])
+    metadata = run_epoch(sync_redis, FlatLayout(), str(tmp_path))
+    assert metadata['leaves'] == 1
+
+    assert not sync_redis.hexists(RECIPIENTS_KEY, tokens[0])
+    assert not sync_redis.hexists(INCLUDED_KEY, tokens[0])
+    assert sync_redis.hexists(RECIPIENTS_KEY, tokens[1])
+    assert len(await get_proofs(http_client, base_url, tokens[0])) == 1
@@ -0,0 +1,33 @@
+import pytest
+
+from onclick_signer.locks import MemoryLockManager, TokenLocked
+
+TOKEN = 'ab' * 32
+
+@pytest.mark.gen_test
+async def test_memory_lock():
+    locks = MemoryLockManager()
+
+    async with locks.lock(TOKEN):
+        assert len(locks) == 1
+
+        with pytest.raises(TokenLocked):
+            async with locks.lock(TOKEN):
+                pass
+
+    # Released and cleaned up
+    assert len(locks) == 0
+    assert locks.stats == { 'acquired': 1, 'contended': 1 }
+
+@pytest.mark.gen_test
+async def test_memory_lock_released_on_error():
+    locks = MemoryLockManager()
+
+    with pytest.raises(ValueError):
+        async with locks.lock(TOKEN):
+            raise ValueError()
+
+    async with locks.lock(TOKEN):
+        pass
+
+    assert len(locks) == 0
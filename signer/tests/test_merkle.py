@@ -0,0 +1,63 @@
+import os
+import pytest
+from eth_hash.auto import keccak
+
+from onclick_signer import merkle
+from onclick_signer.merkle import (
+    MerkleTree,
+    MerkleTreeWriter,
+    hash_pair,
+    leaf_hash,
+    verify,
+)
+
+RECIPIENT = '0x3e11d657331c286624826ac797a974777be0e47f'
+
+
+def naive_root(nodes):
+    """ The root, with the whole tree in memory """
+    while len(nodes) > 1:
+        nodes = [
+            hash_pair(*nodes[i:i + 2]) if i + 1 < len(nodes) else nodes[i]
+            for i in range(0, len(nodes), 2)
+        ]
+    return nodes[0]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 4, 5, 7, 8, 9, 16, 17, 100])
+def test_tree(tmp_path, monkeypatch, size):
+    """ Trees built a chunk at a time match one built in memory, and every
+    leaf's proof verifies
+    """
+    # Small chunks, so pairs and odd nodes land on chunk boundaries
+    monkeypatch.setattr(merkle, 'CHUNK_HASHES', 4)
+
+    leaves = [
+        leaf_hash(i, RECIPIENT, keccak(str(i).encode()), i * 10 ** 18)
+        for i in range(size)
+    ]
+    writer = MerkleTreeWriter(str(tmp_path))
+    for leaf in leaves:
+        writer.add(leaf)
+    root = writer.finish()
+
+    assert root == naive_root(leaves)
+
+    tree = MerkleTree(str(tmp_path))
+    assert tree.size == size
+    assert tree.root == root
+
+    for i, leaf in enumerate(leaves):
+        assert tree.leaf(i) == leaf
+        proof = tree.proof(i)
+        assert len(proof) <= tree.depth
+        assert verify(proof, root, leaf)
+        assert not verify(proof, root, keccak(leaf))
+
+    with pytest.raises(IndexError):
+        tree.proof(size)
+
+
+def test_empty_tree(tmp_path):
+    assert MerkleTreeWriter(str(tmp_path)).finish() is None
+    assert os.path.getsize(os.path.join(str(tmp_path), 'level-0')) == 0
@@ -0,0 +1,121 @@
+import json
+import fakeredis
+import pytest
+from secrets import token_hex
+
+from onclick_signer.layout import HashLayout
+from onclick_signer.migrate import migrate
+from onclick_signer.ratelimit import RATE_PREFIX
+from test_web import http_post
+
+
+def seed(r, count):
+    """ Flat counters of count tokens, each clicked as often as its index """
+    tokens = [token_hex(32) for _ in range(count)]
+    for i, token in enumerate(tokens):
+        r.set(token, i + 1)
+    return tokens
+
+
+def test_migrate():
+    r = fakeredis.FakeRedis()
+    layout = HashLayout('clicks:', 2)
+    tokens = seed(r, 25)
+    rate_key = RATE_PREFIX + tokens[0]
+    r.set(rate_key, 1234)
+
+    result = migrate(r, layout, batch=4)
+
+    assert result['found'] == 25
+    assert result['moved'] == 25
+    for i, token in enumerate(tokens):
+        assert r.get(token) is None
+        assert int(layout.get(r, token)) == i + 1
+
+    # Only token counters are moved
+    assert int(r.get(rate_key)) == 1234
+
+    # Nothing is left to move
+    again = migrate(r, layout, batch=4)
+    assert again['found'] == 0
+    assert again['moved'] == 0
+
+
+def test_migrate_adds_to_hash():
+    """ Clicks counted in the hash layout while flat counters remain are kept """
+    r = fakeredis.FakeRedis()
+    layout = HashLayout('clicks:', 2)
+    [token] = seed(r, 1)
+    layout.incrby(r, token, 2)
+
+    result = migrate(r, layout, batch=4)
+
+    assert result['moved'] == 1
+    assert int(layout.get(r, token)) == 3
+
+
+def test_migrate_dry_run():
+    r = fakeredis.FakeRedis()
+    layout = HashLayout('clicks:', 2)
+    tokens = seed(r, 10)
+
+    result = migrate(r, layout, batch=4, dry_run=True)
+
+    assert result['found'] == 10
+    assert result['moved'] == 0
+    for i, token in enumerate(tokens):
+        assert int(r.get(token)) == i + 1
+        assert layout.get(r, token) is None
+
+
+def test_read_migrating():
+    """ Flat counters not migrated yet are read, and moved, through the hash
+    layout
+    """
+    r = fakeredis.FakeRedis()
+    layout = HashLayout('clicks:', 2, migrating=True)
+    tokens = seed(r, 3)
+
+    assert int(layout.get(r, tokens[1])) == 2
+    assert r.get(tokens[1]) is None
+    assert int(r.hget(*layout.locate(tokens[1]))) == 2
+    assert layout.get(r, token_hex(32)) is None
+
+    # Clicked by a signer still using flat keys after it was moved
+    r.incrby(tokens[1], 1)
+    assert int(layout.get(r, tokens[1])) == 2
+
+    result = migrate(r, layout, batch=4)
+
+    assert result['moved'] == 3
+    for i, token in enumerate(tokens):
+        assert int(layout.get(r, token)) == i + 1 + (i == 1)
+
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(counter_layout='hash', counter_migrating=True)
+async def test_click_migrating(http_server, http_client, base_url):
+    """ Signers migrating to the hash layout count and claim flat counters """
+    store = http_server.request_callback.settings['store']
+    clicked, claimed = token_hex(32), token_hex(32)
+    await store.redis.set(clicked, 5)
+    await store.redis.set(claimed, 3)
+
+    response = await http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': clicked }
+    )
+
+    assert json.loads(response.body).get('clicks') == 6
+    assert await store.redis.get(clicked) is None
+    assert int(await store.redis.hget(*store.layout.locate(clicked))) == 6
+
+    response = await http_post(http_client, "{}/claim".format(base_url), {
+        'token': claimed,
+        'contract': '0xee67A313FA15595cd8D20C018a0d6C3765585589',
+        'recipient': '0x3e11d657331c286624826ac797a974777be0e47f',
+    })
+
+    assert json.loads(response.body).get('clicks') == 3
+    assert await store.redis.get(claimed) is None
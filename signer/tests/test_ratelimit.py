@@ -0,0 +1,46 @@
+import pytest
+
+from onclick_signer.ratelimit import MemoryRateLimiter
+
+TOKEN = 'ab' * 32
+
+@pytest.mark.gen_test
+async def test_memory_rate_limit(clock):
+    limiter = MemoryRateLimiter(50, 50, clock=clock)
+
+    assert await limiter.allow(TOKEN, '127.0.0.1')
+    assert not await limiter.allow(TOKEN, '127.0.0.1')
+    # Same IP, different token
+    assert not await limiter.allow('cd' * 32, '127.0.0.1')
+    # New tokens are marked but never limited
+    assert await limiter.allow('ef' * 32, '127.0.0.1', check=False)
+
+    clock.advance(0.049)
+    assert not await limiter.allow(TOKEN, '127.0.0.2')
+
+    clock.advance(0.001)
+
+    assert await limiter.allow(TOKEN, '127.0.0.1')
+    assert limiter.stats == { 'hits': 3, 'misses': 3 }
+
+@pytest.mark.gen_test
+async def test_memory_rate_limit_expires(clock):
+    limiter = MemoryRateLimiter(10, 10, clock=clock)
+
+    for i in range(100):
+        await limiter.allow('{:064x}'.format(i), '10.0.0.{}'.format(i))
+
+    clock.advance(0.02)
+    await limiter.allow(TOKEN, '127.0.0.1')
+
+    # Only the last click is still held
+    assert len(limiter) == 2
+
+@pytest.mark.gen_test
+async def test_memory_rate_limit_bounded():
+    limiter = MemoryRateLimiter(60000, 60000, max_entries=10)
+
+    for i in range(100):
+        await limiter.allow('{:064x}'.format(i), '10.0.0.{}'.format(i))
+
+    assert len(limiter) <= 22
@@ -1,39 +1,38 @@
-import os
 import re
+import asyncio
 import time
 import json
 import pytest
-import tempfile
-from pathlib import Path
+import tornado.gen
+from secrets import token_hex
+from eth_account import Account
 from tornado.httpclient import HTTPRequest
-
-TMPDIR = tempfile.TemporaryDirectory(prefix='onclick-money')
-TMPDIR_PATH = Path(TMPDIR.name)
-
-print('Test temp dir: {}'.format(TMPDIR_PATH))
-
-# Use a test encryption passphrase
-os.environ['ENCRYPTION_PASSPHRASE'] = 'asdf1234'
-os.environ['ETHEREUM_KEYSTORE'] = str(TMPDIR_PATH.joinpath('keystore'))
-
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+from tornado.websocket import websocket_connect
+
+from onclick_signer.claims import prefix_hash
+from onclick_signer.epochs import INCLUDED_KEY
+from onclick_signer.metrics import Histogram, make_metrics_app, render
+from onclick_signer.profiling import BlockingDetector
+from onclick_signer.ratelimit import RATE_PREFIX
+from onclick_signer.signer import SignerService
+from onclick_signer.store import count_spaced
 from onclick_signer.web import HEX_PATTERN, make_app
+from conftest import CONFIG, TEST_KEY
 
-def http_get(client, url):
-    req = HTTPRequest(url=url)
-    return client.fetch(req)
+def http_get(client, url, **kwargs):
+    req = HTTPRequest(url=url, headers=kwargs.pop('headers', None))
+    return client.fetch(req, **kwargs)
 
-def http_post(client, url, body):
+def http_post(client, url, body, **kwargs):
     req = HTTPRequest(
         url=url,
         method='POST',
         body=json.dumps(body),
         headers={ 'Content-Type': 'application/json' },
     )
-    return client.fetch(req)
-
-@pytest.fixture
-def app():
-    return make_app()
+    return client.fetch(req, **kwargs)
 
 @pytest.mark.gen_test
 def test_root(http_client, base_url):
@@ -53,7 +52,7 @@ def test_click(http_client, base_url):
     assert re.match(HEX_PATTERN, body['token']) is not None
 
 @pytest.mark.gen_test
-def test_multiple_clicks(http_client, base_url):
+def test_multiple_clicks(http_client, base_url, clock):
     response = yield http_post(
         http_client,
         "{}/click".format(base_url),
@@ -73,7 +72,7 @@ def test_multiple_clicks(http_client, base_url):
     token = body['token']
 
     # Do not want to trigger rate limiting
-    time.sleep(0.5)
+    clock.advance(0.5)
 
     response2 = yield http_post(
         http_client,
@@ -89,7 +88,7 @@ def test_multiple_clicks(http_client, base_url):
     assert body.get('clicks') == 2
 
     # Do not want to trigger rate limiting
-    time.sleep(0.5)
+    clock.advance(0.5)
 
     response3 = yield http_post(
         http_client,
@@ -105,7 +104,7 @@ def test_multiple_clicks(http_client, base_url):
     assert body.get('clicks') == 3
 
     # Do not want to trigger rate limiting
-    time.sleep(0.5)
+    clock.advance(0.5)
 
     # Get stats
     response_stats = yield http_get(http_client, "{}/clicks/{}".format(base_url, token))
@@ -118,10 +117,409 @@ def test_multiple_clicks(http_client, base_url):
     assert body.get('clicks') == 3
     assert body.get('token') is None
 
-# TODO: Test concurrency prevention
+@pytest.mark.gen_test
+def test_click_rate_limit(http_client, base_url, clock):
+    response = yield http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+
+    # Immediately click again, within MIN_CLICK_DURATION
+    response2 = yield http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': token },
+        raise_error=False
+    )
+
+    assert response2.code == 429
+
+    body = json.loads(response2.body)
+
+    assert not body.get('success')
+    assert body.get('clicks') == 1
+    assert body.get('token') == token
+
+    # A ms short of MIN_CLICK_DURATION since the first click
+    clock.advance(0.249)
+    response3 = yield http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': token },
+        raise_error=False
+    )
+
+    assert response3.code == 429
+
+    clock.advance(0.001)
+    response4 = yield http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': token }
+    )
+
+    assert json.loads(response4.body).get('clicks') == 2
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(rate_limiter='memory')
+def test_click_memory_rate_limit(http_server, http_client, base_url):
+    store = http_server.request_callback.settings['store']
+
+    response = yield http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+
+    response2 = yield http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': token },
+        raise_error=False
+    )
+
+    assert response2.code == 429
+    assert json.loads(response2.body).get('clicks') == 1
+    assert store.limiter.stats['hits'] == 1
+
+@pytest.mark.gen_test
+async def test_click_malformed(http_client, base_url):
+    for body, code in [
+        (b'{"token": ', 400),
+        (b'["token"]', 400),
+        (b'{"token": 1}', 400),
+        (b'{"token": "' + b'a' * 20000 + b'"}', 413),
+    ]:
+        response = await http_client.fetch(HTTPRequest(
+            url="{}/click".format(base_url),
+            method='POST',
+            body=body,
+        ), raise_error=False)
+
+        assert response.code == code
+        assert json.loads(response.body).get('success') is False
+
+@pytest.mark.gen_test
+def test_click_batch(http_client, base_url, clock):
+    response = yield http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+
+    # About four clicks worth of wall time
+    clock.advance(1.1)
+
+    now = int(time.time() * 1000)
+    response2 = yield http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': token, 'clicks': [now + i * 250 for i in range(10)] }
+    )
+
+    assert response2.code == 200
+
+    body = json.loads(response2.body)
+
+    assert body.get('success')
+    assert body.get('accepted') == 4
+    assert body.get('clicks') == 5
+
+    # Nothing left to credit
+    response3 = yield http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': token, 'clicks': [now + 3000] },
+        raise_error=False
+    )
+
+    assert response3.code == 429
+    assert json.loads(response3.body).get('clicks') == 5
+
+@pytest.mark.gen_test
+async def test_clicks_etag(http_server, http_client, base_url, clock):
+    counts = http_server.request_callback.settings['store'].counts
+
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+    url = "{}/clicks/{}".format(base_url, token)
+
+    response2 = await http_get(http_client, url)
+    etag = response2.headers['Etag']
+
+    assert json.loads(response2.body).get('clicks') == 1
+    assert response2.headers['Cache-Control'] == 'public, max-age=1'
+
+    # Unchanged, and read from the count cache
+    response3 = await http_get(
+        http_client,
+        url,
+        headers={ 'If-None-Match': etag },
+        raise_error=False
+    )
+
+    assert response3.code == 304
+    assert not response3.body
+    assert counts.stats['hits'] == 1
+
+    # A click drops the cached count and changes the tag
+    clock.advance(0.3)
+    await http_post(http_client, "{}/click".format(base_url), { 'token': token })
+
+    response4 = await http_get(
+        http_client,
+        url,
+        headers={ 'If-None-Match': etag },
+        raise_error=False
+    )
+
+    assert response4.code == 200
+    assert response4.headers['Etag'] != etag
+    assert json.loads(response4.body).get('clicks') == 2
+
+async def read_reply(conn):
+    """ The next reply to a click, skipping any pushed counts, which can
+    arrive before it
+    """
+    while True:
+        message = json.loads(await conn.read_message())
+        if 'success' in message:
+            return message
+
+@pytest.mark.gen_test
+async def test_click_socket(http_client, base_url, clock):
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+    url = "{}/ws/{}".format(base_url.replace('http', 'ws', 1), token)
+
+    watcher = await websocket_connect(url)
+    clicker = await websocket_connect(url)
+
+    # The current count on connect
+    assert json.loads(await watcher.read_message()) == {
+        'token': token,
+        'clicks': 1,
+    }
+    await clicker.read_message()
+
+    clock.advance(0.3)
+    clicker.write_message('{}')
+
+    reply = await read_reply(clicker)
+    assert reply.get('success')
+    assert reply.get('clicks') == 2
+    assert reply.get('accepted') == 1
+
+    # Pushed to every subscriber through Redis
+    assert json.loads(await watcher.read_message()) == {
+        'token': token,
+        'clicks': 2,
+    }
+
+    # Too soon
+    clicker.write_message('{}')
+    reply2 = await read_reply(clicker)
+    assert not reply2.get('success')
+    assert reply2.get('clicks') == 2
+
+    watcher.close()
+    clicker.close()
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(counter_layout='hash', counter_namespace='test:clicks:')
+async def test_click_hash_layout(http_server, http_client, base_url, clock):
+    store = http_server.request_callback.settings['store']
+
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+
+    clock.advance(0.3)
+    now = int(time.time() * 1000)
+    response2 = await http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': token, 'clicks': [now] }
+    )
+
+    assert json.loads(response2.body).get('clicks') == 2
+    assert await store.redis.get(token) is None
+    assert int(await store.redis.hget(
+        'test:clicks:{}'.format(token[:4]),
+        token[4:]
+    )) == 2
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(token_ttl=60)
+async def test_token_ttl(http_server, http_client, base_url):
+    store = http_server.request_callback.settings['store']
+
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+
+    assert 0 < await store.redis.pttl(token) <= 60000
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(claimed_token_ttl=1, compaction_rate=10000)
+async def test_compaction(http_server, http_client, base_url, clock):
+    settings = http_server.request_callback.settings
+    store = settings['store']
+    compactor = settings['compactor']
+
+    tokens = []
+    for i in range(2):
+        response = await http_post(http_client, "{}/click".format(base_url), {})
+        tokens.append(json.loads(response.body)['token'])
+        await http_post(http_client, "{}/claim".format(base_url), {
+            'token': tokens[-1],
+            'contract': '0xee67A313FA15595cd8D20C018a0d6C3765585589',
+            'recipient': '0x3e11d657331c286624826ac797a974777be0e47f',
+        })
+
+    # Clicked again after the claim, so it's kept
+    clock.advance(0.3)
+    await http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': tokens[1] }
+    )
+
+    # Past the claimed retention of both
+    clock.advance(1)
+    await compactor.run()
+
+    assert compactor.stats['removed'] == 1
+    assert await store.get_clicks(tokens[0]) == 0
+    assert await store.get_clicks(tokens[1]) == 2
+    assert not await store.redis.hexists(INCLUDED_KEY, tokens[0])
+    assert await store.redis.hexists(INCLUDED_KEY, tokens[1])
+
+@pytest.mark.gen_test
+async def test_metrics(http_server, http_client, base_url):
+    await http_post(http_client, "{}/click".format(base_url), {})
+
+    metrics = render(http_server.request_callback)
+
+    assert 'signer_request_seconds_count{handler="ClickHandler",code="200"}' in metrics
+    assert 'signer_redis_seconds_count{op="click"}' in metrics
+    assert 'signer_tokens_created_total' in metrics
+    assert 'signer_limiter_hits' in metrics
+    assert 'signer_locks_contended' in metrics
+
+@pytest.mark.gen_test(timeout=10)
+async def test_metrics_signer(http_server, http_client):
+    app = http_server.request_callback
+    sock, port = bind_unused_port()
+    server = HTTPServer(make_metrics_app(app))
+    server.add_sockets([sock])
+    url = 'http://127.0.0.1:{}/metrics'.format(port)
+
+    # A signer whose key hasn't been loaded yet has no load times
+    app.settings['signer'] = SignerService(private_key=TEST_KEY)
+
+    try:
+        resp = await http_get(http_client, url)
+        metrics = resp.body.decode('utf-8').splitlines()
+        assert 'signer_signer_loaded 0.0' in metrics
+        assert 'signer_signer_loads 0.0' in metrics
+        assert not any(
+            line.startswith('signer_signer_last_load') for line in metrics
+        )
+
+        await app.reload_signer()
+
+        resp = await http_get(http_client, url)
+        metrics = resp.body.decode('utf-8').splitlines()
+        assert 'signer_signer_loaded 1.0' in metrics
+        assert 'signer_signer_loads 1.0' in metrics
+        assert any(
+            line.startswith('signer_signer_last_load_seconds ')
+            for line in metrics
+        )
+    finally:
+        server.stop()
+
+@pytest.mark.gen_test(timeout=10)
+async def test_profile(http_server, http_client):
+    sock, port = bind_unused_port()
+    server = HTTPServer(make_metrics_app(http_server.request_callback))
+    server.add_sockets([sock])
+    url = 'http://127.0.0.1:{}/profile'.format(port)
+
+    try:
+        resp = await http_get(http_client, url + '?seconds=0.1')
+        stacks = resp.body.decode('utf-8').splitlines()
+        assert len(stacks) > 0
+        assert all(re.match(r'^.+;.+ \d+$', line) for line in stacks)
+
+        resp = await http_get(http_client, url + '?seconds=0.1&mode=cprofile')
+        assert b'cumulative' in resp.body
+
+        resp = await http_get(http_client, url + '?seconds=3600', raise_error=False)
+        assert resp.code == 400
+    finally:
+        server.stop()
+
+@pytest.mark.gen_test(timeout=10)
+async def test_blocking_detector():
+    detector = BlockingDetector(0.05)
+    detector.start()
+
+    try:
+        await tornado.gen.sleep(0.1)
+        assert detector.stats['blocked'] == 0
+
+        time.sleep(0.15)
+        await tornado.gen.sleep(0.1)
+        assert detector.stats['blocked'] == 1
+        assert detector.stats['max_blocked_seconds'] >= 0.1
+    finally:
+        detector.stop()
+
+def test_histogram():
+    histogram = Histogram('test_seconds', 'Test', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+
+    assert list(histogram.render()) == [
+        'test_seconds_bucket{le="0.1"} 2',
+        'test_seconds_bucket{le="1.0"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        'test_seconds_sum 2.65',
+        'test_seconds_count 4',
+    ]
+
+def test_count_spaced():
+    assert count_spaced([0, 250, 500], 250) == 3
+    assert count_spaced([0, 100, 200, 300, 400, 500], 250) == 2
+    assert count_spaced([500, 0], 250) == 0
+    assert count_spaced(['0'], 250) == 0
+    assert count_spaced([], 250) == 0
+
+@pytest.mark.gen_test
+@pytest.mark.parametrize('kind', [
+    pytest.param('memory', marks=pytest.mark.app_config(token_lock='memory')),
+    pytest.param('redis', marks=pytest.mark.app_config(token_lock='redis')),
+])
+async def test_click_locked(http_server, http_client, base_url, clock, kind):
+    """ A click isn't counted while another request holds the token """
+    settings = http_server.request_callback.settings
+    store = settings['store']
+    locks = settings['locks']
+    url = "{}/click".format(base_url)
+
+    response = await http_post(http_client, url, {})
+    token = json.loads(response.body)['token']
+
+    clock.advance(0.3)
+    async with locks.lock(token):
+        response = await http_post(http_client, url, { 'token': token })
+        assert json.loads(response.body) == {
+            'success': False,
+            'clicks': None,
+            'token': token,
+        }
+        assert await store.get_clicks(token) == 1
+
+    assert locks.stats['contended'] == 1
+
+    # Released, so the next click is counted
+    response = await http_post(http_client, url, { 'token': token })
+    assert json.loads(response.body).get('clicks') == 2
 
 @pytest.mark.gen_test(timeout=30)
-async def test_claim(http_client, base_url):
+async def test_claim(http_client, base_url, clock):
     token = None
     i = 0
 
@@ -146,7 +544,7 @@ async def test_claim(http_client, base_url):
         token = body['token']
 
         # Do not want to trigger rate limiting
-        time.sleep(0.75)
+        clock.advance(0.75)
 
         i += 1
 
@@ -170,4 +568,320 @@ async def test_claim(http_client, base_url):
     assert body.get('token') is not None
     assert body.get('claim') is not None
     assert body.get('signature') is not None
-    assert body.get('contract') is not None
\ No newline at end of file
+    assert body.get('contract') is not None
+    assert body.get('version') == 1
+
+
+@pytest.mark.gen_test
+async def test_claim_excluded_from_epochs(http_server, http_client, base_url):
+    """ Clicks claimed are recorded for epochs, even before they're enabled
+    """
+    store = http_server.request_callback.settings['store']
+
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+
+    response_claim = await http_post(http_client, "{}/claim".format(base_url), {
+        'token': '0x' + token.upper(),
+        'contract': '0xee67A313FA15595cd8D20C018a0d6C3765585589',
+        'recipient': '0x3e11d657331c286624826ac797a974777be0e47f',
+    })
+
+    body = json.loads(response_claim.body)
+    assert body.get('success')
+    assert body.get('token') == token
+    assert int(await store.redis.hget(INCLUDED_KEY, token)) == 1
+
+def test_signer_unlocked_once(app, signer):
+    """ The signing key should only be unlocked once per process """
+    loads = signer.stats['loads']
+
+    make_app(CONFIG, signer=signer)
+
+    assert signer.loaded
+    assert signer.stats['loads'] == loads
+    assert signer.metrics()['last_load_seconds'] is not None
+
+@pytest.mark.gen_test(timeout=30)
+@pytest.mark.parametrize('kind', ['thread', 'process'])
+async def test_signer_reload(clock, kind):
+    """ Claims are signed with the new key once it's reloaded """
+    signer = SignerService(private_key=TEST_KEY)
+    app = make_app(dict(CONFIG, signing_executor=kind), clock=clock, signer=signer)
+    executor = app.settings['executor']
+    claim = (
+        '0x3e11d657331c286624826ac797a974777be0e47f',
+        token_hex(32),
+        1,
+        '0xee67A313FA15595cd8D20C018a0d6C3765585589',
+    )
+
+    def signed_by(signed):
+        [(claim_hash, signature)] = signed
+        return Account.recoverHash(prefix_hash(claim_hash), signature=signature)
+
+    try:
+        old_address = signer.address
+        assert signed_by(await executor.sign([claim])) == old_address
+
+        signer.private_key = '0x' + '5d' * 32
+        await app.reload_signer()
+
+        assert signer.address != old_address
+        assert signed_by(await executor.sign([claim])) == signer.address
+        assert executor.stats['reloads'] == 1
+    finally:
+        executor.shutdown()
+
+@pytest.mark.gen_test
+async def test_claim_batch(http_client, base_url):
+    tokens = []
+
+    for i in range(3):
+        response = await http_post(http_client, "{}/click".format(base_url), {})
+        tokens.append(json.loads(response.body)['token'])
+
+    contract = '0xee67A313FA15595cd8D20C018a0d6C3765585589'
+    recipient = '0x3e11d657331c286624826ac797a974777be0e47f'
+    claims = [
+        { 'token': token, 'contract': contract, 'recipient': recipient }
+        for token in tokens
+    ]
+    # Unknown token
+    claims.append({
+        'token': 'ab' * 32,
+        'contract': contract,
+        'recipient': recipient,
+    })
+    # Bad input
+    claims.append({ 'token': tokens[0], 'contract': contract })
+
+    response = await http_post(
+        http_client,
+        "{}/claims".format(base_url),
+        { 'claims': claims }
+    )
+
+    assert response.code == 200
+
+    body = json.loads(response.body)
+
+    assert body.get('success')
+    assert len(body['claims']) == 5
+
+    for token, result in zip(tokens, body['claims'][:3]):
+        assert result.get('success')
+        assert result.get('clicks') == 1
+        assert result.get('token') == token
+        assert result.get('claim') is not None
+        assert result.get('signature') is not None
+
+    assert not body['claims'][3].get('success')
+    assert not body['claims'][4].get('success')
+    assert 'recipient' in body['claims'][4].get('message')
+
+@pytest.mark.gen_test
+async def test_claim_batch_invalid(http_client, base_url):
+    response = await http_post(
+        http_client,
+        "{}/claims".format(base_url),
+        { 'claims': [] },
+        raise_error=False
+    )
+
+    assert response.code == 400
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(signing_max_queue=0)
+async def test_claim_busy(http_server, http_client, base_url):
+    # A signing queue that is always full
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+
+    response_claim = await http_post(
+        http_client,
+        "{}/claim".format(base_url),
+        {
+            'token': token,
+            'contract': '0xee67A313FA15595cd8D20C018a0d6C3765585589',
+            'recipient': '0x3e11d657331c286624826ac797a974777be0e47f',
+        },
+        raise_error=False
+    )
+
+    assert response_claim.code == 503
+    assert response_claim.headers.get('Retry-After') == '1'
+    assert not json.loads(response_claim.body).get('success')
+
+@pytest.mark.gen_test
+async def test_claim_cached(http_server, http_client, base_url, clock):
+    claim_cache = http_server.request_callback.settings['claim_cache']
+
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+    request = {
+        'token': token,
+        'contract': '0xee67A313FA15595cd8D20C018a0d6C3765585589',
+        'recipient': '0x3e11d657331c286624826ac797a974777be0e47f',
+    }
+
+    first = json.loads((await http_post(
+        http_client,
+        "{}/claim".format(base_url),
+        request
+    )).body)
+    second = json.loads((await http_post(
+        http_client,
+        "{}/claim".format(base_url),
+        request
+    )).body)
+
+    assert first['signature'] == second['signature']
+    assert claim_cache.stats['local_hits'] == 1
+
+    # A new click invalidates the cached claim
+    clock.advance(0.3)
+    await http_post(http_client, "{}/click".format(base_url), { 'token': token })
+
+    third = json.loads((await http_post(
+        http_client,
+        "{}/claim".format(base_url),
+        request
+    )).body)
+
+    assert third['clicks'] == 2
+    assert third['claim'] != first['claim']
+    assert claim_cache.stats['misses'] == 2
+
+# Clicks are aggregated, and only flushed when asked
+AGGREGATED = {
+    'click_aggregation': True,
+    'click_flush_interval_ms': 3600 * 1000,
+    'click_flush_max_pending': 1000,
+}
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(**AGGREGATED)
+async def test_click_aggregated(http_server, http_client, base_url, clock):
+    store = http_server.request_callback.settings['store']
+
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+
+    clock.advance(0.3)
+    response2 = await http_post(
+        http_client,
+        "{}/click".format(base_url),
+        { 'token': token }
+    )
+
+    # Counted, but not written yet
+    assert json.loads(response2.body).get('clicks') == 2
+    assert int(await store.layout.get(store.redis, token)) == 1
+    assert store.aggregator.pending(token) == 1
+
+    # Pending clicks are written before signing
+    response_claim = await http_post(http_client, "{}/claim".format(base_url), {
+        'token': token,
+        'contract': '0xee67A313FA15595cd8D20C018a0d6C3765585589',
+        'recipient': '0x3e11d657331c286624826ac797a974777be0e47f',
+    })
+
+    assert json.loads(response_claim.body).get('clicks') == 2
+    assert int(await store.layout.get(store.redis, token)) == 2
+    assert store.aggregator.stats['writes'] == 1
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(**AGGREGATED)
+async def test_click_aggregated_flushing(http_server, http_client, base_url,
+                                         clock):
+    store = http_server.request_callback.settings['store']
+
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+
+    clock.advance(0.3)
+    await http_post(http_client, "{}/click".format(base_url), { 'token': token })
+
+    # Clicks being written still count until the write returns
+    flush = asyncio.ensure_future(store.aggregator.flush())
+    await asyncio.sleep(0)
+    assert not flush.done()
+    assert store.aggregator.pending(token) == 1
+    assert await store.get_clicks(token) == 2
+
+    await flush
+
+    # Syncing waits for the running flush
+    clock.advance(0.3)
+    await http_post(http_client, "{}/click".format(base_url), { 'token': token })
+    flush = asyncio.ensure_future(store.aggregator.flush())
+    await asyncio.sleep(0)
+    await store.sync([token])
+
+    assert flush.done()
+    assert store.aggregator.pending(token) == 0
+    assert int(await store.layout.get(store.redis, token)) == 3
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(**AGGREGATED)
+async def test_click_aggregated_local(http_server, http_client, base_url,
+                                      clock):
+    settings = http_server.request_callback.settings
+    store = settings['store']
+    locks = settings['locks']
+    url = "{}/click".format(base_url)
+
+    response = await http_post(http_client, url, {})
+    token = json.loads(response.body)['token']
+
+    clock.advance(0.3)
+    await http_post(http_client, url, { 'token': token })
+    acquired = locks.stats['acquired']
+    marked = int(await store.redis.get(RATE_PREFIX + token))
+
+    # With clicks pending, neither the lock nor the click script is needed
+    clock.advance(0.3)
+    response = await http_post(http_client, url, { 'token': token })
+    assert json.loads(response.body).get('clicks') == 3
+
+    response = await http_post(
+        http_client,
+        url,
+        { 'token': token },
+        raise_error=False
+    )
+    assert response.code == 429
+    assert json.loads(response.body).get('clicks') == 3
+    assert locks.stats['acquired'] == acquired
+
+    # The rate keys are marked by the flush
+    assert int(await store.redis.get(RATE_PREFIX + token)) == marked
+    await store.aggregator.flush()
+    assert int(await store.redis.get(RATE_PREFIX + token)) == clock.ms()
+    assert int(await store.layout.get(store.redis, token)) == 3
+
+@pytest.mark.gen_test
+@pytest.mark.app_config(**AGGREGATED)
+async def test_click_socket_aggregated(http_server, http_client, base_url,
+                                       clock):
+    store = http_server.request_callback.settings['store']
+
+    response = await http_post(http_client, "{}/click".format(base_url), {})
+    token = json.loads(response.body)['token']
+    url = "{}/ws/{}".format(base_url.replace('http', 'ws', 1), token)
+
+    watcher = await websocket_connect(url)
+    await watcher.read_message()
+
+    clock.advance(0.3)
+    await http_post(http_client, "{}/click".format(base_url), { 'token': token })
+
+    # Published as the click is written
+    await store.aggregator.flush()
+    assert json.loads(await watcher.read_message()) == {
+        'token': token,
+        'clicks': 2,
+    }
+
+    watcher.close()